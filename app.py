@@ -1,12 +1,18 @@
 import streamlit as st
 import src.figma_client as figma
 import src.parser as parser
-import re
-import zipfile
-import io
-import json
-import requests
-import concurrent.futures
+from src.rate_limit import get_rate_limiter
+from src.cache import get_default_cache, get_default_blob_store
+from src.export import ZipExportWriter, export_file, format_stats
+from src.async_client import AsyncFigmaClient, download_many_sync, aiohttp
+from src.lazy import LazyDocument
+from src.palette import DEFAULT_DELTA_E, build_palette
+from src.images import ImageProcessor
+from src.metrics import get_metrics
+from src.search import SearchIndex
+from src.documents import get_document_store
+from src.prefetch import Prefetcher
+import collections
 import time
 
 st.set_page_config(page_title="Figma to Code", layout="wide")
@@ -22,47 +28,190 @@ with st.sidebar:
     file_url = st.text_input("Figma File URL", value=default_url)
     
     st.info("Upload your local .fig file to Figma Drafts to get a URL.")
+
+    lazy_load = st.checkbox("Lazy load (outline first)", value=False,
+                            help="Fetch only pages and screens up front; load a screen's full tree when it is selected or inspected.")
+    streaming_load = st.checkbox("Low-memory streaming load", value=False,
+                                 help="Parse the file as it downloads and keep only the properties this tool uses. "
+                                      "Skips the raw JSON, but the pruned tree still grows with the file.")
+    compact_tree = st.checkbox("Compact in-memory tree", value=False,
+                               help="Keep the document as compact node objects instead of raw JSON dicts.")
+    prefetch = st.checkbox("Prefetch screens and images", value=True,
+                           help="After loading, render screens (at 1x) and download image fills in the background "
+                                "so exports mostly package local files. Uses spare API budget only.")
     
     load_btn = st.button("Load File")
 
-def parse_file_key(url):
-    # Support both old /file/ and new /design/ URLs
-    # Also sometimes it is /proto/ for prototypes
-    match = re.search(r"(?:file|design|proto)/([a-zA-Z0-9]+)/", url)
-    if match:
-        return match.group(1)
-    return None
+    if token:
+        # Shared with other exporters using this token on the same host
+        budget = get_rate_limiter(token).status()
+        st.caption(f"API budget: {budget['budget']:.0f}/{budget['capacity']} · "
+                   f"queued calls: {budget['queue_depth']} · waited: {budget['total_wait']:.1f}s")
+    shared = get_document_store().stats()
+    st.caption(f"Shared documents in memory: {shared['documents']} · open sessions: {shared['leases']}")
 
-    return None
+parse_file_key = figma.parse_file_key
 
-@st.cache_data(ttl=600)
-def get_file_data(token, file_key):
-    client = figma.FigmaClient(token)
-    return client.get_file(file_key)
+@st.cache_resource(max_entries=32)
+def get_client(token):
+    # One client per token: its version probes are reused across reruns
+    # and its disk cache survives restarts
+    return figma.FigmaClient(token, cache=get_default_cache())
 
-@st.cache_data(ttl=600)
-def get_image_data(token, file_key):
-    client = figma.FigmaClient(token)
-    return client.get_image_fills(file_key)
+@st.cache_resource(max_entries=32)
+def get_async_client(token):
+    # Downloads run on the bridge's event loop instead of a thread per socket
+    return AsyncFigmaClient(token, cache=get_default_cache())
+
+def get_shared_document(token, file_key, streaming=False, compact=False):
+    """
+    Lease on (data, streamed analysis or None) from the process-wide store,
+    so every session opening this file version shares one tree. The version
+    probe inside acquire() still checks that this token can read the file.
+    """
+    client = get_client(token)
+
+    def load():
+        analysis = None
+        if streaming:
+            # Nodes are analysed while the response streams in
+            data, analysis = client.get_file_streaming(file_key)
+        else:
+            # Served from the on-disk cache unless the file's version changed
+            data = client.get_file(file_key)
+        if compact and data and 'document' in data:
+            data = dict(data, document=parser.compact_document(data['document']))
+            # The analysis and its index must point at the compact nodes
+            analysis = None
+        return data, analysis
+
+    kind = ("streamed" if streaming else "full") + ("+compact" if compact else "")
+    return get_document_store().acquire(client, file_key, kind=kind, load=load)
+
+def document_derived(name, build):
+    """
+    build() once per loaded document, e.g. its analysis or search index.
+    Shared documents keep the result on their store entry, so it is shared
+    by every session and dropped when the store evicts the document. A lazy
+    document belongs to this session and grows as subtrees load, so its
+    results are kept here until the loaded set changes.
+    """
+    lease = st.session_state.get('document_lease')
+    if lease is not None and not lease.released:
+        return lease.derived(name, build)
+    lazy = st.session_state.get('lazy')
+    loaded_key = lazy.loaded_key() if lazy else None
+    memo = st.session_state.setdefault('lazy_derived', {}) # name -> (loaded_key, value)
+    if name not in memo or memo[name][0] != loaded_key:
+        memo[name] = (loaded_key, build())
+    return memo[name][1]
+
+def get_analysis(document):
+    # One traversal per document, shared by every tab, rerun and export
+    def build():
+        with get_metrics().span('analysis'):
+            return parser.DocumentAnalysis(document)
+    return document_derived('analysis', build)
+
+def get_search_index(document):
+    # Built once per document like get_analysis, so searches are lookups
+    def build():
+        with get_metrics().span('search_index'):
+            return SearchIndex(document)
+    return document_derived('search_index', build)
+
+def show_metrics(run, title, key):
+    """
+    Collapsible timing breakdown for one load or export, with JSON and
+    Prometheus text downloads for dashboards.
+    """
+    snapshot = run.snapshot()
+    with st.expander(title):
+        def _labels(entry):
+            return ", ".join(f"{k}={v}" for k, v in entry['labels'].items())
+        spans = sorted(snapshot['spans'], key=lambda s: -s['seconds'])
+        if spans:
+            st.dataframe([{"Span": s['name'], "Labels": _labels(s), "Count": s['count'],
+                           "Total (s)": round(s['seconds'], 3), "Max (s)": round(s['max'], 3)} for s in spans],
+                         use_container_width=True)
+        if snapshot['counters']:
+            st.dataframe([{"Counter": c['name'], "Labels": _labels(c), "Value": round(c['value'], 3)}
+                          for c in snapshot['counters']], use_container_width=True)
+        col_json, col_prom = st.columns(2)
+        col_json.download_button("Metrics JSON", run.to_json(), file_name="metrics.json",
+                                 mime="application/json", key=f"{key}_json")
+        col_prom.download_button("Prometheus text", run.to_prometheus(), file_name="metrics.prom",
+                                 mime="text/plain", key=f"{key}_prom")
+
+def show_prefetch(prefetcher):
+    """
+    Progress of the background prefetch. Polls itself while it runs, then
+    reruns the app once so the polling stops.
+    """
+    polling = not prefetcher.done
+
+    @st.fragment(run_every=1 if polling else None)
+    def _progress():
+        status = prefetcher.status()
+        renders, assets = status['progress']['renders'], status['progress']['assets']
+        summary = (f"screens {renders[0]}/{renders[1]} · images {assets[0]}/{assets[1]} · "
+                   f"{status['seconds']:.1f}s")
+        if not status['done']:
+            total = renders[1] + assets[1]
+            st.progress((renders[0] + assets[0]) / total if total else 0.0,
+                        text=f"Prefetching ({status['stage']}): {summary}")
+            return
+        if polling:
+            st.rerun()
+        state = "stopped" if status['cancelled'] else "done"
+        st.caption(f"Prefetch {state}: {summary}"
+                   + (f" · {len(status['errors'])} failed" if status['errors'] else ""))
+
+    _progress()
 
 @st.cache_data(ttl=600)
-def get_rendered_images(token, file_key, ids):
-    client = figma.FigmaClient(token)
-    return client.get_images(file_key, ids)
+def get_image_data(token, file_key):
+    return get_client(token).get_image_fills(file_key)
 
 if load_btn and token and file_url:
     file_key = parse_file_key(file_url)
     if not file_key:
         st.error(f"Could not parse File ID from URL: {file_url}")
     else:
-        with st.spinner(f"Fetching file data for ID: {file_key}..."):
+        with st.spinner(f"Fetching file data for ID: {file_key}..."), get_metrics().collect() as load_metrics:
             # client = figma.FigmaClient(token) # No longer needed directly here
             try:
-                # Use cached function
-                data = get_file_data(token, file_key)
-                
+                st.session_state.pop('lazy', None)
+                st.session_state.pop('lazy_derived', None)
+                previous_prefetch = st.session_state.pop('prefetcher', None)
+                if previous_prefetch is not None:
+                    previous_prefetch.cancel()
+                previous = st.session_state.pop('document_lease', None)
+                if previous is not None:
+                    # Let the store evict the old file once no session holds it
+                    previous.release()
+                if lazy_load:
+                    # Pages and top-level frames only; subtrees come later
+                    lazy = LazyDocument(get_client(token), file_key)
+                    st.session_state['lazy'] = lazy
+                    data = lazy.data
+                    st.session_state.pop('analysis', None)
+                else:
+                    # Shared read-only with other sessions on the same file version
+                    lease = get_shared_document(token, file_key, streaming_load, compact_tree)
+                    st.session_state['document_lease'] = lease
+                    data, shared_analysis = lease.data
+                    if shared_analysis is not None:
+                        st.session_state['analysis'] = shared_analysis
+                    else:
+                        st.session_state.pop('analysis', None)
+
                 if data and 'document' in data:
                     st.session_state['file_data'] = data
+                    loaded_analysis = st.session_state.get('analysis')
+                    if not loaded_analysis:
+                        # Analyse now so the load breakdown includes it
+                        loaded_analysis = get_analysis(data['document'])
                     # Also fetch image fills (URLs)
                     try:
                          # We can suppress image errors if file loaded ok
@@ -72,6 +221,16 @@ if load_btn and token and file_url:
                         st.warning(f"Could not fetch images (might be empty): {e}")
                         
                     st.success("File loaded successfully!")
+                    st.session_state['load_metrics'] = load_metrics
+
+                    # Lazy outline frames are rewritten in place as subtrees load,
+                    # which a background thread shouldn't be reading
+                    if prefetch and not lazy_load:
+                        fills = st.session_state.get('image_meta') or {}
+                        st.session_state['prefetcher'] = Prefetcher(
+                            get_client(token), file_key, loaded_analysis, get_default_blob_store(),
+                            image_urls=fills.get('meta', {}).get('images'), version=data.get('version'),
+                        ).start()
                 else:
                      st.error("API returned data but no document found. Check permissions.")
             except Exception as e:
@@ -86,6 +245,21 @@ if 'file_data' in st.session_state:
     data = st.session_state['file_data']
     document = data['document']
     file_key = parse_file_key(file_url) # Re-parse to ensure it is available for export
+    lazy = st.session_state.get('lazy')
+
+    def current_analysis():
+        if st.session_state.get('analysis'):
+            return st.session_state['analysis']
+        return get_analysis(document)
+
+    analysis = current_analysis()
+    if st.session_state.get('load_metrics'):
+        show_metrics(st.session_state['load_metrics'], "Load timing breakdown", "load_metrics")
+    if st.session_state.get('prefetcher'):
+        show_prefetch(st.session_state['prefetcher'])
+    if lazy:
+        st.info(f"Lazy mode: {len(lazy.loaded)} of {len(analysis.frames)} screens loaded. "
+                "Colors, typography and assets cover loaded screens only.")
     
     # Safely get image metadata, defaulting to empty dict if None
     raw_image_meta = st.session_state.get('image_meta')
@@ -95,19 +269,25 @@ if 'file_data' in st.session_state:
     
     with tab1:
         st.header("Color Palette")
-        colors = parser.extract_colors(document)
-        if colors:
+        delta_e = st.slider("Merge similar colors (ΔE)", 0.0, 10.0, DEFAULT_DELTA_E, 0.5,
+                            help="Colors closer than this in Lab space are merged into the most used one. 0 keeps every distinct color.")
+        palette = build_palette(analysis.color_usage, delta_e=delta_e)
+        if palette:
+            st.caption(f"{len(palette)} colors from {len(analysis.color_usage)} distinct values, most used first.")
             cols = st.columns(5)
-            for i, (hex_code, color) in enumerate(colors.items()):
+            for i, entry in enumerate(palette):
+                hex_code = entry['hex']
                 with cols[i % 5]:
-                    st.color_picker(hex_code, hex_code, disabled=True)
-                    st.code(hex_code)
+                    st.color_picker(f"{hex_code} ({entry['count']} uses)", hex_code, disabled=True, key=f"color_{i}")
+                    st.code(hex_code if entry['a'] >= 1 else f"{hex_code} / {entry['a']:.0%}")
+                    if len(entry['members']) > 1:
+                        st.caption("Merged: " + ", ".join(m for m in entry['members'] if m != hex_code))
         else:
             st.info("No colors found.")
 
     with tab2:
         st.header("Typography")
-        text_styles = parser.extract_typography(document)
+        text_styles = analysis.text_styles
         if text_styles:
             # Prepare data for dataframe
             df_data = []
@@ -124,34 +304,80 @@ if 'file_data' in st.session_state:
 
     with tab3:
         st.header("Node Inspector")
-        st.write("Enter a Node ID to inspect its properties and generated CSS.")
-        
-        # Helper to recursively list all nodes? Too many.
-        # Just input for now.
-        node_id_input = st.text_input("Node ID (e.g. 1:123)")
-        
-        if node_id_input:
-           found_node = parser.find_node_by_id(document, node_id_input)
-           if found_node:
-               st.success(f"Found Node: {found_node['name']} ({found_node['type']})")
-               
-               col_a, col_b = st.columns(2)
-               with col_a:
-                   st.subheader("Raw Properties")
-                   st.json(found_node, expanded=False)
-               
-               with col_b:
-                   st.subheader("Generated CSS")
-                   css = parser.generate_css(found_node)
-                   st.code(css, language='css')
-           else:
-               st.error("Node not found in this document.")
-        else:
-            st.info("Tip: You can find Node IDs in the 'Raw Properties' of parent nodes or by guessing if you know the structure.")
-    
+        search_index = get_search_index(document)
+        PAGE_SIZE = 50
+
+        def inspect(node_id, browse_to=None):
+            # Button callbacks run before the rerun, so the ID box can still be set
+            st.session_state['node_id_input'] = node_id
+            if browse_to:
+                st.session_state['browse_id'] = browse_to
+
+        def node_label(node):
+            return f"{node.get('name') or '(unnamed)'} · {node['type']} · {node['id']}"
+
+        col_find, col_details = st.columns(2)
+        with col_find:
+            query = st.text_input("Search nodes", placeholder="e.g. TEXT Inter 600, name:button, fill:#ff5500",
+                                  help="Words match names, text, types, fonts, weights and sizes. "
+                                       "Filters: name: text: type: font: weight: size: fill:")
+            if query:
+                start = time.perf_counter()
+                total, hits = search_index.search(query, limit=PAGE_SIZE)
+                elapsed = (time.perf_counter() - start) * 1000
+                shown = f", showing the first {len(hits)}" if total > len(hits) else ""
+                st.caption(f"{total:,} of {len(search_index):,} nodes match ({elapsed:.1f} ms){shown}")
+                for node_id in hits:
+                    node = analysis.index.get(node_id)
+                    if node is not None:
+                        st.button(node_label(node), key=f"hit_{node_id}", on_click=inspect,
+                                  args=(node_id, analysis.index.parent_of.get(node_id)))
+
+            st.subheader("Browse")
+            # Only the open node's children are rendered, a page at a time
+            browse_id = st.session_state.get('browse_id')
+            if browse_id not in analysis.index:
+                browse_id = document['id']
+            path = analysis.index.path(browse_id)
+            crumbs = st.columns(min(len(path), 5))
+            for col, node in zip(crumbs, path[-5:]):
+                col.button(node.get('name') or node['id'], key=f"crumb_{node['id']}",
+                           on_click=inspect, args=(node['id'], node['id']))
+            children = analysis.index.get(browse_id).get('children') or []
+            pages = max(1, -(-len(children) // PAGE_SIZE))
+            page = st.number_input(f"Page (of {pages})", 1, pages, key=f"page_{browse_id}") if pages > 1 else 1
+            for child in children[(page - 1) * PAGE_SIZE:page * PAGE_SIZE]:
+                has_children = 'children' in child
+                st.button(("▸ " if has_children else "") + node_label(child), key=f"child_{child['id']}",
+                          on_click=inspect, args=(child['id'], child['id'] if has_children else None))
+            if not children:
+                st.caption("No children loaded for this node.")
+
+        with col_details:
+            node_id_input = st.text_input("Node ID (e.g. 1:123)", key='node_id_input')
+
+            if node_id_input:
+                found_node = analysis.index.get(node_id_input)
+                if found_node is None and lazy:
+                    with st.spinner("Fetching node..."):
+                        found_node = lazy.get_node(node_id_input)
+                if found_node:
+                    st.success(f"Found Node: {found_node['name']} ({found_node['type']})")
+                    st.caption(" / ".join(n['name'] for n in analysis.index.path(node_id_input)))
+
+                    st.subheader("Generated CSS")
+                    st.code(parser.generate_css(found_node), language='css')
+                    st.subheader("Properties")
+                    # Own properties only; children are browsed on the left
+                    st.json(parser.node_properties(found_node), expanded=False)
+                else:
+                    st.error("Node not found in this document.")
+            else:
+                st.info("Search, browse the tree or enter a Node ID to see its properties and generated CSS.")
+
     with tab4:
         st.header("Assets (Images)")
-        images = parser.extract_images(document)
+        images = analysis.images
         if images and image_meta:
             st.write(f"Found {len(images)} images.")
             
@@ -167,151 +393,113 @@ if 'file_data' in st.session_state:
             
     with tab5:
         st.header("Bulk Export")
-        frames = parser.get_top_level_frames(document)
+        frames = analysis.frames
         
         if frames:
+            frame_ids = [f['id'] for f in frames]
             frame_names = [f['name'] for f in frames]
+            duplicate_names = {n for n, count in collections.Counter(frame_names).items() if count > 1}
+
+            def frame_label(frame_id):
+                name = analysis.index.get(frame_id)['name']
+                # Frames can share a name, so disambiguate with the ID
+                return f"{name} ({frame_id})" if name in duplicate_names else name
+
             
             # Multiselect for screens
-            selected_frames_names = st.multiselect("Select Screens to Export", frame_names)
+            selected_frame_ids = st.multiselect("Select Screens to Export", frame_ids, format_func=frame_label)
+            if lazy and selected_frame_ids:
+                with st.spinner("Loading selected screens..."):
+                    load_failed = lazy.load(selected_frame_ids)
+                for frame_id, reason in load_failed.items():
+                    st.warning(f"Could not load {frame_id}: {reason}")
+                analysis = current_analysis()
             
             include_images = st.checkbox("Include Rendered Screen Images (PNG)", value=True)
+            shared_css = st.checkbox("Shared CSS classes", value=False,
+                                     help="Write each distinct style once and list the layers that use it, instead of one rule per layer. Smaller CSS, slower export.")
+            render_scale = st.select_slider("Render Scale", options=[1, 2, 3, 4], value=1, disabled=not include_images)
+            image_format = st.selectbox("Image Format", ["original", "webp", "avif"],
+                                        help="Re-encode screens and assets. 'original' keeps what Figma serves.")
+            image_variants = st.checkbox("Add @1x/@2x asset variants", value=False)
+            optimize_images = st.checkbox("Strip image metadata (lossless)", value=False)
+            previous_export = st.session_state.get('last_export', {}).get(file_key)
+            reuse_previous = st.checkbox("Reuse unchanged screens from the last export", value=True,
+                                         disabled=previous_export is None,
+                                         help="Frames whose content hash is unchanged are copied from the previous ZIP.")
+            async_downloads = st.checkbox("Async downloads", value=aiohttp is not None, disabled=aiohttp is None,
+                                          help="Download screens and assets on one asyncio event loop (needs aiohttp).")
             
             if st.button("Download ZIP Package"):
-                if not selected_frames_names:
+                if not selected_frame_ids:
                     st.warning("Please select at least one screen.")
                 else:
                     start_time = time.time()
                     status_text = st.empty()
                     status_text.text("Starting ZIP generation...")
                     
-                    # In-memory ZIP
-                    zip_buffer = io.BytesIO()
-                    
-                    with zipfile.ZipFile(zip_buffer, "w") as zf:
-                        # 1. Export Colors (JSON)
-                        colors = parser.extract_colors(document)
-                        # Convert to list of dicts for JSON
-                        colors_data = [{"hex": k, "r": v['r'], "g": v['g'], "b": v['b']} for k, v in colors.items()]
-                        zf.writestr("colors.json", json.dumps(colors_data, indent=2))
-                        
-                        # 2. Export Typography (JSON)
-                        text_styles = parser.extract_typography(document)
-                        # Convert values to list
-                        typo_data = list(text_styles)
-                        zf.writestr("typography.json", json.dumps(typo_data, indent=2))
-                        
-                        # 3. Export Global CSS variables (Optional idea, maybe later)
-                        
-                        # 4. Export Selected Screens CSS
-                        status_text.text(f"Generating CSS for {len(selected_frames_names)} screens...")
-                        for name in selected_frames_names:
-                            frame = next(f for f in frames if f['name'] == name)
-                            css_content = parser.extract_css_recursive(frame)
-                            # Sanitize filename
-                            safe_name = re.sub(r'[^a-zA-Z0-9_-]', '', name)
-                            zf.writestr(f"screens/css/{safe_name}.css", css_content)
-                        
-                        # 4.5 Export Rendered Screen Images
-                        if include_images:
-                            status_text.text(f"Fetching rendered images for {len(selected_frames_names)} screens...")
-                            selected_ids = [next(f['id'] for f in frames if f['name'] == name) for name in selected_frames_names]
-                            
-                            rendered_data = get_rendered_images(token, file_key, selected_ids)
-                            
-                            if rendered_data and 'images' in rendered_data:
-                                status_text.text(f"Downloading {len(selected_frames_names)} screen images...")
-                                
-                                def download_screen_img(name_id):
-                                    name, node_id = name_id
-                                    img_url = rendered_data['images'].get(node_id)
-                                    if img_url:
-                                        try:
-                                            resp = requests.get(img_url, timeout=15)
-                                            if resp.status_code == 200:
-                                                # Sanitize name and ID for filename
-                                                safe_name = re.sub(r'[^a-zA-Z0-9_-]', '', name)
-                                                safe_id = node_id.replace(':', '-')
-                                                return f"screens/images/{safe_name}_{safe_id}.png", resp.content
-                                            else:
-                                                print(f"Failed to download {name}: Status {resp.status_code}")
-                                        except Exception as e:
-                                            print(f"Error downloading screen {name}: {e}")
-                                    return None
-
-                                # Download in parallel
-                                name_id_pairs = [(name, next(f['id'] for f in frames if f['name'] == name)) for name in selected_frames_names]
-                                total_screens = len(name_id_pairs)
-                                progress_bar = st.progress(0)
-                                
-                                with concurrent.futures.ThreadPoolExecutor(max_workers=10) as executor:
-                                    future_to_screen = {executor.submit(download_screen_img, pair): pair for pair in name_id_pairs}
-                                    completed = 0
-                                    for future in concurrent.futures.as_completed(future_to_screen):
-                                        result = future.result()
-                                        if result:
-                                            filename, content = result
-                                            zf.writestr(filename, content)
-                                        completed += 1
-                                        progress_bar.progress(completed / total_screens, text=f"Downloaded {completed}/{total_screens} screen images")
-                                progress_bar.empty()
-                        
-                        # 5. Export Images (PNGs)
-                        # Only download images used in the selected screens
-                        relevant_images = []
-                        seen_ids = set()
-                        
-                        for name in selected_frames_names:
-                            frame = next(f for f in frames if f['name'] == name)
-                            frame_imgs = parser.extract_images(frame)
-                            for img in frame_imgs:
-                                if img['id'] not in seen_ids:
-                                    relevant_images.append(img)
-                                    seen_ids.add(img['id'])
-
-                        if relevant_images and image_meta:
-                            status_text.text(f"Downloading {len(relevant_images)} unique images (Parallel)...")
-                            
-                            def download_image(img):
-                                ref = img.get('image_ref')
-                                if ref and ('images' in image_meta) and (ref in image_meta['images']):
-                                    img_url = image_meta['images'][ref]
-                                    try:
-                                        resp = requests.get(img_url, timeout=10)
-                                        if resp.status_code == 200:
-                                            img_name = re.sub(r'[^a-zA-Z0-9_-]', '', img['name'])
-                                            safe_id = img['id'].replace(':', '-')
-                                            return f"images/{img_name}_{safe_id}.png", resp.content
-                                        else:
-                                            print(f"Failed to download asset {img['name']}: Status {resp.status_code}")
-                                    except Exception as e:
-                                        print(f"Error downloading asset {img['name']}: {e}")
-                                return None
-                                
-
-                            # Download in parallel with more workers
-                            total_assets = len(relevant_images)
-                            asset_progress = st.progress(0)
-                            
-                            with concurrent.futures.ThreadPoolExecutor(max_workers=32) as executor:
-                                future_to_img = {executor.submit(download_image, img): img for img in relevant_images}
-                                completed_assets = 0
-                                for future in concurrent.futures.as_completed(future_to_img):
-                                    result = future.result()
-                                    if result:
-                                        filename, content = result
-                                        zf.writestr(filename, content)
-                                    completed_assets += 1
-                                    asset_progress.progress(completed_assets / total_assets, text=f"Downloaded {completed_assets}/{total_assets} image assets")
-                            asset_progress.empty()
+                    progress_bar = st.progress(0)
+                    stage_labels = {'css': "Generated CSS for", 'screens': "Downloaded", 'assets': "Downloaded"}
+                    stage_units = {'css': "screens", 'screens': "screen images", 'assets': "image assets"}
+
+                    def on_progress(stage, completed, total):
+                        progress_bar.progress(completed / total, text=f"{stage_labels[stage]} {completed}/{total} {stage_units[stage]}")
+
+                    prefetcher = st.session_state.get('prefetcher')
+                    if prefetcher is not None and not prefetcher.done:
+                        # What's prefetched so far is used; the export fetches the rest itself
+                        prefetcher.cancel()
+
+                    image_processor = None
+                    if image_format != "original" or image_variants or optimize_images:
+                        image_processor = ImageProcessor(
+                            get_default_blob_store(),
+                            target_format=None if image_format == "original" else image_format,
+                            variants=image_variants, strip=optimize_images,
+                        )
+
+                    # Entries go straight into a ZIP on disk as they finish
+                    with get_metrics().collect() as export_metrics, ZipExportWriter() as zf:
+                        export_stats = export_file(
+                            get_client(token), file_key, analysis, zf,
+                            frame_ids=selected_frame_ids,
+                            image_urls=image_meta.get('images') if image_meta else None,
+                            include_images=include_images,
+                            scale=render_scale,
+                            blob_store=get_default_blob_store(),
+                            on_status=status_text.text,
+                            on_progress=on_progress,
+                            download_many=(lambda urls: download_many_sync(get_async_client(token), urls))
+                                          if async_downloads else None,
+                            previous_export=previous_export if reuse_previous else None,
+                            shared_css=shared_css,
+                            image_processor=image_processor,
+                            version=data.get('version'),
+                        )
+                    st.session_state.setdefault('last_export', {})[file_key] = zf.path
+                    progress_bar.empty()
+
+                    failed = export_stats['failed_screens']
+                    if failed:
+                        st.warning(f"Could not render {len(failed)} screen(s): "
+                                   + ", ".join(frame_label(i) for i in failed))
                     
                     end_time = time.time()
                     duration = end_time - start_time
                     status_text.empty()
                     st.success(f"ZIP Ready! Completed in {duration:.2f} seconds.")
+                    st.caption(format_stats(export_stats))
+                    show_metrics(export_metrics, "Export timing breakdown", "export_metrics")
+                    zip_path = zf.path
+
+                    def read_zip():
+                        # Only read from disk when the user actually clicks
+                        with open(zip_path, "rb") as f:
+                            return f.read()
+
                     st.download_button(
-                        label="Download .zip",
-                        data=zip_buffer.getvalue(),
+                        label=f"Download .zip ({zf.size() / 1024 / 1024:.1f} MB)",
+                        data=read_zip,
                         file_name="figma_export.zip",
                         mime="application/zip"
                     )
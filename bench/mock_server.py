@@ -0,0 +1,236 @@
+"""
+Local stand-in for the Figma REST API and image CDN.
+
+Serves one synthetic (or given) document for any file key:
+
+    GET /v1/files/:key[?depth=N]
+    GET /v1/files/:key/nodes?ids=...
+    GET /v1/files/:key/images          image fill URLs
+    GET /v1/images/:key?ids=...        render URLs
+    GET /cdn/...                       PNG bytes for both
+
+with optional per-request latency and injected 429s, so the client's
+retry, rate-limit and export paths can be exercised without Figma.
+"""
+import json
+import random
+import struct
+import threading
+import time
+import zlib
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs, urlparse
+
+from src.parser import NodeIndex
+
+
+def make_png(width, height, seed=0):
+    """
+    A valid RGB PNG of random pixels (so it doesn't compress away).
+    """
+    rng = random.Random(seed)
+    rows = b"".join(b"\x00" + rng.randbytes(width * 3) for _ in range(height))
+
+    def chunk(kind, data):
+        body = kind + data
+        return struct.pack(">I", len(data)) + body + struct.pack(">I", zlib.crc32(body) & 0xffffffff)
+
+    return (b"\x89PNG\r\n\x1a\n"
+            + chunk(b"IHDR", struct.pack(">IIBBBBB", width, height, 8, 2, 0, 0, 0))
+            + chunk(b"IDAT", zlib.compress(rows, 1))
+            + chunk(b"IEND", b""))
+
+
+def truncate_depth(node, depth):
+    """
+    Copy of a tree cut off below `depth`, like ?depth= on /files.
+    """
+    root = dict(node)
+    stack = [(root, 0)]
+    while stack:
+        current, level = stack.pop()
+        if 'children' not in current:
+            continue
+        if level >= depth:
+            del current['children']
+            continue
+        current['children'] = [dict(child) for child in current['children']]
+        stack.extend((child, level + 1) for child in current['children'])
+    return root
+
+
+class MockFigmaServer:
+    """
+    Threaded HTTP server on 127.0.0.1. Use as a context manager or call
+    start()/stop(); point clients at `base_url`.
+
+    data: a /files response dict (see bench.synthetic.build_document)
+    latency: seconds added to every API response
+    download_latency: seconds added to every CDN download
+    throttle_every: answer every Nth API request with 429 (0: never)
+    retry_after: Retry-After seconds sent with injected 429s
+    asset_size: width/height in pixels of the served PNGs
+    """
+
+    def __init__(self, data, latency=0.0, download_latency=0.0, throttle_every=0,
+                 retry_after=0, asset_size=64, port=0):
+        self.data = data
+        self.latency = latency
+        self.download_latency = download_latency
+        self.throttle_every = throttle_every
+        self.retry_after = retry_after
+        self.index = NodeIndex.build(data['document'])
+        self.asset_size = asset_size
+        self._pngs = {} # path -> bytes; distinct per URL so content dedup sees real assets
+        self.requests = 0
+        self.throttled = 0
+        self.bytes_sent = 0
+        self._lock = threading.Lock()
+        self._responses = {} # cached encoded bodies, e.g. full file / depth=N
+        self._server = ThreadingHTTPServer(("127.0.0.1", port), self._handler())
+        self._server.daemon_threads = True
+        self._thread = None
+
+    @property
+    def base_url(self):
+        return f"http://127.0.0.1:{self._server.server_port}/v1"
+
+    @property
+    def cdn_url(self):
+        return f"http://127.0.0.1:{self._server.server_port}/cdn"
+
+    def start(self):
+        self._thread = threading.Thread(target=self._server.serve_forever, name="mock-figma", daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self):
+        self._server.shutdown()
+        self._server.server_close()
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, exc_type, exc, tb):
+        self.stop()
+
+    def stats(self):
+        return {'requests': self.requests, 'throttled': self.throttled, 'bytes_sent': self.bytes_sent}
+
+    def _png(self, path):
+        with self._lock:
+            body = self._pngs.get(path)
+        if body is None:
+            body = make_png(self.asset_size, self.asset_size, seed=zlib.crc32(path.encode("utf-8")))
+            with self._lock:
+                self._pngs[path] = body
+        return body
+
+    def _should_throttle(self):
+        with self._lock:
+            self.requests += 1
+            if self.throttle_every and self.requests % self.throttle_every == 0:
+                self.throttled += 1
+                return True
+        return False
+
+    def _cached_body(self, key, build):
+        with self._lock:
+            body = self._responses.get(key)
+        if body is None:
+            body = json.dumps(build()).encode("utf-8")
+            with self._lock:
+                self._responses[key] = body
+        return body
+
+    def _file_body(self, depth):
+        if depth is None:
+            return self._cached_body('file', lambda: self.data)
+        return self._cached_body(('file', depth), lambda: dict(
+            self.data, document=truncate_depth(self.data['document'], depth)))
+
+    def _nodes_body(self, ids):
+        nodes = {}
+        for node_id in ids:
+            node = self.index.get(node_id)
+            nodes[node_id] = {'document': node, 'components': {}, 'styles': {}} if node is not None else None
+        return json.dumps({'name': self.data.get('name'), 'version': self.data.get('version'),
+                           'nodes': nodes, 'err': None}).encode("utf-8")
+
+    def _image_fills_body(self):
+        def _build():
+            refs = set()
+            for node in self.index.by_id.values():
+                for fill in node.get('fills', ()):
+                    if fill.get('type') == 'IMAGE' and fill.get('imageRef'):
+                        refs.add(fill['imageRef'])
+            return {'error': False, 'status': 200,
+                    'meta': {'images': {ref: f"{self.cdn_url}/fills/{ref}.png" for ref in sorted(refs)}}}
+        return self._cached_body('image_fills', _build)
+
+    def _renders_body(self, ids, scale):
+        images = {node_id: (f"{self.cdn_url}/renders/{node_id.replace(':', '-')}@{scale}.png"
+                            if node_id in self.index else None) for node_id in ids}
+        return json.dumps({'err': None, 'images': images}).encode("utf-8")
+
+    def _handler(self):
+        server = self
+
+        class Handler(BaseHTTPRequestHandler):
+            protocol_version = "HTTP/1.1"
+
+            def log_message(self, format, *args):
+                pass
+
+            def _send(self, status, body, content_type="application/json", headers=None):
+                self.send_response(status)
+                self.send_header("Content-Type", content_type)
+                self.send_header("Content-Length", str(len(body)))
+                for name, value in (headers or {}).items():
+                    self.send_header(name, value)
+                self.end_headers()
+                self.wfile.write(body)
+                with server._lock:
+                    server.bytes_sent += len(body)
+
+            def do_GET(self):
+                url = urlparse(self.path)
+                query = parse_qs(url.query)
+                parts = [p for p in url.path.split("/") if p]
+
+                if parts[:1] == ["cdn"]:
+                    if server.download_latency:
+                        time.sleep(server.download_latency)
+                    return self._send(200, server._png(url.path), "image/png")
+                if parts[:1] != ["v1"]:
+                    return self._send(404, b'{"status":404,"err":"Not found"}')
+
+                if server.latency:
+                    time.sleep(server.latency)
+                if server._should_throttle():
+                    return self._send(429, b'{"status":429,"err":"Rate limit exceeded"}',
+                                      headers={"Retry-After": str(server.retry_after)})
+
+                route = parts[1:]
+                ids = [i for i in query.get('ids', [""])[0].split(",") if i]
+                if len(route) == 2 and route[0] == "files":
+                    depth = int(query['depth'][0]) if 'depth' in query else None
+                    return self._send(200, server._file_body(depth))
+                if len(route) == 3 and route[0] == "files" and route[2] == "nodes":
+                    return self._send(200, server._nodes_body(ids))
+                if len(route) == 3 and route[0] == "files" and route[2] == "images":
+                    return self._send(200, server._image_fills_body())
+                if len(route) == 2 and route[0] == "images":
+                    scale = query.get('scale', ["1"])[0]
+                    return self._send(200, server._renders_body(ids, scale))
+                return self._send(404, b'{"status":404,"err":"Not found"}')
+
+        return Handler
+
+
+def serve_spec(spec, **kwargs):
+    """
+    MockFigmaServer for a synthetic document spec.
+    """
+    from bench.synthetic import build_document
+    return MockFigmaServer(build_document(spec), **kwargs)
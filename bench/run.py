@@ -0,0 +1,251 @@
+"""
+Parser and export benchmarks on synthetic documents.
+
+    python -m bench.run --nodes 1000 10000 100000
+    python -m bench.run --nodes 20000 --export --latency 0.05 --throttle-every 10
+
+For each size this times the extractors, CSS generation and friends on an
+in-memory document (nodes/s), optionally the streaming parser on a JSON file
+written frame by frame, and with --export a full end-to-end export against
+the local mock API server. Peak memory is measured with tracemalloc in a
+separate run so it doesn't slow the timings; it covers this process only,
+not CSS or image worker processes.
+"""
+import argparse
+import gc
+import json
+import os
+import sys
+import tempfile
+import time
+import tracemalloc
+
+import src.parser as parser
+from bench.mock_server import MockFigmaServer
+from bench.synthetic import DocumentSpec, build_document, node_count, write_document
+from src.cache import BlobStore
+from src.diff import subtree_hashes
+from src.export import ZipExportWriter, export_file, format_stats
+from src.figma_client import FigmaClient
+from src.palette import build_palette
+from src.rate_limit import RateLimiter
+
+
+def measure(fn, repeat=3, memory=True):
+    """
+    Best-of-`repeat` wall time for fn(), then one traced run for peak
+    Python heap use. Returns {'seconds', 'peak_mb', 'result'}.
+    """
+    best = None
+    result = None
+    for _ in range(max(repeat, 1)):
+        gc.collect()
+        start = time.perf_counter()
+        result = fn()
+        elapsed = time.perf_counter() - start
+        best = elapsed if best is None else min(best, elapsed)
+    peak_mb = None
+    if memory:
+        gc.collect()
+        tracemalloc.start()
+        try:
+            fn()
+            peak_mb = tracemalloc.get_traced_memory()[1] / 1024 / 1024
+        finally:
+            tracemalloc.stop()
+    return {'seconds': best, 'peak_mb': peak_mb, 'result': result}
+
+
+def _css_all(frames, extract):
+    return sum(len(extract(frame)) for frame in frames)
+
+
+def _css_shared_all(frames):
+    memo = parser.CSSMemo()
+    return sum(len(parser.extract_css_shared(frame, memo)) for frame in frames)
+
+
+def extractor_benchmarks(data):
+    """
+    name -> zero-argument callable over an already parsed document.
+    """
+    document = data['document']
+    frames = parser.get_top_level_frames(document)
+    analysis = parser.DocumentAnalysis(document)
+    return {
+        'extract_colors': lambda: parser.extract_colors(document),
+        'extract_typography': lambda: list(parser.extract_typography(document)),
+        'extract_images': lambda: parser.extract_images(document),
+        'NodeIndex.build': lambda: parser.NodeIndex.build(document),
+        'DocumentAnalysis': lambda: parser.DocumentAnalysis(document),
+        'build_palette': lambda: build_palette(analysis.color_usage),
+        'extract_css_recursive': lambda: _css_all(frames, parser.extract_css_recursive),
+        'extract_css_shared': lambda: _css_shared_all(frames),
+        'subtree_hashes': lambda: subtree_hashes(document),
+        'compact_document': lambda: parser.compact_document(document),
+    }
+
+
+def streaming_benchmark(spec, repeat, memory):
+    """
+    parse_file_stream over a JSON file written frame by frame, with and
+    without keeping the tree. None if ijson isn't installed.
+    """
+    from src.streaming import ijson, parse_file_stream
+    if ijson is None:
+        return None
+    fd, path = tempfile.mkstemp(suffix=".json")
+    try:
+        with os.fdopen(fd, "w", encoding="utf-8") as f:
+            write_document(f, spec)
+        size_mb = os.path.getsize(path) / 1024 / 1024
+
+        def _parse(keep_tree):
+            with open(path, "rb") as f:
+                return parse_file_stream(f, keep_tree=keep_tree)
+
+        results = {}
+        for keep_tree in (True, False):
+            name = "parse_file_stream" + ("" if keep_tree else " (no tree)")
+            results[name] = measure(lambda: _parse(keep_tree), repeat, memory)
+            results[name]['mb'] = size_mb
+        return results
+    finally:
+        os.remove(path)
+
+
+def export_benchmark(data, args):
+    """
+    get_file + analysis + image fills + export_file against the mock server.
+    """
+    with MockFigmaServer(data, latency=args.latency, download_latency=args.download_latency,
+                         throttle_every=args.throttle_every, retry_after=0) as server, \
+            tempfile.TemporaryDirectory() as tmp:
+        # No pacing: the point is to measure our side, and injected 429s
+        # exercise the retry path
+        limiter = RateLimiter(capacity=10 ** 9, refill_rate=10 ** 9)
+        runs = []
+
+        def _run():
+            client = FigmaClient("bench", rate_limiter=limiter, base_url=server.base_url)
+            file_data = client.get_file("BENCH")
+            analysis = parser.DocumentAnalysis(file_data['document'])
+            fills = client.get_image_fills("BENCH") or {}
+            blob_store = BlobStore(os.path.join(tmp, f"blobs-{len(runs)}"))
+            with ZipExportWriter(export_dir=tmp) as writer:
+                stats = export_file(
+                    client, "BENCH", analysis, writer,
+                    image_urls=fills.get('meta', {}).get('images'),
+                    include_images=not args.no_images,
+                    scale=args.scale,
+                    blob_store=blob_store,
+                    css_workers=args.css_workers,
+                    download_workers=args.download_workers,
+                    version=file_data.get('version'),
+                )
+            stats['zip_bytes'] = writer.size()
+            os.remove(writer.path)
+            runs.append(stats)
+            return stats
+
+        result = measure(_run, repeat=1, memory=not args.no_memory)
+        result['server'] = server.stats()
+        return result
+
+
+def _row(name, nodes, result):
+    seconds = result['seconds']
+    rate = f"{nodes / seconds:,.0f} nodes/s" if seconds else "-"
+    if 'mb' in result and seconds:
+        rate += f", {result['mb'] / seconds:.1f} MB/s"
+    peak = f"{result['peak_mb']:.1f} MB" if result.get('peak_mb') is not None else "-"
+    return f"  {name:<30} {seconds * 1000:>10.1f} ms  {rate:<32} peak {peak}"
+
+
+def build_arg_parser():
+    arg_parser = argparse.ArgumentParser(description="Benchmark the parser and export path on synthetic documents.")
+    arg_parser.add_argument("--nodes", type=int, nargs="+", default=[1000, 10000, 100000],
+                            help="Document sizes to run (1k-5M; 1M+ needs several GB of RAM)")
+    arg_parser.add_argument("--depth", type=int, default=6, help="Max nesting below a top-level frame")
+    arg_parser.add_argument("--frames", type=int, default=None, help="Top-level frames (default: nodes/500)")
+    arg_parser.add_argument("--pages", type=int, default=1)
+    arg_parser.add_argument("--text", type=float, default=0.3, help="Fraction of leaves that are text")
+    arg_parser.add_argument("--image", type=float, default=0.05, help="Fraction of leaves with an image fill")
+    arg_parser.add_argument("--effect", type=float, default=0.1, help="Fraction of leaves with a drop shadow")
+    arg_parser.add_argument("--seed", type=int, default=1)
+    arg_parser.add_argument("--repeat", type=int, default=3, help="Timed runs per benchmark (best is reported)")
+    arg_parser.add_argument("--no-memory", action="store_true", help="Skip the tracemalloc peak-memory runs")
+    arg_parser.add_argument("--only", nargs="+", help="Run only these extractor benchmarks")
+    arg_parser.add_argument("--export", action="store_true", help="Also run an end-to-end export against the mock server")
+    arg_parser.add_argument("--latency", type=float, default=0.0, help="Mock API latency per request (s)")
+    arg_parser.add_argument("--download-latency", type=float, default=0.0, help="Mock CDN latency per download (s)")
+    arg_parser.add_argument("--throttle-every", type=int, default=0, help="Mock answers every Nth API call with 429")
+    arg_parser.add_argument("--scale", type=int, default=1, choices=[1, 2, 3, 4])
+    arg_parser.add_argument("--no-images", action="store_true", help="Skip screen renders in the export")
+    arg_parser.add_argument("--css-workers", type=int, default=None)
+    arg_parser.add_argument("--download-workers", type=int, default=32)
+    arg_parser.add_argument("--json", metavar="PATH", help="Also write all results as JSON")
+    return arg_parser
+
+
+def main(argv=None):
+    args = build_arg_parser().parse_args(argv)
+    memory = not args.no_memory
+    report = []
+
+    for nodes in args.nodes:
+        spec = DocumentSpec(nodes=nodes, depth=args.depth, frames=args.frames, pages=args.pages,
+                            text=args.text, image=args.image, effect=args.effect, seed=args.seed)
+        start = time.perf_counter()
+        data = build_document(spec)
+        actual = node_count(data['document'])
+        print(f"{actual:,} nodes, {spec.frames} frames, depth {spec.depth} "
+              f"(generated in {time.perf_counter() - start:.2f}s)")
+
+        results = {}
+        for name, fn in extractor_benchmarks(data).items():
+            if args.only and name not in args.only:
+                continue
+            results[name] = measure(fn, args.repeat, memory)
+            print(_row(name, actual, results[name]))
+            sys.stdout.flush()
+
+        if not args.only:
+            streamed = streaming_benchmark(spec, args.repeat, memory)
+            if streamed is None:
+                print("  (ijson not installed: skipping parse_file_stream)")
+            else:
+                for name, result in streamed.items():
+                    results[name] = result
+                    print(_row(name, actual, result))
+
+        if args.export:
+            result = export_benchmark(data, args)
+            results['export'] = result
+            print(_row("export (end to end)", actual, result))
+            print(f"    {format_stats(result['result'])}")
+            print(f"    mock server: {result['server']}")
+
+        report.append({
+            'nodes': actual,
+            'frames': spec.frames,
+            'depth': spec.depth,
+            'results': {name: {'seconds': r['seconds'], 'nodes_per_second': actual / r['seconds'] if r['seconds'] else None,
+                               'peak_mb': r['peak_mb']}
+                        for name, r in results.items()},
+        })
+        if 'export' in results:
+            report[-1]['export_stats'] = results['export']['result']
+            report[-1]['mock_server'] = results['export']['server']
+        del data
+        gc.collect()
+
+    if args.json:
+        with open(args.json, "w", encoding="utf-8") as f:
+            json.dump(report, f, indent=2)
+        print(f"Results written to {args.json}")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,205 @@
+"""
+Synthetic Figma documents for benchmarks.
+
+Documents follow the REST API shape (DOCUMENT -> CANVAS -> top-level FRAMEs
+-> nested layers) with a configurable node count, depth and mix of solid
+fills, text, image fills and shadows. Generation is deterministic for a
+given seed and works one frame at a time, so write_document can produce
+multi-million-node JSON without holding the tree in memory.
+"""
+import json
+import random
+
+# Roughly how many layers a real screen has
+DEFAULT_NODES_PER_FRAME = 500
+
+
+class DocumentSpec:
+    """
+    nodes: total node count (approximate for tiny documents)
+    depth: maximum nesting below a top-level frame
+    frames: top-level frames (default: nodes / DEFAULT_NODES_PER_FRAME)
+    pages: canvases the frames are spread over
+    text, image, effect: fraction of leaf layers that are text, have an
+                         image fill, or carry a drop shadow
+    palette: distinct base colors; fills pick one and add a little jitter
+    image_refs: distinct imageRefs shared by the image fills
+    """
+
+    def __init__(self, nodes=1000, depth=6, frames=None, pages=1, text=0.3, image=0.05,
+                 effect=0.1, palette=40, image_refs=50, seed=1):
+        self.nodes = max(nodes, 4)
+        self.depth = max(depth, 1)
+        self.pages = max(pages, 1)
+        self.frames = frames or max(1, self.nodes // DEFAULT_NODES_PER_FRAME)
+        self.text = text
+        self.image = image
+        self.effect = effect
+        self.palette = palette
+        self.image_refs = image_refs
+        self.seed = seed
+
+    def image_ref(self, i):
+        return f"{i:040x}"
+
+
+class _Generator:
+    def __init__(self, spec):
+        self.spec = spec
+        self.rng = random.Random(spec.seed)
+        self.palette = [(self.rng.random(), self.rng.random(), self.rng.random())
+                        for _ in range(spec.palette)]
+        self.next_id = 0
+
+    def new_id(self, page):
+        self.next_id += 1
+        return f"{page + 1}:{self.next_id}"
+
+    def color(self):
+        r, g, b = self.rng.choice(self.palette)
+        jitter = lambda v: min(1.0, max(0.0, v + self.rng.uniform(-0.004, 0.004)))
+        return {'r': jitter(r), 'g': jitter(g), 'b': jitter(b), 'a': 1}
+
+    def bbox(self, width, height):
+        return {'x': self.rng.randint(0, 1200), 'y': self.rng.randint(0, 4000),
+                'width': width, 'height': height}
+
+    def leaf(self, page):
+        spec, rng = self.spec, self.rng
+        roll = rng.random()
+        node_id = self.new_id(page)
+        if roll < spec.text:
+            size = rng.choice((12, 14, 16, 20, 24, 32))
+            node = {
+                'id': node_id, 'name': rng.choice(("Label", "Title", "Body", "Caption", "Price")),
+                'type': 'TEXT', 'characters': "Lorem ipsum",
+                'style': {'fontFamily': rng.choice(("Inter", "Roboto", "Poppins")),
+                          'fontWeight': rng.choice((400, 500, 700)), 'fontSize': size,
+                          'lineHeightPx': size * 1.4},
+                'fills': [{'type': 'SOLID', 'color': self.color()}],
+                'absoluteBoundingBox': self.bbox(rng.choice((80, 120, 240)), size * 1.4),
+            }
+        elif roll < spec.text + spec.image:
+            node = {
+                'id': node_id, 'name': rng.choice(("Photo", "Avatar", "Thumbnail")),
+                'type': 'RECTANGLE',
+                'fills': [{'type': 'IMAGE', 'scaleMode': 'FILL',
+                           'imageRef': spec.image_ref(rng.randrange(spec.image_refs))}],
+                'absoluteBoundingBox': self.bbox(rng.choice((48, 120, 320)), rng.choice((48, 120, 240))),
+            }
+        else:
+            node = {
+                'id': node_id, 'name': rng.choice(("Rectangle", "Divider", "Badge", "Card BG")),
+                'type': 'RECTANGLE',
+                'fills': [{'type': 'SOLID', 'color': self.color()}],
+                'absoluteBoundingBox': self.bbox(rng.choice((1, 24, 100, 320)), rng.choice((1, 24, 48, 200))),
+                'cornerRadius': rng.choice((0, 4, 8, 12)),
+            }
+        if rng.random() < spec.effect:
+            node['effects'] = [{'type': 'DROP_SHADOW', 'visible': True,
+                                'color': {'r': 0, 'g': 0, 'b': 0, 'a': 0.25},
+                                'offset': {'x': 0, 'y': 2}, 'radius': 4}]
+        return node
+
+    def container(self, page, kind='GROUP'):
+        node = {
+            'id': self.new_id(page), 'name': self.rng.choice(("Header", "List", "Row", "Card", "Group")),
+            'type': kind, 'children': [],
+            'absoluteBoundingBox': self.bbox(self.rng.choice((360, 800, 1440)), self.rng.choice((200, 900))),
+        }
+        if self.rng.random() < 0.5:
+            node['fills'] = [{'type': 'SOLID', 'color': self.color()}]
+        return node
+
+    def frame(self, page, index, size):
+        """
+        One top-level frame with `size` nodes in total. Each new node hangs
+        off a random open container, so depths vary up to spec.depth.
+        """
+        frame = self.container(page, 'FRAME')
+        frame['name'] = f"Screen {index + 1}"
+        frame['absoluteBoundingBox'] = {'x': index * 1500, 'y': 0, 'width': 1440, 'height': 900}
+        open_containers = [(frame, 0)]
+        for _ in range(size - 1):
+            parent, level = self.rng.choice(open_containers)
+            if level + 1 < self.spec.depth and self.rng.random() < 0.25:
+                child = self.container(page)
+                open_containers.append((child, level + 1))
+            else:
+                child = self.leaf(page)
+            parent['children'].append(child)
+        return frame
+
+
+def iter_pages(spec):
+    """
+    Yield (page dict without children, [frame sizes]) per canvas.
+    """
+    per_frame, extra = divmod(spec.nodes - 1 - spec.pages, spec.frames)
+    sizes = [max(1, per_frame + (1 if i < extra else 0)) for i in range(spec.frames)]
+    for page in range(spec.pages):
+        page_sizes = sizes[page::spec.pages]
+        yield {'id': f"0:{page + 1}", 'name': f"Page {page + 1}", 'type': 'CANVAS'}, page_sizes
+
+
+def iter_frames(spec):
+    """
+    Yield (page index, frame) one top-level frame at a time.
+    """
+    generator = _Generator(spec)
+    index = 0
+    for page, (_, sizes) in enumerate(iter_pages(spec)):
+        for size in sizes:
+            yield page, generator.frame(page, index, size)
+            index += 1
+
+
+def _file_meta(spec):
+    return {'name': f"Synthetic {spec.nodes} nodes", 'lastModified': "2024-01-01T00:00:00Z",
+            'version': str(spec.seed), 'schemaVersion': 0}
+
+
+def build_document(spec):
+    """
+    The whole /files response as one dict.
+    """
+    pages = [dict(page, children=[]) for page, _ in iter_pages(spec)]
+    for page, frame in iter_frames(spec):
+        pages[page]['children'].append(frame)
+    document = {'id': "0:0", 'name': "Document", 'type': 'DOCUMENT', 'children': pages}
+    return dict(_file_meta(spec), document=document)
+
+
+def write_document(out, spec):
+    """
+    Write the /files response JSON to a text file object frame by frame,
+    so documents far larger than memory can be produced.
+    """
+    meta = _file_meta(spec)
+    out.write(json.dumps(meta)[:-1])
+    out.write(', "document": {"id": "0:0", "name": "Document", "type": "DOCUMENT", "children": [')
+    frames = iter_frames(spec)
+    pending = next(frames, None)
+    for page_index, (page, sizes) in enumerate(iter_pages(spec)):
+        if page_index:
+            out.write(", ")
+        out.write(json.dumps(page)[:-1] + ', "children": [')
+        first = True
+        while pending is not None and pending[0] == page_index:
+            if not first:
+                out.write(", ")
+            json.dump(pending[1], out)
+            first = False
+            pending = next(frames, None)
+        out.write("]}")
+    out.write("]}}")
+
+
+def node_count(document):
+    count = 0
+    stack = [document]
+    while stack:
+        node = stack.pop()
+        count += 1
+        stack.extend(node.get('children', ()))
+    return count
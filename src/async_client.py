@@ -0,0 +1,342 @@
+"""
+asyncio variant of FigmaClient for high-concurrency work.
+
+One aiohttp session (and connection pool) per client, bounded semaphores for
+API calls and downloads, and the same retry, rate-limit and chunking
+behaviour as the sync client. Sync code such as the Streamlit app drives it
+through AsyncBridge, which runs an event loop on a background thread.
+"""
+import asyncio
+import json
+import queue
+import threading
+import time
+
+from src.figma_client import (API_BASE_URL, IMAGE_FILLS_MAX_AGE, RENDERS_MAX_AGE, VERSION_TTL,
+                               chunk_ids, merge_chunk_result)
+from src.metrics import get_metrics
+from src.rate_limit import get_rate_limiter
+from src.transport import RETRY_STATUSES, backoff_delay
+
+try:
+    import aiohttp
+except ImportError: # the sync client keeps working without it
+    aiohttp = None
+
+
+class AsyncFigmaClient:
+    def __init__(self, token, rate_limiter=None, max_concurrency=8, max_downloads=128,
+                 pool_size=256, nodes_chunk_size=100, images_chunk_size=50,
+                 max_retries=4, timeout=30, cache=None, base_url=API_BASE_URL):
+        if aiohttp is None:
+            raise ImportError("AsyncFigmaClient needs the 'aiohttp' package: pip install aiohttp")
+        self.base_url = base_url.rstrip("/")
+        self.headers = {
+            "X-Figma-Token": token
+        }
+        self.rate_limiter = rate_limiter or get_rate_limiter(token)
+        self.max_concurrency = max_concurrency
+        self.max_downloads = max_downloads
+        self.pool_size = pool_size
+        self.nodes_chunk_size = nodes_chunk_size
+        self.images_chunk_size = images_chunk_size
+        self.max_retries = max_retries
+        self.timeout = timeout
+        self.cache = cache
+        self._versions = {} # file_key -> (version, checked_at)
+        self._session = None
+        self._api_semaphore = None
+        self._download_semaphore = None
+
+    async def _ensure_session(self):
+        # Created lazily so the session belongs to the loop that uses it
+        if self._session is None or self._session.closed:
+            connector = aiohttp.TCPConnector(limit=self.pool_size)
+            self._session = aiohttp.ClientSession(
+                connector=connector, timeout=aiohttp.ClientTimeout(total=self.timeout)
+            )
+            self._api_semaphore = asyncio.Semaphore(self.max_concurrency)
+            self._download_semaphore = asyncio.Semaphore(self.max_downloads)
+        return self._session
+
+    async def close(self):
+        if self._session is not None:
+            await self._session.close()
+            self._session = None
+
+    async def __aenter__(self):
+        await self._ensure_session()
+        return self
+
+    async def __aexit__(self, exc_type, exc, tb):
+        await self.close()
+
+    async def _request(self, url, headers=None, read='json'):
+        """
+        GET with retries on 429/5xx and connection errors.
+        Returns the decoded JSON or the raw bytes (read='bytes').
+        """
+        session = await self._ensure_session()
+        metrics = get_metrics()
+        host = "api" if "/v1/" in url else "download"
+        attempt = 0
+        while True:
+            retry_after = None
+            reason = "connection"
+            try:
+                async with session.get(url, headers=headers) as response:
+                    metrics.incr('http_requests_total', host=host, status=response.status)
+                    if response.status not in RETRY_STATUSES or attempt >= self.max_retries:
+                        response.raise_for_status()
+                        body = await response.read()
+                        metrics.incr('http_bytes_total', len(body), host=host)
+                        if read == 'bytes':
+                            return body
+                        with metrics.span('json_decode', endpoint=host):
+                            return json.loads(body)
+                    retry_after = response.headers.get("Retry-After")
+                    reason = response.status
+            except (aiohttp.ClientConnectionError, asyncio.TimeoutError):
+                metrics.incr('http_requests_total', host=host, status="error")
+                if attempt >= self.max_retries:
+                    raise
+            delay = backoff_delay(retry_after, attempt)
+            metrics.incr('http_retries_total', host=host, reason=reason)
+            metrics.incr('http_retry_sleep_seconds_total', delay, host=host)
+            await asyncio.sleep(delay)
+            attempt += 1
+
+    async def _api_get(self, endpoint, url):
+        await self._ensure_session()
+        async with self._api_semaphore:
+            await self.rate_limiter.acquire_async(endpoint)
+            get_metrics().incr('api_calls_total', endpoint=endpoint)
+            with get_metrics().span('api_request', endpoint=endpoint):
+                return await self._request(url, headers=self.headers)
+
+    async def get_file_version(self, file_key):
+        """
+        Cheap version probe (depth=1), trusted for VERSION_TTL seconds like
+        FigmaClient.get_file_version.
+        """
+        known = self._versions.get(file_key)
+        if known and time.time() - known[1] < VERSION_TTL:
+            return known[0]
+        data = await self._api_get('files', f"{self.base_url}/files/{file_key}?depth=1")
+        version = data.get('version')
+        self._versions[file_key] = (version, time.time())
+        return version
+
+    async def get_file(self, file_key, depth=None):
+        """
+        Fetches the Figma file content (served from the disk cache when
+        the version is unchanged).
+        depth: only return the tree down to this depth, as in FigmaClient
+        """
+        suffix = f":depth{depth}" if depth else ""
+        if self.cache is not None:
+            version = await self.get_file_version(file_key)
+            cached = self.cache.get('files', f"{file_key}@{version}{suffix}")
+            if cached is not None:
+                return cached
+        url = f"{self.base_url}/files/{file_key}"
+        if depth:
+            url += f"?depth={depth}"
+        data = await self._api_get('files', url)
+        if self.cache is not None:
+            version = data.get('version')
+            self._versions[file_key] = (version, time.time())
+            self.cache.set('files', f"{file_key}@{version}{suffix}", data)
+        return data
+
+    async def _fan_out(self, ids, chunk_size, make_url, endpoint, result_key):
+        merged = {result_key: {}, 'failed': {}}
+
+        async def _run(chunk):
+            try:
+                return chunk, await self._api_get(endpoint, make_url(chunk)), None
+            except (aiohttp.ClientError, asyncio.TimeoutError) as e:
+                # One failed chunk is reported per ID instead of failing the gather
+                return chunk, None, e
+
+        results = await asyncio.gather(*[_run(chunk) for chunk in chunk_ids(ids, chunk_size)])
+        for chunk, data, error in results:
+            merge_chunk_result(merged, chunk, data, error, result_key)
+        merged['err'] = None
+        return merged
+
+    async def get_file_nodes(self, file_key, ids):
+        """
+        Fetches specific nodes from a file, in concurrent chunks.
+        Returns {'nodes': {id: ...}, 'failed': {id: reason}, ...}
+        """
+        def _url(chunk):
+            return f"{self.base_url}/files/{file_key}/nodes?ids={','.join(chunk)}"
+        if self.cache is None:
+            return await self._fan_out(ids, self.nodes_chunk_size, _url, 'nodes', 'nodes')
+
+        # Each subtree is cached per file version and node ID, as in FigmaClient
+        version = await self.get_file_version(file_key)
+        cached = {}
+        for node_id in ids:
+            subtree = self.cache.get('nodes', f"{file_key}@{version}:{node_id}")
+            if subtree is not None:
+                cached[node_id] = subtree
+        result = await self._fan_out([i for i in ids if i not in cached], self.nodes_chunk_size,
+                                     _url, 'nodes', 'nodes')
+        for node_id, subtree in result['nodes'].items():
+            self.cache.set('nodes', f"{file_key}@{version}:{node_id}", subtree)
+        result['nodes'].update(cached)
+        return result
+
+    async def get_image_fills(self, file_key):
+        """
+        Get image fills from a file.
+        """
+        try:
+            cache_key = None
+            if self.cache is not None:
+                cache_key = f"{file_key}@{await self.get_file_version(file_key)}"
+                cached = self.cache.get('image_fills', cache_key, max_age=IMAGE_FILLS_MAX_AGE)
+                if cached is not None:
+                    return cached
+            data = await self._api_get('image_fills', f"{self.base_url}/files/{file_key}/images")
+            if cache_key is not None:
+                self.cache.set('image_fills', cache_key, data)
+            return data
+        except (aiohttp.ClientError, asyncio.TimeoutError) as e:
+            print(f"Error fetching images: {e}")
+            return None
+
+    async def get_images(self, file_key, ids, format='png', scale=1):
+        """
+        Get rendered images for specific nodes, in concurrent chunks.
+        Returns {'images': {id: url}, 'failed': {id: reason}, ...}
+        """
+        def _url(chunk):
+            return f"{self.base_url}/images/{file_key}?ids={','.join(chunk)}&format={format}&scale={scale}"
+
+        # Render URLs are cached per version, format and scale, as in FigmaClient
+        cache_key = None
+        cached_urls = {}
+        if self.cache is not None:
+            try:
+                cache_key = f"{file_key}@{await self.get_file_version(file_key)}:{format}@{scale}"
+            except (aiohttp.ClientError, asyncio.TimeoutError) as e:
+                print(f"Error checking file version: {e}")
+            else:
+                cached_urls = self.cache.get('renders', cache_key, max_age=RENDERS_MAX_AGE) or {}
+
+        missing = [node_id for node_id in ids if node_id not in cached_urls]
+        # Larger scales take Figma longer to render, so send fewer per request
+        chunk_size = max(1, int(self.images_chunk_size // max(scale, 1)))
+        result = await self._fan_out(missing, chunk_size, _url, 'images', 'images')
+
+        if cache_key is not None and result['images']:
+            cached_urls.update(result['images'])
+            self.cache.set('renders', cache_key, cached_urls)
+        for node_id in ids:
+            if node_id in cached_urls:
+                result['images'][node_id] = cached_urls[node_id]
+        return result
+
+    async def download(self, url):
+        """
+        Bytes of one asset/render URL, bounded by the download semaphore.
+        """
+        await self._ensure_session()
+        async with self._download_semaphore:
+            return await self._request(url, read='bytes')
+
+    async def download_many(self, urls):
+        """
+        Download {key: url} concurrently. Yields (key, bytes or None) as
+        each finishes. Closing the generator cancels what is still pending.
+        """
+        async def _one(key, url):
+            try:
+                return key, await self.download(url)
+            except (aiohttp.ClientError, asyncio.TimeoutError) as e:
+                print(f"Error downloading {key}: {e}")
+                return key, None
+
+        tasks = [asyncio.ensure_future(_one(key, url)) for key, url in urls.items()]
+        try:
+            for next_done in asyncio.as_completed(tasks):
+                yield await next_done
+        finally:
+            for task in tasks:
+                task.cancel()
+
+
+class AsyncBridge:
+    """
+    Runs coroutines on a private event loop thread so synchronous code
+    (Streamlit, the export pipeline) can use AsyncFigmaClient.
+    """
+
+    def __init__(self):
+        self.loop = asyncio.new_event_loop()
+        self._thread = threading.Thread(target=self.loop.run_forever, name="figma-async", daemon=True)
+        self._thread.start()
+
+    def run(self, coro, timeout=None):
+        """
+        Run a coroutine to completion and return its result. If waiting is
+        interrupted (timeout, KeyboardInterrupt), the coroutine is cancelled.
+        """
+        future = asyncio.run_coroutine_threadsafe(coro, self.loop)
+        try:
+            return future.result(timeout)
+        except BaseException:
+            future.cancel()
+            raise
+
+    def iterate(self, agen):
+        """
+        Iterate an async generator from sync code. Breaking out of the loop
+        closes the generator, which cancels its outstanding work.
+        """
+        results = queue.Queue()
+        done = object()
+
+        async def _pump():
+            try:
+                async for item in agen:
+                    results.put(item)
+            except BaseException as e:
+                results.put(e)
+            finally:
+                results.put(done)
+
+        future = asyncio.run_coroutine_threadsafe(_pump(), self.loop)
+        try:
+            while True:
+                item = results.get()
+                if item is done:
+                    break
+                if isinstance(item, BaseException):
+                    raise item
+                yield item
+        finally:
+            future.cancel()
+
+
+_bridge = None
+_bridge_lock = threading.Lock()
+
+
+def get_bridge():
+    global _bridge
+    with _bridge_lock:
+        if _bridge is None:
+            _bridge = AsyncBridge()
+        return _bridge
+
+
+def download_many_sync(client, urls):
+    """
+    Sync generator over AsyncFigmaClient.download_many, for the export
+    pipeline's `download_many` hook.
+    """
+    return get_bridge().iterate(client.download_many(urls))
@@ -0,0 +1,352 @@
+import contextlib
+import gzip
+import hashlib
+import json
+import os
+import tempfile
+import threading
+import time
+
+from src.metrics import get_metrics
+
+DEFAULT_CACHE_DIR = os.path.join(os.path.expanduser("~"), ".cache", "figma-to-code")
+DEFAULT_MAX_BYTES = 2 * 1024 ** 3 # 2 GB
+DEFAULT_ASSETS_MAX_BYTES = 4 * 1024 ** 3 # assets, renders and processed images
+
+
+def _file_size(path):
+    try:
+        return os.path.getsize(path)
+    except OSError:
+        return 0
+
+
+class DiskCache:
+    """
+    Persistent gzip-compressed JSON cache for Figma API responses.
+
+    Entries are grouped by namespace ('files', 'image_fills', 'renders') and
+    keyed by strings that include the file version, so a new version simply
+    misses. The least recently used entries are evicted once the total
+    size on disk goes over max_bytes; a hit refreshes the entry's mtime.
+    """
+
+    def __init__(self, root=DEFAULT_CACHE_DIR, max_bytes=DEFAULT_MAX_BYTES):
+        self.root = root
+        self.max_bytes = max_bytes
+        self.hits = 0
+        self.misses = 0
+        # Running total of entry sizes, so writes don't have to scan the
+        # directory; None until the first scan
+        self._size = None
+        self._lock = threading.Lock()
+        os.makedirs(self.root, exist_ok=True)
+
+    def _path(self, namespace, key):
+        digest = hashlib.sha256(key.encode()).hexdigest()
+        return os.path.join(self.root, namespace, f"{digest}.json.gz")
+
+    def _record(self, namespace, hit):
+        if hit:
+            self.hits += 1
+        else:
+            self.misses += 1
+        get_metrics().incr('cache_requests_total', namespace=namespace, result="hit" if hit else "miss")
+
+    def get(self, namespace, key, max_age=None):
+        """
+        Returns the cached value or None. max_age (seconds) is for entries
+        that expire on Figma's side, like signed image URLs.
+        """
+        path = self._path(namespace, key)
+        try:
+            with gzip.open(path, "rt", encoding="utf-8") as f, get_metrics().span('cache_read', namespace=namespace):
+                entry = json.load(f)
+            if max_age is not None and time.time() - entry['stored'] > max_age:
+                self._record(namespace, False)
+                return None
+            os.utime(path) # mark as recently used
+        except (OSError, ValueError, KeyError, TypeError):
+            self._record(namespace, False)
+            return None
+        self._record(namespace, True)
+        return entry['value']
+
+    def open(self, namespace, key):
+        """
+        Open an entry for incremental reading. Returns a binary file object
+        over the entry JSON ({'stored': ..., 'value': ...}) or None.
+        """
+        path = self._path(namespace, key)
+        try:
+            f = gzip.open(path, "rb")
+            os.utime(path)
+        except OSError:
+            self._record(namespace, False)
+            return None
+        self._record(namespace, True)
+        return f
+
+    @contextlib.contextmanager
+    def writer(self, namespace, key):
+        """
+        Write an entry's value as raw JSON bytes in chunks, without holding
+        it in memory. The entry only becomes visible if the block succeeds.
+        """
+        path = self._path(namespace, key)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        fd, tmp_path = tempfile.mkstemp(dir=os.path.dirname(path), suffix=".tmp")
+        try:
+            with os.fdopen(fd, "wb") as raw, gzip.GzipFile(fileobj=raw, mode="wb", compresslevel=6) as f:
+                f.write(f'{{"stored":{time.time()},"value":'.encode("utf-8"))
+                yield f
+                f.write(b"}")
+            replaced = _file_size(path)
+            os.replace(tmp_path, path)
+        except BaseException:
+            if os.path.exists(tmp_path):
+                os.remove(tmp_path)
+            raise
+        self._written(path, replaced)
+
+    def set(self, namespace, key, value):
+        path = self._path(namespace, key)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        # Write to a temp file first so readers never see a partial entry
+        fd, tmp_path = tempfile.mkstemp(dir=os.path.dirname(path), suffix=".tmp")
+        try:
+            with os.fdopen(fd, "wb") as raw, gzip.GzipFile(fileobj=raw, mode="wb", compresslevel=6) as f:
+                entry = {'stored': time.time(), 'value': value}
+                f.write(json.dumps(entry, separators=(",", ":")).encode("utf-8"))
+            replaced = _file_size(path)
+            os.replace(tmp_path, path)
+        except OSError as e:
+            print(f"Could not write cache entry: {e}")
+            if os.path.exists(tmp_path):
+                os.remove(tmp_path)
+            return
+        self._written(path, replaced)
+
+    def _written(self, path, replaced):
+        """
+        Count a new entry (replacing one of `replaced` bytes). The cache
+        directory is only scanned once the running total goes over
+        max_bytes, so a batch of writes stays linear. Other processes'
+        writes are picked up by that scan.
+        """
+        size = _file_size(path)
+        with self._lock:
+            if self._size is not None:
+                self._size += size - replaced
+                if self._size <= self.max_bytes:
+                    return
+        self.evict()
+
+    def evict(self):
+        """
+        Remove least recently used entries until the cache fits max_bytes.
+        """
+        with self._lock:
+            entries = []
+            total = 0
+            for dirpath, _, filenames in os.walk(self.root):
+                for name in filenames:
+                    if not name.endswith(".json.gz"):
+                        continue
+                    path = os.path.join(dirpath, name)
+                    try:
+                        stat = os.stat(path)
+                    except OSError:
+                        continue
+                    entries.append((stat.st_mtime, stat.st_size, path))
+                    total += stat.st_size
+
+            if total > self.max_bytes:
+                for _, size, path in sorted(entries):
+                    try:
+                        os.remove(path)
+                    except OSError:
+                        continue
+                    total -= size
+                    if total <= self.max_bytes:
+                        break
+            self._size = total
+
+    def stats(self):
+        return {'hits': self.hits, 'misses': self.misses}
+
+
+class BlobStore:
+    """
+    Content-addressed store for downloaded asset bytes.
+
+    Blobs live under blobs/<sha256>; refs/<imageRef> records which blob an
+    image fill resolved to, so repeat exports of a file skip downloads for
+    fills they have already fetched. Like DiskCache, the least recently used
+    blobs are evicted once their total size goes over max_bytes; refs to an
+    evicted blob simply miss.
+    """
+
+    def __init__(self, root, max_bytes=DEFAULT_ASSETS_MAX_BYTES):
+        self.root = root
+        self.max_bytes = max_bytes
+        self.hits = 0
+        self.misses = 0
+        self._size = None # running total of blob sizes, None until scanned
+        self._lock = threading.Lock()
+        os.makedirs(os.path.join(root, "blobs"), exist_ok=True)
+        os.makedirs(os.path.join(root, "refs"), exist_ok=True)
+
+    def _blob_path(self, digest):
+        return os.path.join(self.root, "blobs", digest)
+
+    def _ref_path(self, ref):
+        # imageRefs are hex hashes already, but never trust them as paths
+        return os.path.join(self.root, "refs", hashlib.sha256(ref.encode()).hexdigest())
+
+    def _record(self, hit):
+        if hit:
+            self.hits += 1
+        else:
+            self.misses += 1
+        get_metrics().incr('blob_store_requests_total', result="hit" if hit else "miss")
+
+    def lookup(self, ref):
+        """
+        Digest of the blob stored for `ref`, or None.
+        """
+        try:
+            with open(self._ref_path(ref), "r", encoding="utf-8") as f:
+                digest = f.read().strip()
+        except OSError:
+            self._record(False)
+            return None
+        try:
+            os.utime(self._blob_path(digest)) # mark as recently used
+        except OSError:
+            self._record(False)
+            return None
+        self._record(True)
+        return digest
+
+    def read(self, digest):
+        with open(self._blob_path(digest), "rb") as f:
+            return f.read()
+
+    def put(self, data, ref=None):
+        """
+        Store bytes (once per content) and optionally link `ref` to them.
+        Returns the sha256 hex digest.
+        """
+        digest = hashlib.sha256(data).hexdigest()
+        path = self._blob_path(digest)
+        added = not os.path.exists(path)
+        if added:
+            self._write_atomic(path, data)
+        if ref is not None:
+            self._write_atomic(self._ref_path(ref), digest.encode("utf-8"))
+        if added:
+            self._added(len(data), keep=digest)
+        return digest
+
+    def _added(self, size, keep=None):
+        # Only scan the blob directory once the running total is over budget
+        with self._lock:
+            if self._size is not None:
+                self._size += size
+                if self._size <= self.max_bytes:
+                    return
+        self.evict(keep=keep)
+
+    def evict(self, keep=None):
+        """
+        Remove least recently used blobs until the store fits max_bytes,
+        then the refs left pointing at them. `keep` is a digest that must
+        survive (the blob just written).
+        """
+        with self._lock:
+            blobs_dir = os.path.join(self.root, "blobs")
+            entries = []
+            total = 0
+            for name in os.listdir(blobs_dir):
+                if name.endswith(".tmp"):
+                    continue
+                try:
+                    stat = os.stat(os.path.join(blobs_dir, name))
+                except OSError:
+                    continue
+                entries.append((stat.st_mtime, stat.st_size, name))
+                total += stat.st_size
+
+            evicted = set()
+            if total > self.max_bytes:
+                for _, size, name in sorted(entries):
+                    if name == keep:
+                        continue
+                    try:
+                        os.remove(os.path.join(blobs_dir, name))
+                    except OSError:
+                        continue
+                    evicted.add(name)
+                    total -= size
+                    if total <= self.max_bytes:
+                        break
+            self._size = total
+
+            if evicted:
+                refs_dir = os.path.join(self.root, "refs")
+                for name in os.listdir(refs_dir):
+                    path = os.path.join(refs_dir, name)
+                    try:
+                        with open(path, "r", encoding="utf-8") as f:
+                            if f.read().strip() in evicted:
+                                os.remove(path)
+                    except OSError:
+                        continue
+
+    def _write_atomic(self, path, data):
+        fd, tmp_path = tempfile.mkstemp(dir=os.path.dirname(path), suffix=".tmp")
+        try:
+            with os.fdopen(fd, "wb") as f:
+                f.write(data)
+            os.replace(tmp_path, path)
+        except OSError:
+            if os.path.exists(tmp_path):
+                os.remove(tmp_path)
+            raise
+
+    def stats(self):
+        return {'hits': self.hits, 'misses': self.misses}
+
+
+_default_cache = None
+_default_blob_store = None
+_default_lock = threading.Lock()
+
+
+def get_default_cache():
+    """
+    Process-wide cache rooted at $FIGMA_CACHE_DIR (default ~/.cache/figma-to-code),
+    capped at $FIGMA_CACHE_MAX_BYTES.
+    """
+    global _default_cache
+    with _default_lock:
+        if _default_cache is None:
+            root = os.environ.get("FIGMA_CACHE_DIR", DEFAULT_CACHE_DIR)
+            max_bytes = int(os.environ.get("FIGMA_CACHE_MAX_BYTES", DEFAULT_MAX_BYTES))
+            _default_cache = DiskCache(root, max_bytes)
+        return _default_cache
+
+
+def get_default_blob_store():
+    """
+    Process-wide asset blob store under $FIGMA_CACHE_DIR/assets, capped at
+    $FIGMA_ASSETS_MAX_BYTES.
+    """
+    global _default_blob_store
+    with _default_lock:
+        if _default_blob_store is None:
+            root = os.environ.get("FIGMA_CACHE_DIR", DEFAULT_CACHE_DIR)
+            max_bytes = int(os.environ.get("FIGMA_ASSETS_MAX_BYTES", DEFAULT_ASSETS_MAX_BYTES))
+            _default_blob_store = BlobStore(os.path.join(root, "assets"), max_bytes)
+        return _default_blob_store
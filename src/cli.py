@@ -0,0 +1,184 @@
+"""
+Headless batch exporter.
+
+    python -m src.cli FILE_URL_OR_KEY [FILE_URL_OR_KEY ...] --out exports/
+
+Writes one <file_key>.zip per file with the same layout as the Bulk Export
+tab. The token is read from --token or FIGMA_TOKEN (a .env file works too).
+"""
+import argparse
+import os
+import sys
+import time
+
+from dotenv import load_dotenv
+
+import src.figma_client as figma
+import src.parser as parser
+from src.cache import get_default_blob_store, get_default_cache
+from src.export import ZipExportWriter, export_file, format_stats
+from src.images import ImageProcessor
+from src.metrics import get_metrics
+from src.async_client import AsyncFigmaClient, download_many_sync, get_bridge
+
+
+def build_arg_parser():
+    arg_parser = argparse.ArgumentParser(description="Export Figma files to CSS, tokens and assets without the UI.")
+    arg_parser.add_argument("files", nargs="+", help="Figma file URLs or file keys")
+    arg_parser.add_argument("--token", help="Figma personal access token (default: $FIGMA_TOKEN)")
+    arg_parser.add_argument("--out", default="exports", help="Output directory (default: exports)")
+    arg_parser.add_argument("--frame", action="append", dest="frames",
+                            help="Top-level frame name or ID to export; repeatable (default: all frames)")
+    arg_parser.add_argument("--scale", type=int, default=1, choices=[1, 2, 3, 4], help="Render scale for screens")
+    arg_parser.add_argument("--no-images", action="store_true", help="Skip rendered screen images")
+    arg_parser.add_argument("--no-assets", action="store_true", help="Skip image-fill assets")
+    arg_parser.add_argument("--css-workers", type=int, default=None,
+                            help="Processes for CSS generation (default: CPU count)")
+    arg_parser.add_argument("--download-workers", type=int, default=32,
+                            help="Concurrent downloads (threads, or async downloads with --async; default: 32)")
+    arg_parser.add_argument("--shared-css", action="store_true",
+                            help="Shared classes per distinct style instead of one CSS rule per node "
+                                 "(smaller CSS, slower to generate)")
+    arg_parser.add_argument("--image-format", choices=["original", "webp", "avif"], default="original",
+                            help="Re-encode screens and assets (needs Pillow; default: keep the source format)")
+    arg_parser.add_argument("--image-variants", action="store_true",
+                            help="Also write half-size @1x variants of image assets; the main file is @2x (needs Pillow)")
+    arg_parser.add_argument("--optimize-images", action="store_true",
+                            help="Strip EXIF, XMP and text metadata from images without re-encoding them")
+    arg_parser.add_argument("--incremental", action="store_true",
+                            help="Reuse unchanged frames from the existing <out>/<file_key>.zip")
+    arg_parser.add_argument("--metrics-json", metavar="PATH",
+                            help="Write request, cache and stage metrics for the run as JSON")
+    arg_parser.add_argument("--metrics-prom", metavar="PATH",
+                            help="Write the same metrics in Prometheus text format")
+    arg_parser.add_argument("--async", dest="use_async", action="store_true",
+                            help="Download with the asyncio client (needs aiohttp)")
+    return arg_parser
+
+
+def select_frames(analysis, wanted):
+    """
+    Resolve --frame values (IDs or names; names may match several frames).
+    """
+    if not wanted:
+        return [f['id'] for f in analysis.frames]
+    frame_ids = {f['id'] for f in analysis.frames}
+    selected = []
+    for value in wanted:
+        if value in frame_ids:
+            matches = [value]
+        else:
+            matches = [i for i in analysis.index.ids_for_name(value) if i in frame_ids]
+        if not matches:
+            print(f"  warning: no top-level frame matches {value!r}", file=sys.stderr)
+        selected.extend(m for m in matches if m not in selected)
+    return selected
+
+
+def build_image_processor(args):
+    target_format = None if args.image_format == "original" else args.image_format
+    if not (target_format or args.image_variants or args.optimize_images):
+        return None
+    return ImageProcessor(get_default_blob_store(), target_format=target_format,
+                          variants=args.image_variants, strip=args.optimize_images)
+
+
+def export_one(client, file_key, args, download_many=None):
+    fetch_start = time.time()
+    metrics = get_metrics()
+    with metrics.span('fetch'):
+        data = client.get_file(file_key)
+    with metrics.span('analysis'):
+        analysis = parser.DocumentAnalysis(data['document'])
+    fetch_seconds = time.time() - fetch_start
+
+    image_urls = None
+    if not args.no_assets:
+        image_fills = client.get_image_fills(file_key)
+        image_urls = (image_fills or {}).get('meta', {}).get('images')
+
+    frame_ids = select_frames(analysis, args.frames)
+    path = os.path.join(args.out, f"{file_key}.zip")
+    previous = path if args.incremental and os.path.exists(path) else None
+    # Written next to the final path and swapped in once complete
+    tmp_path = path + ".partial"
+    with ZipExportWriter(path=tmp_path) as writer:
+        stats = export_file(
+            client, file_key, analysis, writer,
+            frame_ids=frame_ids,
+            image_urls=image_urls,
+            include_images=not args.no_images,
+            scale=args.scale,
+            blob_store=get_default_blob_store(),
+            css_workers=args.css_workers,
+            download_workers=args.download_workers,
+            on_status=lambda text: print(f"  {text}"),
+            download_many=download_many,
+            previous_export=previous,
+            shared_css=args.shared_css,
+            image_processor=build_image_processor(args),
+            version=data.get('version'),
+        )
+    os.replace(tmp_path, path)
+    stats['fetch_seconds'] = fetch_seconds
+    stats['zip_bytes'] = os.path.getsize(path)
+    print(f"  fetched + analysed in {fetch_seconds:.2f}s; {format_stats(stats)}")
+    print(f"  wrote {path} ({stats['zip_bytes'] / 1024 / 1024:.1f} MB)")
+    for frame_id, reason in stats['failed_screens'].items():
+        print(f"  warning: screen {frame_id} failed: {reason}", file=sys.stderr)
+    return stats
+
+
+def main(argv=None):
+    load_dotenv()
+    args = build_arg_parser().parse_args(argv)
+    token = args.token or os.environ.get("FIGMA_TOKEN")
+    if not token:
+        print("No token: pass --token or set FIGMA_TOKEN", file=sys.stderr)
+        return 2
+    os.makedirs(args.out, exist_ok=True)
+
+    client = figma.FigmaClient(token, cache=get_default_cache())
+    download_many = None
+    async_client = None
+    if args.use_async:
+        async_client = AsyncFigmaClient(token, max_downloads=args.download_workers)
+        download_many = lambda urls: download_many_sync(async_client, urls)
+    start = time.time()
+    exported = []
+    failures = 0
+    try:
+        for value in args.files:
+            file_key = figma.parse_file_key(value) or value
+            print(f"{file_key}:")
+            try:
+                exported.append(export_one(client, file_key, args, download_many))
+            except Exception as e:
+                failures += 1
+                print(f"  error: {e}", file=sys.stderr)
+    finally:
+        if async_client is not None:
+            # Otherwise aiohttp warns about an unclosed session at exit
+            get_bridge().run(async_client.close())
+
+    total = time.time() - start
+    frames = sum(s['frames'] for s in exported)
+    total_bytes = sum(s['zip_bytes'] for s in exported)
+    print(f"Exported {len(exported)}/{len(args.files)} files, {frames} frames, "
+          f"{total_bytes / 1024 / 1024:.1f} MB in {total:.2f}s "
+          f"({frames / total if total else 0:.1f} frames/s)")
+    write_metrics(args)
+    return 1 if failures else 0
+
+
+def write_metrics(args):
+    metrics = get_metrics()
+    for path, render in ((args.metrics_json, metrics.to_json), (args.metrics_prom, metrics.to_prometheus)):
+        if path:
+            with open(path, "w", encoding="utf-8") as f:
+                f.write(render())
+            print(f"Metrics written to {path}")
+
+
+if __name__ == "__main__":
+    sys.exit(main())
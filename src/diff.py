@@ -0,0 +1,95 @@
+"""
+Version diffing on top of the parser's node model.
+
+Every node gets a hash of its own style-relevant properties combined with
+its children's hashes, so two versions of a file can be compared frame by
+frame without walking unchanged subtrees twice. Works on raw and compact
+trees alike.
+
+The hash only covers what the generated CSS reads (HASHED_KEYS). Edits that
+only change how a frame renders (strokeWeight, opacity, vector paths,
+auto-layout spacing, ...) keep it the same, so it decides whether CSS can be
+reused, not whether a rendered screen is still current.
+"""
+import hashlib
+import json
+
+from src.parser import BoundingBox, get_top_level_frames, walk
+
+# Properties that change the generated CSS (and the node tree shape)
+HASHED_KEYS = ('name', 'type', 'visible', 'characters', 'fills', 'strokes',
+               'style', 'effects', 'cornerRadius', 'absoluteBoundingBox')
+
+
+def _json_default(value):
+    if isinstance(value, BoundingBox):
+        return value.to_dict()
+    raise TypeError(f"Cannot hash {type(value).__name__}")
+
+
+def subtree_hashes(root):
+    """
+    id -> hex digest for every node under root (inclusive). Computed
+    bottom-up without recursion: a node's hash covers its own properties
+    and the ordered hashes of its children.
+    """
+    order = [node for node, _, _ in walk(root)]
+    hashes = {}
+    for node in reversed(order):
+        own = {key: node[key] for key in HASHED_KEYS if key in node}
+        digest = hashlib.sha1(json.dumps(own, sort_keys=True, default=_json_default).encode("utf-8"))
+        for child in node.get('children', ()):
+            digest.update(hashes[child['id']].encode("ascii"))
+        hashes[node['id']] = digest.hexdigest()
+    return hashes
+
+
+def subtree_hash(root):
+    return subtree_hashes(root)[root['id']]
+
+
+def frame_hashes(frames):
+    """
+    frame id -> subtree hash for a list of top-level frames.
+    """
+    return {frame['id']: subtree_hash(frame) for frame in frames}
+
+
+def diff_frame_hashes(old_hashes, new_hashes):
+    """
+    Compare two {frame id: hash} maps.
+    Returns {'changed', 'added', 'removed', 'unchanged'} lists of frame IDs.
+    """
+    result = {'changed': [], 'added': [], 'removed': [], 'unchanged': []}
+    for frame_id, new_hash in new_hashes.items():
+        if frame_id not in old_hashes:
+            result['added'].append(frame_id)
+        elif old_hashes[frame_id] != new_hash:
+            result['changed'].append(frame_id)
+        else:
+            result['unchanged'].append(frame_id)
+    result['removed'] = [frame_id for frame_id in old_hashes if frame_id not in new_hashes]
+    return result
+
+
+def diff_documents(old_document, new_document):
+    """
+    Which top-level frames (see get_top_level_frames) differ between two
+    versions of a document.
+    """
+    return diff_frame_hashes(
+        frame_hashes(get_top_level_frames(old_document)),
+        frame_hashes(get_top_level_frames(new_document)),
+    )
+
+
+def diff_cached_versions(cache, file_key, old_version, new_version):
+    """
+    diff_documents for two versions held in the DiskCache. Returns None if
+    either version is not cached.
+    """
+    old = cache.get('files', f"{file_key}@{old_version}")
+    new = cache.get('files', f"{file_key}@{new_version}")
+    if old is None or new is None:
+        return None
+    return diff_documents(old['document'], new['document'])
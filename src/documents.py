@@ -0,0 +1,181 @@
+"""
+Process-wide store of loaded documents, shared across sessions.
+
+Every Streamlit session used to hold its own copy of the file JSON, so ten
+people opening one big file meant ten trees in memory. The store keeps one
+tree per (file key, version, kind) and hands out leases on it:
+
+    lease = get_document_store().acquire(client, file_key)
+    data = lease.data  # shared, treat as read-only
+    analysis = lease.derived('analysis', lambda: DocumentAnalysis(data['document']))
+
+Access is still checked per token: acquire() asks the caller's client for
+the file's current version (a cheap depth=1 probe, see
+FigmaClient.get_file_version), which fails for a token without access
+before anything is served. Leases are reference counted and released when
+dropped (or by release()); documents nobody holds are kept for reuse up to
+max_idle and then evicted, least recently used first. Values derived from
+a document (its analysis, search index) are built once per entry through
+lease.derived() and dropped with it.
+"""
+import threading
+import time
+import weakref
+
+from src.metrics import get_metrics
+
+DEFAULT_MAX_IDLE = 4
+
+
+class DocumentLease:
+    """
+    A reference to a shared document. `data` is whatever the loader
+    returned; don't mutate it, other sessions see the same object.
+    """
+
+    def __init__(self, store, key, entry):
+        self.key = key
+        self.data = entry.data
+        self._entry = entry
+        # Released when the lease is garbage collected, e.g. with its session
+        self._finalizer = weakref.finalize(self, store._release, key)
+
+    def derived(self, name, build):
+        """
+        build() run once per stored document and shared by every lease on
+        it, e.g. the document's analysis. Evicting the document drops it.
+        """
+        entry = self._entry
+        if entry is None:
+            raise ValueError(f"Lease on {self.key} was released")
+        with entry.lock:
+            if name not in entry.derived:
+                entry.derived[name] = build()
+            return entry.derived[name]
+
+    def release(self):
+        # A released lease must not keep an evicted document alive
+        self._entry = None
+        self._finalizer()
+
+    @property
+    def released(self):
+        return not self._finalizer.alive
+
+
+class _Entry:
+    __slots__ = ('data', 'refs', 'last_used', 'derived', 'lock')
+
+    def __init__(self, data):
+        self.data = data
+        self.refs = 0
+        self.last_used = time.time()
+        self.derived = {} # name -> value built by DocumentLease.derived
+        # Serializes derived builds, so sessions don't build the same one twice
+        self.lock = threading.Lock()
+
+
+class DocumentStore:
+    """
+    See the module docstring.
+    max_idle: unreferenced documents kept around for the next session
+    """
+
+    def __init__(self, max_idle=DEFAULT_MAX_IDLE):
+        self.max_idle = max_idle
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self._entries = {} # (file_key, version, kind) -> _Entry
+        self._loading = {} # key -> lock held while the document loads
+        self._lock = threading.Lock()
+
+    def acquire(self, client, file_key, kind='full', load=None):
+        """
+        Lease on the current version of file_key, loading it on a miss.
+
+        kind: distinguishes differently prepared trees of one version
+              ('full', 'compact', 'streamed', ...)
+        load: callable returning the document, default client.get_file
+        """
+        # The version probe doubles as the access check for this token
+        version = client.get_file_version(file_key)
+        key = (file_key, version, kind)
+        entry = self._get(key)
+        if entry is None:
+            with self._loading_lock(key):
+                # Someone else may have finished loading while we waited
+                entry = self._get(key)
+                if entry is None:
+                    data = load() if load is not None else client.get_file(file_key)
+                    entry = self._put(key, data)
+        return DocumentLease(self, key, entry)
+
+    def _loading_lock(self, key):
+        with self._lock:
+            return self._loading.setdefault(key, threading.Lock())
+
+    def _get(self, key):
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None:
+                entry.refs += 1
+                entry.last_used = time.time()
+                self.hits += 1
+            get_metrics().incr('document_store_requests_total', result="hit" if entry else "miss")
+            return entry
+
+    def _put(self, key, data):
+        with self._lock:
+            entry = self._entries[key] = _Entry(data)
+            entry.refs = 1
+            self.misses += 1
+            self._loading.pop(key, None)
+            self._evict()
+            return entry
+
+    def _release(self, key):
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None and entry.refs > 0:
+                entry.refs -= 1
+                entry.last_used = time.time()
+                self._evict()
+
+    def _evict(self):
+        # Caller holds self._lock
+        idle = sorted((entry.last_used, key) for key, entry in self._entries.items() if entry.refs == 0)
+        for _, key in idle[:max(0, len(idle) - self.max_idle)]:
+            del self._entries[key]
+            self.evictions += 1
+            get_metrics().incr('document_store_evictions_total')
+
+    def clear(self):
+        """
+        Drop unreferenced documents now.
+        """
+        with self._lock:
+            for key in [key for key, entry in self._entries.items() if entry.refs == 0]:
+                del self._entries[key]
+                self.evictions += 1
+
+    def stats(self):
+        with self._lock:
+            return {'documents': len(self._entries),
+                    'leases': sum(entry.refs for entry in self._entries.values()),
+                    'hits': self.hits, 'misses': self.misses, 'evictions': self.evictions}
+
+
+_default_store = None
+_default_lock = threading.Lock()
+
+
+def get_document_store(max_idle=DEFAULT_MAX_IDLE):
+    """
+    Process-wide store, shared by every Streamlit session.
+    """
+    global _default_store
+    with _default_lock:
+        if _default_store is None:
+            _default_store = DocumentStore(max_idle=max_idle)
+        return _default_store
@@ -0,0 +1,626 @@
+import concurrent.futures
+import json
+import os
+import pickle
+import re
+import tempfile
+import threading
+import time
+import uuid
+import zipfile
+
+import src.parser as parser
+from src.cache import get_default_blob_store
+from src.diff import diff_frame_hashes, frame_hashes
+from src.images import extension_for
+from src.metrics import get_metrics
+from src.palette import build_palette
+from src.transport import get_transport
+
+EXPORT_DIR = os.path.join(tempfile.gettempdir(), "figma-to-code-exports")
+# Finished archives are kept this long so the download button can serve them
+EXPORT_MAX_AGE = 3600
+
+# Written into every archive so a later export can reuse unchanged frames
+EXPORT_STATE = "export_state.json"
+
+# Entries that are already compressed are stored as-is; deflating them
+# again costs CPU and gains nothing
+ALREADY_COMPRESSED = ('.png', '.jpg', '.jpeg', '.gif', '.webp', '.avif', '.zip', '.gz')
+
+
+def cleanup_exports(export_dir=EXPORT_DIR, max_age=EXPORT_MAX_AGE):
+    """
+    Delete archives left over from earlier exports.
+    """
+    if not os.path.isdir(export_dir):
+        return
+    now = time.time()
+    for name in os.listdir(export_dir):
+        path = os.path.join(export_dir, name)
+        try:
+            if now - os.path.getmtime(path) > max_age:
+                os.remove(path)
+        except OSError:
+            continue
+
+
+class ZipExportWriter:
+    """
+    Writes export entries straight into a ZIP file on disk as they become
+    available, so memory use does not grow with the size of the export.
+    Safe to call from download worker threads.
+    """
+
+    def __init__(self, path=None, export_dir=EXPORT_DIR):
+        if path is None:
+            os.makedirs(export_dir, exist_ok=True)
+            cleanup_exports(export_dir)
+            path = os.path.join(export_dir, f"figma_export_{uuid.uuid4().hex}.zip")
+        self.path = path
+        self.entries = 0
+        self.bytes_written = 0
+        self._lock = threading.Lock()
+        self._zf = zipfile.ZipFile(self.path, "w", compression=zipfile.ZIP_DEFLATED)
+
+    def writestr(self, name, data):
+        compress_type = zipfile.ZIP_STORED if name.lower().endswith(ALREADY_COMPRESSED) else zipfile.ZIP_DEFLATED
+        with self._lock:
+            self._zf.writestr(name, data, compress_type=compress_type)
+            self.entries += 1
+            self.bytes_written += len(data)
+
+    def close(self):
+        with self._lock:
+            self._zf.close()
+        return self.path
+
+    def size(self):
+        return os.path.getsize(self.path)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        self.close()
+        if exc_type is not None and os.path.exists(self.path):
+            os.remove(self.path)
+        return False
+
+
+def threaded_download_many(urls, transport=None, max_workers=32, timeout=(5, 30)):
+    """
+    Download {key: url} on a thread pool over the shared transport.
+    Yields (key, bytes or None) as each download finishes.
+    """
+    transport = transport or get_transport()
+
+    def _download(key):
+        try:
+            resp = transport.get(urls[key], timeout=timeout)
+            if resp.status_code == 200:
+                return key, resp.content
+            print(f"Failed to download {key}: Status {resp.status_code}")
+        except Exception as e:
+            print(f"Error downloading {key}: {e}")
+        return key, None
+
+    if not urls:
+        return
+    with concurrent.futures.ThreadPoolExecutor(max_workers=max_workers) as executor:
+        for future in concurrent.futures.as_completed([executor.submit(_download, key) for key in urls]):
+            yield future.result()
+
+
+def export_assets(images, image_urls, writer, blob_store, transport=None,
+                  max_workers=32, progress=None, prefix="images", download_many=None,
+                  image_processor=None):
+    """
+    Download every distinct image fill once and write it once.
+
+    images: image dicts from the parser ({'id', 'name', 'image_ref'})
+    image_urls: imageRef -> URL map from FigmaClient.get_image_fills
+    writer: ZipExportWriter (or anything with writestr)
+    blob_store: BlobStore; refs already in it are not downloaded again
+    progress: optional callback(completed, total)
+    download_many: callable({key: url}) yielding (key, bytes or None);
+                   defaults to threaded_download_many
+    image_processor: optional images.ImageProcessor to transcode/resize
+                     assets as they download
+
+    Assets are written under <prefix>/<content hash>.<real extension>
+    (plus an @1x variant if the processor makes one; @2x is the main file)
+    and <prefix>/manifest.json maps every node ID to its asset file.
+    Returns the manifest dict.
+    """
+    if download_many is None:
+        download_many = lambda urls: threaded_download_many(urls, transport, max_workers)
+
+    nodes_by_ref = {}
+    missing = []
+    for img in images:
+        ref = img.get('image_ref')
+        if ref and ref in image_urls:
+            nodes_by_ref.setdefault(ref, []).append(img)
+        else:
+            missing.append(img['id'])
+
+    def _fetched():
+        # Refs already in the blob store are not downloaded again
+        to_download = {}
+        for ref in nodes_by_ref:
+            digest = blob_store.lookup(ref)
+            if digest is None:
+                to_download[ref] = image_urls[ref]
+            else:
+                yield ref, digest, blob_store.read(digest)
+        for ref, data in download_many(to_download):
+            yield ref, (blob_store.put(data, ref=ref) if data is not None else None), data
+
+    def _processed():
+        # (ref, source digest or None, [(suffix, extension, bytes)])
+        if image_processor is None:
+            for ref, digest, data in _fetched():
+                yield ref, digest, [("", extension_for(data), data)] if digest is not None else []
+            return
+        digests = {}
+        failed = []
+
+        def _downloaded():
+            for ref, digest, data in _fetched():
+                if digest is None:
+                    failed.append(ref)
+                else:
+                    digests[ref] = digest
+                    yield ref, data
+        for ref, outputs in image_processor.process_many(_downloaded()):
+            yield ref, digests[ref], outputs
+        for ref in failed:
+            yield ref, None, []
+
+    manifest = {'assets': {}, 'files': {}, 'missing': missing}
+    total = len(nodes_by_ref)
+    completed = 0
+    for ref, digest, outputs in _processed():
+        if digest is None:
+            manifest['missing'].extend(img['id'] for img in nodes_by_ref[ref])
+        else:
+            names = {}
+            for suffix, ext, content in outputs:
+                filename = f"{prefix}/{digest[:16]}{suffix}.{ext}"
+                names[suffix] = filename
+                if filename not in manifest['files']:
+                    writer.writestr(filename, content)
+                    manifest['files'][filename] = {'sha256': digest, 'image_refs': []}
+                manifest['files'][filename]['image_refs'].append(ref)
+            for img in nodes_by_ref[ref]:
+                manifest['assets'][img['id']] = {
+                    'name': img['name'],
+                    'image_ref': ref,
+                    'file': names[""],
+                }
+                if len(names) > 1:
+                    variants = {suffix.lstrip('@'): name for suffix, name in names.items() if suffix}
+                    # The source is taken as 2x, so @2x is the main file, not a copy of it
+                    variants.setdefault('2x', names[""])
+                    manifest['assets'][img['id']]['variants'] = variants
+        completed += 1
+        if progress:
+            progress(completed, total)
+
+    writer.writestr(f"{prefix}/manifest.json", json.dumps(manifest, indent=2))
+    return manifest
+
+
+def safe_filename(name):
+    return re.sub(r'[^a-zA-Z0-9_-]', '', name)
+
+
+def frame_file_stems(frames):
+    """
+    frame id -> file name stem. Frames can share a name, so the ID is
+    appended to names used by more than one frame.
+    """
+    counts = {}
+    for frame in frames:
+        counts[frame['name']] = counts.get(frame['name'], 0) + 1
+    stems = {}
+    for frame in frames:
+        stem = safe_filename(frame['name'])
+        if counts[frame['name']] > 1:
+            stem = f"{stem}_{frame['id'].replace(':', '-')}"
+        stems[frame['id']] = stem
+    return stems
+
+
+def screen_image_name(frame, ext="png"):
+    safe_id = frame['id'].replace(':', '-')
+    return f"screens/images/{safe_filename(frame['name'])}_{safe_id}.{ext}"
+
+
+def write_tokens(analysis, writer):
+    """
+    colors.json and typography.json for the whole document.
+    """
+    # Ranked, with near-duplicates merged (see src.palette)
+    writer.writestr("colors.json", json.dumps(build_palette(analysis.color_usage), indent=2))
+    writer.writestr("typography.json", json.dumps(list(analysis.text_styles), indent=2))
+
+
+# Per worker process, so identical blocks are built once across all the
+# frames a worker handles
+_worker_memo = None
+
+
+def _shared_frame_css(frame, memo=None):
+    """
+    extract_css_shared for one frame. Returns (css, cache hits, cache misses)
+    so hit rates can be summed across worker processes.
+    """
+    global _worker_memo
+    if memo is None:
+        if _worker_memo is None:
+            _worker_memo = parser.CSSMemo()
+        memo = _worker_memo
+    hits, misses = memo.hits, memo.misses
+    css = parser.extract_css_shared(frame, memo)
+    return css, memo.hits - hits, memo.misses - misses
+
+
+def generate_frames_css(frames, workers=None, shared=False, stats=None):
+    """
+    Yield (frame, css) for each frame, in order. CSS generation is pure
+    CPU work, so frames are spread over a process pool when there is more
+    than one of them.
+
+    shared: one rule per distinct declaration block (see
+            parser.extract_css_shared) instead of one per node
+    stats: optional dict; css_cache_hits / css_cache_misses are added to it
+    """
+    if stats is not None:
+        stats.setdefault('css_cache_hits', 0)
+        stats.setdefault('css_cache_misses', 0)
+
+    def _result(css):
+        if not shared:
+            return css
+        css, hits, misses = css
+        if stats is not None:
+            stats['css_cache_hits'] += hits
+            stats['css_cache_misses'] += misses
+        return css
+
+    workers = workers or os.cpu_count() or 1
+    if workers <= 1 or len(frames) < 2:
+        memo = parser.CSSMemo()
+        for frame in frames:
+            yield frame, _result(_shared_frame_css(frame, memo) if shared else parser.extract_css_recursive(frame))
+        return
+    generate = _shared_frame_css if shared else parser.extract_css_recursive
+    # For frames generated here: a local memo, since _worker_memo in this
+    # (long-lived) process would pin every exported document's styles
+    fallback_memo = parser.CSSMemo()
+    with concurrent.futures.ProcessPoolExecutor(max_workers=min(workers, len(frames))) as executor:
+        futures = [executor.submit(generate, frame) for frame in frames]
+        for frame, future in zip(frames, futures):
+            try:
+                css = future.result()
+            except (RecursionError, pickle.PicklingError):
+                # Pickling recurses, so very deep frames can't be sent to a
+                # worker; walk() has no such limit, so generate those here
+                css = _shared_frame_css(frame, fallback_memo) if shared else parser.extract_css_recursive(frame)
+            yield frame, _result(css)
+
+
+def render_ref(file_key, version, node_id, scale=1, format='png'):
+    """
+    Blob store ref for a node render. A render is only reused for the same
+    file version: subtree hashes (src.diff) only cover what the CSS reads,
+    and many edits that change a render (strokes, vectors, auto-layout,
+    component edits) are outside that.
+    """
+    return f"render:{file_key}@{version}:{node_id}:{format}@{scale}"
+
+
+def export_screens(client, file_key, frames, writer, scale=1, transport=None,
+                   max_workers=10, progress=None, download_many=None, image_processor=None,
+                   blob_store=None, render_refs=None, stats=None):
+    """
+    Render frames through the images endpoint and write them under
+    screens/images/ (re-encoded by image_processor, if given).
+
+    blob_store / render_refs: {frame id: render_ref(...)}; frames already in
+                              the store (e.g. from src.prefetch) are not
+                              rendered again, new renders are added to it
+    stats: optional dict; screens_cached is added to it
+
+    Returns ({id: filename} written, {id: reason} failed).
+    """
+    if download_many is None:
+        download_many = lambda urls: threaded_download_many(urls, transport, max_workers)
+    if not frames:
+        return {}, {}
+    render_refs = render_refs if blob_store is not None else None
+    cached = {}
+    for frame in frames:
+        ref = render_refs.get(frame['id']) if render_refs else None
+        digest = blob_store.lookup(ref) if ref else None
+        if digest is not None:
+            cached[frame['id']] = digest
+    if stats is not None:
+        stats['screens_cached'] = stats.get('screens_cached', 0) + len(cached)
+
+    to_render = [f['id'] for f in frames if f['id'] not in cached]
+    rendered_data = client.get_images(file_key, to_render, scale=scale) if to_render else {}
+    failed = dict(rendered_data.get('failed', {}))
+    urls = rendered_data.get('images', {})
+    frames_by_id = {f['id']: f for f in frames}
+    to_download = {frame_id: urls[frame_id] for frame_id in to_render if frame_id in urls}
+
+    def _all_downloads():
+        for frame_id, digest in cached.items():
+            yield frame_id, blob_store.read(digest)
+        for frame_id, content in download_many(to_download):
+            if content is not None and render_refs and frame_id in render_refs:
+                blob_store.put(content, ref=render_refs[frame_id])
+            yield frame_id, content
+
+    written = {}
+    completed = 0
+
+    def _done():
+        nonlocal completed
+        completed += 1
+        if progress:
+            progress(completed, len(cached) + len(to_download))
+
+    downloads = _all_downloads()
+    if image_processor is not None:
+        raw_downloads = downloads
+
+        def _ok():
+            for frame_id, content in raw_downloads:
+                if content is None:
+                    # Never reaches the loop below, so count it here
+                    failed.setdefault(frame_id, "Download failed")
+                    _done()
+                else:
+                    yield frame_id, content
+        # Screens already have a render scale, so only the main output is kept
+        downloads = ((frame_id, outputs[0][2]) for frame_id, outputs in image_processor.process_many(_ok()))
+
+    for frame_id, content in downloads:
+        frame = frames_by_id[frame_id]
+        if content is None:
+            failed.setdefault(frame_id, "Download failed")
+        else:
+            written[frame_id] = screen_image_name(frame, extension_for(content))
+            writer.writestr(written[frame_id], content)
+        _done()
+    return written, failed
+
+
+def images_in_frames(analysis, frame_ids):
+    """
+    Image-fill nodes inside the given top-level frames, one entry per node.
+    """
+    images = []
+    seen_ids = set()
+    for frame_id in frame_ids:
+        for img in analysis.images_for_frame(frame_id):
+            if img['id'] not in seen_ids:
+                images.append(img)
+                seen_ids.add(img['id'])
+    return images
+
+
+def read_export_state(path):
+    """
+    The export_state.json of a previous archive, or None.
+    """
+    try:
+        with zipfile.ZipFile(path) as zf:
+            return json.loads(zf.read(EXPORT_STATE))
+    except (OSError, KeyError, ValueError, zipfile.BadZipFile):
+        return None
+
+
+def export_file(client, file_key, analysis, writer, frame_ids=None, image_urls=None,
+                include_images=True, scale=1, blob_store=None, css_workers=None,
+                download_workers=32, on_status=None, on_progress=None, download_many=None,
+                previous_export=None, shared_css=False, image_processor=None, version=None):
+    """
+    The full Bulk Export for one file: tokens, CSS per frame, rendered
+    screens and image assets, all written to `writer`.
+
+    frame_ids: top-level frames to export (default: all of them)
+    image_urls: imageRef -> URL map; assets are skipped without it
+    on_status(text) / on_progress(stage, completed, total): UI callbacks
+    download_many: optional downloader shared by screens and assets, e.g.
+                   AsyncFigmaClient.download_many through the sync bridge
+    previous_export: path of an earlier archive of this file. CSS of frames
+                     whose subtree hash is unchanged is copied from it
+                     instead of regenerated. The hash only covers what the
+                     CSS reads, so screen images are only copied when the
+                     file version is the same as well.
+    shared_css: write each distinct declaration block once per frame file
+                with the node classes that use it instead of one rule per
+                node. Smaller CSS, but slower to generate.
+    image_processor: optional images.ImageProcessor for screens and assets
+                     (screens skip its @1x/@2x variants)
+    version: the file version `analysis` was built from (data['version']);
+             without it, no screen images are reused, from a previous
+             export or from renders stored in the blob store
+
+    Returns a stats dict with per-stage counts, bytes and seconds.
+    """
+    on_status = on_status or (lambda text: None)
+    if frame_ids is None:
+        frame_ids = [f['id'] for f in analysis.frames]
+    frames = [analysis.index.get(frame_id) for frame_id in frame_ids]
+    stems = frame_file_stems(analysis.frames)
+
+    stats = {'frames': len(frames)}
+    start = time.time()
+    metrics = get_metrics()
+
+    with metrics.span('export_stage', stage='hash'):
+        hashes = frame_hashes(frames)
+    image_options = image_processor.options if image_processor is not None else None
+    screens_processor = image_processor.without_variants() if image_processor is not None else None
+    state = {'file_key': file_key, 'version': version, 'scale': scale, 'shared_css': shared_css,
+             'image_options': image_options, 'frame_hashes': hashes,
+             'frames': {frame_id: {} for frame_id in frame_ids}}
+    reuse = {}
+    previous_state = read_export_state(previous_export) if previous_export else None
+    previous_zip = None
+    if previous_state and previous_state.get('file_key') == file_key:
+        changes = diff_frame_hashes(previous_state['frame_hashes'], hashes)
+        reuse = {frame_id: previous_state['frames'].get(frame_id, {}) for frame_id in changes['unchanged']}
+        previous_zip = zipfile.ZipFile(previous_export)
+        stats['changed_frames'] = len(changes['changed']) + len(changes['added'])
+        stats['reused_frames'] = len(reuse)
+
+    def _copy_previous(frame_id, kind, name):
+        old_name = reuse.get(frame_id, {}).get(kind)
+        if old_name is None:
+            return False
+        try:
+            writer.writestr(name, previous_zip.read(old_name))
+        except KeyError:
+            return False
+        state['frames'][frame_id][kind] = name
+        return True
+
+    try:
+        with metrics.span('export_stage', stage='tokens'):
+            write_tokens(analysis, writer)
+
+        stage_start, stage_bytes = time.time(), writer.bytes_written
+        to_generate = []
+        # CSS written in the other layout can't be reused
+        css_reusable = bool(previous_state) and previous_state.get('shared_css', False) == shared_css
+        for frame in frames:
+            if not (css_reusable and _copy_previous(frame['id'], 'css', f"screens/css/{stems[frame['id']]}.css")):
+                to_generate.append(frame)
+        on_status(f"Generating CSS for {len(to_generate)} screens...")
+        for done, (frame, css_content) in enumerate(generate_frames_css(to_generate, css_workers, shared_css, stats), 1):
+            name = f"screens/css/{stems[frame['id']]}.css"
+            writer.writestr(name, css_content)
+            state['frames'][frame['id']]['css'] = name
+            if on_progress:
+                on_progress('css', done, len(to_generate))
+        stats['css_frames'] = len(to_generate)
+        stats['css_seconds'] = time.time() - stage_start
+        stats['css_bytes'] = writer.bytes_written - stage_bytes
+
+        stats['failed_screens'] = {}
+        if include_images:
+            stage_start, stage_bytes = time.time(), writer.bytes_written
+            # Renders are reusable only if made from the same file version (edits
+            # outside the CSS properties change them too), at the same scale
+            # and with the same image processing
+            images_reusable = bool(previous_state) and version is not None and \
+                previous_state.get('version') == version and previous_state.get('scale') == scale and \
+                previous_state.get('image_options') == image_options
+            to_render = []
+            for frame in frames:
+                old_name = reuse.get(frame['id'], {}).get('image') or ''
+                ext = os.path.splitext(old_name)[1].lstrip('.') or 'png'
+                if images_reusable and _copy_previous(frame['id'], 'image', screen_image_name(frame, ext)):
+                    continue
+                to_render.append(frame)
+            on_status(f"Rendering and downloading {len(to_render)} screen images...")
+            written, stats['failed_screens'] = export_screens(
+                client, file_key, to_render, writer, scale=scale,
+                max_workers=min(download_workers, 10), download_many=download_many,
+                progress=(lambda done, total: on_progress('screens', done, total)) if on_progress else None,
+                image_processor=screens_processor,
+                # Renders fetched earlier for this version (see src.prefetch) are
+                # packaged from disk
+                blob_store=blob_store or get_default_blob_store(),
+                render_refs={frame['id']: render_ref(file_key, version, frame['id'], scale) for frame in to_render}
+                            if version is not None else None,
+                stats=stats,
+            )
+            for frame_id, name in written.items():
+                state['frames'][frame_id]['image'] = name
+            stats['screens'] = len(frames) - len(stats['failed_screens'])
+            stats['screens_seconds'] = time.time() - stage_start
+            stats['screens_bytes'] = writer.bytes_written - stage_bytes
+    finally:
+        if previous_zip is not None:
+            previous_zip.close()
+
+    images = images_in_frames(analysis, frame_ids)
+    if images and image_urls:
+        on_status(f"Downloading unique images for {len(images)} nodes (Parallel)...")
+        stage_start, stage_bytes = time.time(), writer.bytes_written
+        # Each imageRef is fetched once (or read from the local blob store)
+        # and written once; images/manifest.json maps node IDs to files
+        manifest = export_assets(
+            images, image_urls, writer, blob_store or get_default_blob_store(),
+            max_workers=download_workers, download_many=download_many,
+            progress=(lambda done, total: on_progress('assets', done, total)) if on_progress else None,
+            image_processor=image_processor,
+        )
+        stats['assets'] = len(manifest['files'])
+        stats['assets_seconds'] = time.time() - stage_start
+        stats['assets_bytes'] = writer.bytes_written - stage_bytes
+
+    if image_processor is not None:
+        processors = {id(p): p for p in (image_processor, screens_processor)}.values()
+        stats['images_processed'] = sum(p.misses for p in processors)
+        stats['images_cached'] = sum(p.hits for p in processors)
+
+    writer.writestr(EXPORT_STATE, json.dumps(state, indent=2))
+    stats['total_seconds'] = time.time() - start
+    record_export_metrics(stats, metrics)
+    return stats
+
+
+def record_export_metrics(stats, metrics=None):
+    """
+    Copy an export's stage timings, bytes and cache counts into metrics.
+    """
+    metrics = metrics or get_metrics()
+    for stage in ('css', 'screens', 'assets'):
+        if stats.get(f'{stage}_seconds') is not None:
+            metrics.observe('export_stage', stats[f'{stage}_seconds'], stage=stage)
+            metrics.incr('export_bytes_total', stats[f'{stage}_bytes'], stage=stage)
+    metrics.observe('export', stats['total_seconds'])
+    metrics.incr('export_frames_total', stats['frames'])
+    if stats.get('reused_frames'):
+        metrics.incr('export_reused_frames_total', stats['reused_frames'])
+    for result, key in (('hit', 'css_cache_hits'), ('miss', 'css_cache_misses')):
+        if stats.get(key):
+            metrics.incr('css_cache_total', stats[key], result=result)
+    for result, key in (('hit', 'images_cached'), ('miss', 'images_processed')):
+        if stats.get(key):
+            metrics.incr('image_processing_total', stats[key], result=result)
+    if stats.get('screens_cached'):
+        metrics.incr('export_screens_cached_total', stats['screens_cached'])
+
+
+def format_stats(stats):
+    """
+    One-line throughput summary for a stats dict from export_file.
+    """
+    parts = [f"{stats['frames']} frames in {stats['total_seconds']:.2f}s"]
+    if stats.get('reused_frames') is not None:
+        parts.append(f"{stats['changed_frames']} changed, {stats['reused_frames']} reused")
+    if stats.get('css_frames') and stats.get('css_seconds'):
+        parts.append(f"CSS {stats['css_frames'] / stats['css_seconds']:.1f} frames/s")
+    css_lookups = stats.get('css_cache_hits', 0) + stats.get('css_cache_misses', 0)
+    if css_lookups:
+        parts.append(f"CSS cache {stats['css_cache_hits'] / css_lookups:.0%} hits")
+    if stats.get('images_processed') or stats.get('images_cached'):
+        parts.append(f"images {stats['images_processed']} processed, {stats['images_cached']} from cache")
+    if stats.get('screens_cached'):
+        parts.append(f"{stats['screens_cached']} renders from cache")
+    for stage in ('screens', 'assets'):
+        seconds = stats.get(f'{stage}_seconds')
+        if seconds:
+            mb = stats[f'{stage}_bytes'] / 1024 / 1024
+            parts.append(f"{stats[stage]} {stage} {mb:.1f} MB at {mb / seconds:.1f} MB/s")
+    return ", ".join(parts)
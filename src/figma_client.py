@@ -1,47 +1,235 @@
-import requests
-import os
+import concurrent.futures
+import copy
+import re
 import time
 
+import requests
+
+from src.metrics import get_metrics
+from src.rate_limit import get_rate_limiter
+from src.transport import get_transport
+
+# Signed S3 URLs from /images expire on Figma's side, so cached maps of
+# them are only trusted for a while
+IMAGE_FILLS_MAX_AGE = 24 * 3600
+RENDERS_MAX_AGE = 7 * 24 * 3600
+# How long a version probe result is trusted before revalidating
+VERSION_TTL = 60
+API_BASE_URL = "https://api.figma.com/v1"
+
+def parse_file_key(url):
+    # Support both old /file/ and new /design/ URLs
+    # Also sometimes it is /proto/ for prototypes
+    match = re.search(r"(?:file|design|proto)/([a-zA-Z0-9]+)/", url)
+    if match:
+        return match.group(1)
+    return None
+
+def merge_chunk_result(merged, chunk, data, error, result_key):
+    """
+    Fold one chunk's response (or error) into a fan-out result of the form
+    {result_key: {id: ...}, 'failed': {id: reason}, ...}.
+    """
+    if error is not None:
+        print(f"Error fetching {len(chunk)} {result_key}: {error}")
+        for node_id in chunk:
+            merged['failed'][node_id] = str(error)
+        return
+    if data.get('err'):
+        for node_id in chunk:
+            merged['failed'][node_id] = data['err']
+        return
+    # Keep top-level metadata (name, lastModified, ...) from the first chunk
+    for key, value in data.items():
+        if key not in (result_key, 'err'):
+            merged.setdefault(key, value)
+    results = data.get(result_key) or {}
+    for node_id in chunk:
+        if results.get(node_id) is None:
+            merged['failed'][node_id] = "Not returned by Figma"
+        else:
+            merged[result_key][node_id] = results[node_id]
+
+def chunk_ids(ids, chunk_size):
+    ids = list(dict.fromkeys(ids)) # de-duplicate, keep order
+    return [ids[i:i + chunk_size] for i in range(0, len(ids), chunk_size)]
+
 class FigmaClient:
-    def __init__(self, token):
-        self.base_url = "https://api.figma.com/v1"
+    def __init__(self, token, transport=None, rate_limiter=None,
+                 max_concurrency=8, nodes_chunk_size=100, images_chunk_size=50,
+                 cache=None, base_url=API_BASE_URL):
+        # Overridable so benchmarks can point at a local mock server
+        self.base_url = base_url.rstrip("/")
         self.headers = {
             "X-Figma-Token": token
         }
+        # Pooled connections with retry/backoff on 429 and 5xx
+        self.transport = transport or get_transport()
+        # Paces calls per endpoint cost before Figma has to send a 429
+        self.rate_limiter = rate_limiter or get_rate_limiter(token)
+        # Large ID lists are split into chunks fetched concurrently, both to
+        # stay under URL length limits and to avoid render timeouts
+        self.max_concurrency = max_concurrency
+        self.nodes_chunk_size = nodes_chunk_size
+        self.images_chunk_size = images_chunk_size
+        # Optional DiskCache; entries are keyed by file key and version
+        self.cache = cache
+        self._versions = {} # file_key -> (version, checked_at)
+
+    def _get(self, endpoint, url, **kwargs):
+        self.rate_limiter.acquire(endpoint)
+        get_metrics().incr('api_calls_total', endpoint=endpoint)
+        return self.transport.get(url, headers=self.headers, **kwargs)
 
-    def get_file(self, file_key):
+    def _get_json(self, endpoint, url):
+        metrics = get_metrics()
+        with metrics.span('api_request', endpoint=endpoint):
+            response = self._get(endpoint, url)
+            response.raise_for_status()
+        with metrics.span('json_decode', endpoint=endpoint):
+            return response.json()
+
+    def rate_limit_status(self):
+        return self.rate_limiter.status()
+
+    def with_rate_limiter(self, rate_limiter):
+        """
+        Copy of this client (same token, transport and cache) that paces its
+        calls with another limiter, e.g. RateLimiter.background().
+        """
+        clone = copy.copy(self)
+        clone.rate_limiter = rate_limiter
+        return clone
+
+    def _fan_out(self, ids, chunk_size, fetch_chunk, result_key):
+        """
+        Run fetch_chunk over chunks of ids concurrently and merge the
+        `result_key` maps. IDs from failed chunks, or that came back empty,
+        are reported in result['failed'] as {id: reason} instead of
+        failing the whole batch.
+        """
+        chunks = chunk_ids(ids, chunk_size)
+        merged = {result_key: {}, 'failed': {}}
+
+        def _run(chunk):
+            try:
+                return chunk, fetch_chunk(chunk), None
+            except requests.exceptions.RequestException as e:
+                return chunk, None, e
+
+        workers = max(1, min(self.max_concurrency, len(chunks)))
+        with concurrent.futures.ThreadPoolExecutor(max_workers=workers) as executor:
+            for chunk, data, error in executor.map(_run, chunks):
+                merge_chunk_result(merged, chunk, data, error, result_key)
+
+        merged['err'] = None
+        return merged
+
+    def get_file_version(self, file_key):
+        """
+        Cheap revalidation probe: a depth=1 fetch returns the file's current
+        version without the document tree. Also checks this token can
+        still read the file before anything is served from cache.
+        """
+        known = self._versions.get(file_key)
+        if known and time.time() - known[1] < VERSION_TTL:
+            return known[0]
+        url = f"{self.base_url}/files/{file_key}?depth=1"
+        version = self._get_json('files', url).get('version')
+        self._versions[file_key] = (version, time.time())
+        return version
+
+    def get_file(self, file_key, depth=None):
         """
         Fetches the Figma file content.
+        depth: only return the tree down to this depth (2 = pages and their
+               top-level frames), for a quick outline of huge files.
+        With a cache, the file is only downloaded when its version changed.
         """
+        suffix = f":depth{depth}" if depth else ""
+        if self.cache is not None:
+            version = self.get_file_version(file_key)
+            cached = self.cache.get('files', f"{file_key}@{version}{suffix}")
+            if cached is not None:
+                return cached
+
         url = f"{self.base_url}/files/{file_key}"
+        if depth:
+            url += f"?depth={depth}"
         # Let app.py handle exceptions so we can show them to user
-        response = requests.get(url, headers=self.headers)
-        
-        # Simple retry logic for 429
-        if response.status_code == 429:
-             retry_after = int(response.headers.get("Retry-After", 60))
-             print(f"Rate limited. Waiting {retry_after} seconds...")
-             time.sleep(retry_after)
-             # Retry once
-             response = requests.get(url, headers=self.headers)
-             
-        response.raise_for_status()
-        return response.json()
+        data = self._get_json('files', url)
+
+        if self.cache is not None:
+            version = data.get('version')
+            self._versions[file_key] = (version, time.time())
+            self.cache.set('files', f"{file_key}@{version}{suffix}", data)
+        return data
+
+    def get_file_streaming(self, file_key, keep_tree=True):
+        """
+        Like get_file, but parses the response incrementally and analyses
+        nodes as they arrive. Only the node properties the parser uses are
+        kept; with keep_tree=False the tree itself is dropped as well.
+        Returns (data, DocumentAnalysis). Requires ijson.
+        """
+        # Imported here so the client works without ijson installed
+        from src.streaming import TeeReader, parse_file_stream
+
+        cache_key = None
+        if self.cache is not None:
+            cache_key = f"{file_key}@{self.get_file_version(file_key)}"
+            cached = self.cache.open('files', cache_key)
+            if cached is not None:
+                with cached, get_metrics().span('stream_parse', endpoint='cache'):
+                    return parse_file_stream(cached, prefix='value', keep_tree=keep_tree)
+
+        url = f"{self.base_url}/files/{file_key}"
+        metrics = get_metrics()
+        response = self._get('files', url, stream=True)
+        with response, metrics.span('stream_parse', endpoint='files'):
+            response.raise_for_status()
+            response.raw.decode_content = True
+            if cache_key is None:
+                reader = TeeReader(response.raw)
+                result = parse_file_stream(reader, keep_tree=keep_tree)
+            else:
+                # Parse and write the raw bytes to the disk cache in the same pass
+                with self.cache.writer('files', cache_key) as sink:
+                    reader = TeeReader(response.raw, sink)
+                    result = parse_file_stream(reader, keep_tree=keep_tree)
+                    # Copy any trailing bytes the parser did not need
+                    while reader.read(64 * 1024):
+                        pass
+            metrics.incr('http_bytes_total', reader.bytes_read, host="api")
+            return result
 
     def get_file_nodes(self, file_key, ids):
         """
         Fetches specific nodes from a file.
         ids: list of node IDs (strings)
+        Returns {'nodes': {id: ...}, 'failed': {id: reason}, ...}
+        With a cache, each subtree is stored per file version and node ID.
         """
-        ids_str = ",".join(ids)
-        url = f"{self.base_url}/files/{file_key}/nodes?ids={ids_str}"
-        try:
-            response = requests.get(url, headers=self.headers)
-            response.raise_for_status()
-            return response.json()
-        except requests.exceptions.RequestException as e:
-            print(f"Error fetching nodes: {e}")
-            return None
+        def _fetch(chunk):
+            ids_str = ",".join(chunk)
+            url = f"{self.base_url}/files/{file_key}/nodes?ids={ids_str}"
+            return self._get_json('nodes', url)
+
+        if self.cache is None:
+            return self._fan_out(ids, self.nodes_chunk_size, _fetch, 'nodes')
+
+        version = self.get_file_version(file_key)
+        cached = {}
+        for node_id in ids:
+            subtree = self.cache.get('nodes', f"{file_key}@{version}:{node_id}")
+            if subtree is not None:
+                cached[node_id] = subtree
+
+        result = self._fan_out([i for i in ids if i not in cached], self.nodes_chunk_size, _fetch, 'nodes')
+        for node_id, subtree in result['nodes'].items():
+            self.cache.set('nodes', f"{file_key}@{version}:{node_id}", subtree)
+        result['nodes'].update(cached)
+        return result
 
     def get_image_fills(self, file_key):
         """
@@ -49,9 +237,17 @@ class FigmaClient:
         """
         url = f"{self.base_url}/files/{file_key}/images"
         try:
-            response = requests.get(url, headers=self.headers)
-            response.raise_for_status()
-            return response.json()
+            cache_key = None
+            if self.cache is not None:
+                cache_key = f"{file_key}@{self.get_file_version(file_key)}"
+                cached = self.cache.get('image_fills', cache_key, max_age=IMAGE_FILLS_MAX_AGE)
+                if cached is not None:
+                    return cached
+
+            data = self._get_json('image_fills', url)
+            if cache_key is not None:
+                self.cache.set('image_fills', cache_key, data)
+            return data
         except requests.exceptions.RequestException as e:
             print(f"Error fetching images: {e}")
             return None
@@ -61,19 +257,32 @@ class FigmaClient:
         ids: list of node IDs (strings)
         format: 'png', 'jpg', 'svg', 'pdf'
         scale: 1, 2, 3, 4
+        Returns {'images': {id: url}, 'failed': {id: reason}, ...}
         """
-        ids_str = ",".join(ids)
-        url = f"{self.base_url}/images/{file_key}?ids={ids_str}&format={format}&scale={scale}"
-        try:
-            response = requests.get(url, headers=self.headers)
-            # Handle rate limiting
-            if response.status_code == 429:
-                 retry_after = int(response.headers.get("Retry-After", 60))
-                 time.sleep(retry_after)
-                 response = requests.get(url, headers=self.headers)
-            
-            response.raise_for_status()
-            return response.json()
-        except requests.exceptions.RequestException as e:
-            print(f"Error fetching rendered images: {e}")
-            return None
+        def _fetch(chunk):
+            ids_str = ",".join(chunk)
+            url = f"{self.base_url}/images/{file_key}?ids={ids_str}&format={format}&scale={scale}"
+            return self._get_json('images', url)
+
+        cache_key = None
+        cached_urls = {}
+        if self.cache is not None:
+            try:
+                cache_key = f"{file_key}@{self.get_file_version(file_key)}:{format}@{scale}"
+            except requests.exceptions.RequestException as e:
+                print(f"Error checking file version: {e}")
+            else:
+                cached_urls = self.cache.get('renders', cache_key, max_age=RENDERS_MAX_AGE) or {}
+
+        missing = [node_id for node_id in ids if node_id not in cached_urls]
+        # Larger scales take Figma longer to render, so send fewer per request
+        chunk_size = max(1, int(self.images_chunk_size // max(scale, 1)))
+        result = self._fan_out(missing, chunk_size, _fetch, 'images')
+
+        if cache_key is not None and result['images']:
+            cached_urls.update(result['images'])
+            self.cache.set('renders', cache_key, cached_urls)
+        for node_id in ids:
+            if node_id in cached_urls:
+                result['images'][node_id] = cached_urls[node_id]
+        return result
@@ -0,0 +1,314 @@
+"""
+Post-processing for exported images.
+
+Figma serves image fills in whatever format they were uploaded in, and
+renders as unoptimized PNGs. This stage sniffs the real format (so files get
+the right extension) and strips metadata (EXIF, XMP, text chunks, comments)
+from JPEG, PNG and WebP without re-encoding them. With Pillow installed it
+can also re-encode to WebP/AVIF and add a half-size @1x variant. Work runs
+on a process pool and is cached in the BlobStore by source hash + options,
+so repeat exports skip it.
+"""
+import concurrent.futures
+import hashlib
+import io
+import json
+import os
+import struct
+
+try:
+    from PIL import Image, features
+except ImportError: # sniffing still works, re-encoding is skipped
+    Image = None
+    features = None
+
+# Leading bytes -> format
+MAGIC = (
+    (b'\x89PNG\r\n\x1a\n', 'png'),
+    (b'\xff\xd8\xff', 'jpeg'),
+    (b'GIF87a', 'gif'),
+    (b'GIF89a', 'gif'),
+    (b'%PDF', 'pdf'),
+)
+EXTENSIONS = {'png': 'png', 'jpeg': 'jpg', 'gif': 'gif', 'webp': 'webp',
+              'avif': 'avif', 'svg': 'svg', 'pdf': 'pdf', 'bin': 'bin'}
+# Formats Pillow can't (or shouldn't) re-encode; written as they are
+PASSTHROUGH = ('svg', 'pdf', 'bin')
+
+TARGET_FORMATS = ('webp', 'avif')
+# Bumped when process_image's outputs change, so stale cached results aren't used
+OUTPUT_VERSION = 2
+PIL_FORMATS = {'webp': 'WEBP', 'avif': 'AVIF', 'png': 'PNG', 'jpeg': 'JPEG', 'gif': 'GIF'}
+
+
+def sniff_format(data):
+    """
+    The real format of image bytes: png, jpeg, gif, webp, avif, svg, pdf
+    or 'bin' if unknown.
+    """
+    for magic, fmt in MAGIC:
+        if data.startswith(magic):
+            return fmt
+    if data[:4] == b'RIFF' and data[8:12] == b'WEBP':
+        return 'webp'
+    if data[4:8] == b'ftyp' and data[8:12] in (b'avif', b'avis'):
+        return 'avif'
+    head = data[:256].lstrip().lower()
+    if head.startswith(b'<svg') or (head.startswith(b'<?xml') and b'<svg' in data[:1024].lower()):
+        return 'svg'
+    return 'bin'
+
+
+def extension_for(data):
+    return EXTENSIONS[sniff_format(data)]
+
+
+# JPEG markers dropped when stripping: APP1 (EXIF, XMP), APP3-APP13, APP15
+# and comments. APP0 (JFIF), APP14 (Adobe color transform) and ICC
+# profiles in APP2 change how the image decodes, so they stay.
+_JPEG_DROP = frozenset([0xE1, *range(0xE3, 0xEE), 0xEF, 0xFE])
+_PNG_DROP = frozenset([b'tEXt', b'zTXt', b'iTXt', b'eXIf', b'tIME'])
+_WEBP_DROP = frozenset([b'EXIF', b'XMP '])
+
+
+def _strip_jpeg(data):
+    out = [data[:2]]
+    pos = 2
+    while pos < len(data):
+        if data[pos] != 0xFF:
+            raise ValueError("bad JPEG marker")
+        marker = data[pos + 1]
+        if marker == 0xFF: # fill byte
+            pos += 1
+            continue
+        if marker == 0xDA or marker == 0xD9: # scan data (or end): copy the rest as-is
+            out.append(data[pos:])
+            break
+        if 0xD0 <= marker <= 0xD7 or marker == 0x01:
+            out.append(data[pos:pos + 2])
+            pos += 2
+            continue
+        length = struct.unpack('>H', data[pos + 2:pos + 4])[0]
+        end = pos + 2 + length
+        if end > len(data):
+            raise ValueError("truncated JPEG segment")
+        segment = data[pos:end]
+        drop = marker in _JPEG_DROP or (marker == 0xE2 and segment[4:16] != b'ICC_PROFILE\x00')
+        if not drop:
+            out.append(segment)
+        pos = end
+    return b''.join(out)
+
+
+def _strip_png(data):
+    out = [data[:8]]
+    pos = 8
+    while pos < len(data):
+        length, kind = struct.unpack('>I4s', data[pos:pos + 8])
+        end = pos + 12 + length
+        if end > len(data):
+            raise ValueError("truncated PNG chunk")
+        if kind not in _PNG_DROP:
+            out.append(data[pos:end])
+        pos = end
+        if kind == b'IEND':
+            break
+    return b''.join(out)
+
+
+def _strip_webp(data):
+    chunks = []
+    pos = 12
+    while pos + 8 <= len(data):
+        kind, size = struct.unpack('<4sI', data[pos:pos + 8])
+        end = pos + 8 + size + (size & 1)
+        if end > len(data) + (size & 1):
+            raise ValueError("truncated WebP chunk")
+        chunk = data[pos:end]
+        if kind == b'VP8X':
+            # Clear the EXIF (0x08) and XMP (0x04) flags
+            chunk = chunk[:8] + bytes([chunk[8] & ~0x0C & 0xFF]) + chunk[9:]
+        if kind not in _WEBP_DROP:
+            chunks.append(chunk)
+        pos = end
+    body = b'WEBP' + b''.join(chunks)
+    return b'RIFF' + struct.pack('<I', len(body)) + body
+
+
+_STRIPPERS = {'jpeg': _strip_jpeg, 'png': _strip_png, 'webp': _strip_webp}
+
+
+def strip_metadata(data):
+    """
+    Drop metadata (EXIF, XMP, text chunks, comments) from JPEG, PNG or WebP
+    bytes without decoding the image; the pixel data is copied as-is and
+    ICC profiles are kept. Other formats, and files too malformed to
+    parse, come back unchanged.
+    """
+    stripper = _STRIPPERS.get(sniff_format(data))
+    if stripper is None:
+        return data
+    try:
+        return stripper(data)
+    except (ValueError, IndexError, struct.error) as e:
+        print(f"Could not strip metadata: {e}")
+        return data
+
+
+def can_encode(fmt):
+    return Image is not None and features.check(fmt)
+
+
+def _encode(img, fmt, quality, icc_profile):
+    out = io.BytesIO()
+    params = {}
+    if icc_profile:
+        # Keep the color profile; EXIF, text chunks etc. are dropped
+        params['icc_profile'] = icc_profile
+    if fmt in ('webp', 'avif', 'jpeg'):
+        params['quality'] = quality
+    if fmt == 'png':
+        params['optimize'] = True
+    if fmt == 'jpeg' and img.mode not in ('RGB', 'L'):
+        img = img.convert('RGB')
+    img.save(out, format=PIL_FORMATS[fmt], **params)
+    return out.getvalue()
+
+
+def process_image(data, target_format=None, variants=False, strip=True, quality=80):
+    """
+    Process one image. Returns a list of (suffix, extension, bytes): the
+    main output has suffix "", and with variants an "@1x" output at half
+    size (the source is taken as 2x, so the main output doubles as @2x).
+    strip removes metadata without re-encoding (see strip_metadata); only a
+    change of format re-encodes. Anything Pillow can't handle comes back
+    as it is (stripped, if asked). Runs in worker processes, so it only
+    takes and returns plain data.
+    """
+    source_format = sniff_format(data)
+    if source_format in PASSTHROUGH:
+        return [("", EXTENSIONS[source_format], data)]
+    source = strip_metadata(data) if strip else data
+    original = [("", EXTENSIONS[source_format], source)]
+    if Image is None or not (variants or target_format in TARGET_FORMATS):
+        return original
+    try:
+        img = Image.open(io.BytesIO(data))
+        if getattr(img, 'is_animated', False):
+            return original
+        img.load()
+        fmt = target_format if target_format in TARGET_FORMATS and can_encode(target_format) else source_format
+        if fmt not in PIL_FORMATS:
+            return original
+        icc_profile = img.info.get('icc_profile')
+
+        # Encoding only passes the ICC profile on, so transcoded images carry no other metadata
+        main = _encode(img, fmt, quality, icc_profile) if fmt != source_format else source
+        outputs = [("", EXTENSIONS[fmt], main)]
+        if variants and img.width >= 2 and img.height >= 2:
+            half = img.resize((img.width // 2, img.height // 2), Image.LANCZOS)
+            outputs.append(("@1x", EXTENSIONS[fmt], _encode(half, fmt, quality, icc_profile)))
+        return outputs
+    except Exception as e: # corrupt or unsupported input: ship it as-is
+        print(f"Image processing failed ({source_format}): {e}")
+        return original
+
+
+class ImageProcessor:
+    """
+    Runs process_image over many images on a process pool, caching results
+    in a BlobStore keyed by the source's sha256 and the options.
+
+    target_format: 'webp', 'avif' or None to keep the source format
+    variants: also produce a half-size @1x output (the main one is @2x)
+    strip: drop EXIF, XMP, text and comment metadata without re-encoding
+    """
+
+    def __init__(self, blob_store, target_format=None, variants=False, strip=True,
+                 quality=80, workers=None):
+        if target_format and not can_encode(target_format):
+            print(f"Pillow can't encode {target_format} here; keeping source formats")
+            target_format = None
+        self.blob_store = blob_store
+        self.options = {'target_format': target_format, 'variants': variants,
+                        'strip': strip, 'quality': quality}
+        self.workers = workers or os.cpu_count() or 1
+        versioned = dict(self.options, output_version=OUTPUT_VERSION)
+        self._options_key = hashlib.sha256(json.dumps(versioned, sort_keys=True).encode()).hexdigest()[:16]
+        self.hits = 0
+        self.misses = 0
+
+    def _cache_ref(self, source_digest):
+        return f"processed:{self._options_key}:{source_digest}"
+
+    def _cached(self, source_digest):
+        digest = self.blob_store.lookup(self._cache_ref(source_digest))
+        if digest is None:
+            return None
+        try:
+            entries = json.loads(self.blob_store.read(digest))
+            return [(e['suffix'], e['ext'], self.blob_store.read(e['digest'])) for e in entries]
+        except (OSError, ValueError, KeyError):
+            return None
+
+    def _store(self, source_digest, outputs):
+        entries = [{'suffix': suffix, 'ext': ext, 'digest': self.blob_store.put(data)}
+                   for suffix, ext, data in outputs]
+        self.blob_store.put(json.dumps(entries).encode("utf-8"), ref=self._cache_ref(source_digest))
+
+    def process_many(self, items):
+        """
+        items: iterable of (key, bytes), e.g. downloads as they arrive.
+        Yields (key, [(suffix, extension, bytes), ...]) in completion order;
+        images keep processing while later downloads are still coming in.
+        """
+        pool = None
+        pending = {}
+
+        def _finish(future):
+            key, source_digest, data = pending.pop(future)
+            try:
+                outputs = future.result()
+            except Exception as e: # e.g. a worker died
+                print(f"Image processing failed for {key}: {e}")
+                return key, [("", extension_for(data), data)]
+            self._store(source_digest, outputs)
+            return key, outputs
+
+        try:
+            for key, data in items:
+                source_digest = hashlib.sha256(data).hexdigest()
+                cached = self._cached(source_digest)
+                if cached is not None:
+                    self.hits += 1
+                    yield key, cached
+                    continue
+                self.misses += 1
+                if self.workers <= 1:
+                    outputs = process_image(data, **self.options)
+                    self._store(source_digest, outputs)
+                    yield key, outputs
+                    continue
+                if pool is None:
+                    pool = concurrent.futures.ProcessPoolExecutor(max_workers=self.workers)
+                pending[pool.submit(process_image, data, **self.options)] = (key, source_digest, data)
+                for future in [f for f in pending if f.done()]:
+                    yield _finish(future)
+            for future in concurrent.futures.as_completed(list(pending)):
+                yield _finish(future)
+        finally:
+            if pool is not None:
+                pool.shutdown(cancel_futures=True)
+
+    def without_variants(self):
+        """
+        Same settings minus @1x/@2x variants (the cache key differs too).
+        """
+        if not self.options['variants']:
+            return self
+        return ImageProcessor(self.blob_store, target_format=self.options['target_format'],
+                              strip=self.options['strip'], quality=self.options['quality'],
+                              workers=self.workers)
+
+    def stats(self):
+        return {'hits': self.hits, 'misses': self.misses}
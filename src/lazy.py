@@ -0,0 +1,72 @@
+from src.parser import get_top_level_frames
+
+# Document -> Canvas -> Frames: enough to list pages and screens
+OUTLINE_DEPTH = 2
+
+
+class LazyDocument:
+    """
+    A file loaded outline-first. The shallow tree from a depth-limited
+    get_file lists pages and top-level frames; full frame subtrees are pulled
+    through get_file_nodes only when asked for and spliced into the outline,
+    so everything downstream keeps working on one document tree.
+    """
+
+    def __init__(self, client, file_key, depth=OUTLINE_DEPTH):
+        self.client = client
+        self.file_key = file_key
+        self.data = client.get_file(file_key, depth=depth)
+        self.document = self.data['document']
+        self.loaded = set() # outline frames whose full subtree is in the document
+        self.subtrees = {} # node id -> subtree for nodes outside the outline
+        # node id -> reason, so a bad ID isn't requested again on every rerun
+        self.failed = {}
+        self._outline_nodes = {f['id']: f for f in get_top_level_frames(self.document)}
+
+    def load(self, ids):
+        """
+        Make sure the full subtrees of the given nodes are present: outline
+        frames are spliced into the document, any other node is kept aside
+        in `subtrees` and leaves the document (and loaded_key) unchanged.
+        Returns {id: reason} for any that could not be loaded.
+        """
+        missing = [i for i in ids if i not in self.loaded and i not in self.subtrees]
+        if not missing:
+            return {}
+        result = self.client.get_file_nodes(self.file_key, missing)
+        failed = dict(result.get('failed', {}))
+        for node_id, entry in result['nodes'].items():
+            subtree = entry.get('document')
+            if subtree is None:
+                failed[node_id] = "Not returned by Figma"
+                continue
+            if node_id in self._outline_nodes:
+                # Replace in place so the parent's children list sees it
+                outline_node = self._outline_nodes[node_id]
+                outline_node.clear()
+                outline_node.update(subtree)
+                self.loaded.add(node_id)
+            else:
+                self.subtrees[node_id] = subtree
+            self.failed.pop(node_id, None)
+        self.failed.update(failed)
+        return failed
+
+    def get_node(self, node_id):
+        """
+        A node by ID, fetching its subtree if it isn't loaded yet. IDs that
+        failed before return None without another request.
+        """
+        if node_id in self.failed:
+            return None
+        self.load([node_id])
+        if node_id in self._outline_nodes:
+            return self._outline_nodes[node_id]
+        return self.subtrees.get(node_id)
+
+    def loaded_key(self):
+        """
+        Hashable summary of which frames are loaded into the document, for
+        cache keys. One-off subtrees from get_node don't change it.
+        """
+        return tuple(sorted(self.loaded))
@@ -0,0 +1,154 @@
+"""
+Lightweight pipeline instrumentation.
+
+Counters (requests, bytes, retries, cache hits, ...) and timed spans
+(API calls, JSON decode, analysis, export stages) are recorded into one
+process-wide Metrics registry. To see what a single load or export cost,
+wrap it in `with get_metrics().collect() as run:` and read `run` afterwards;
+everything recorded on any thread while the block is open is copied into it.
+"""
+import contextlib
+import json
+import threading
+import time
+
+
+def _label_key(labels):
+    return tuple(sorted((k, str(v)) for k, v in labels.items()))
+
+
+def _prom_labels(label_key):
+    if not label_key:
+        return ""
+    pairs = []
+    for k, v in label_key:
+        v = v.replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+        pairs.append(f'{k}="{v}"')
+    return "{" + ",".join(pairs) + "}"
+
+
+class Metrics:
+    """
+    Thread-safe counters and span timings, keyed by name and labels.
+    Counter names end in _total by convention; spans record seconds.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.counters = {} # (name, labels) -> value
+        self.spans = {}    # (name, labels) -> {'count', 'seconds', 'max'}
+        self._collectors = []
+
+    def _sinks(self):
+        return [self] + self._collectors
+
+    def incr(self, name, value=1, **labels):
+        key = (name, _label_key(labels))
+        with self._lock:
+            sinks = self._sinks()
+        for sink in sinks:
+            with sink._lock:
+                sink.counters[key] = sink.counters.get(key, 0) + value
+
+    def observe(self, name, seconds, **labels):
+        key = (name, _label_key(labels))
+        with self._lock:
+            sinks = self._sinks()
+        for sink in sinks:
+            with sink._lock:
+                span = sink.spans.setdefault(key, {'count': 0, 'seconds': 0.0, 'max': 0.0})
+                span['count'] += 1
+                span['seconds'] += seconds
+                span['max'] = max(span['max'], seconds)
+
+    @contextlib.contextmanager
+    def span(self, name, **labels):
+        """
+        Time a block: with metrics.span('export_stage', stage='css'): ...
+        """
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(name, time.perf_counter() - start, **labels)
+
+    @contextlib.contextmanager
+    def collect(self):
+        """
+        Yields a fresh Metrics that also receives everything recorded here
+        until the block exits. Concurrent runs in the same process (two
+        Streamlit sessions) will see each other's traffic.
+        """
+        run = Metrics()
+        with self._lock:
+            self._collectors.append(run)
+        try:
+            yield run
+        finally:
+            with self._lock:
+                self._collectors.remove(run)
+
+    def snapshot(self):
+        """
+        Plain-data copy: {'counters': [...], 'spans': [...]}, each entry
+        with 'name' and 'labels'.
+        """
+        with self._lock:
+            counters = [{'name': name, 'labels': dict(labels), 'value': value}
+                        for (name, labels), value in sorted(self.counters.items())]
+            spans = [{'name': name, 'labels': dict(labels), 'count': s['count'],
+                      'seconds': round(s['seconds'], 6), 'max': round(s['max'], 6)}
+                     for (name, labels), s in sorted(self.spans.items())]
+        return {'counters': counters, 'spans': spans}
+
+    def counter(self, name, **labels):
+        """
+        Sum of a counter over all label sets matching `labels`.
+        """
+        wanted = set(_label_key(labels))
+        with self._lock:
+            return sum(value for (n, label_key), value in self.counters.items()
+                       if n == name and wanted <= set(label_key))
+
+    def to_json(self, indent=2):
+        return json.dumps(self.snapshot(), indent=indent)
+
+    def to_prometheus(self, prefix="figma_"):
+        """
+        Prometheus text exposition format: counters as counters, spans as
+        summaries (_count / _sum in seconds).
+        """
+        lines = []
+        with self._lock:
+            counters = sorted(self.counters.items())
+            spans = sorted(self.spans.items())
+        typed = set()
+        for (name, label_key), value in counters:
+            metric = prefix + name
+            if metric not in typed:
+                lines.append(f"# TYPE {metric} counter")
+                typed.add(metric)
+            lines.append(f"{metric}{_prom_labels(label_key)} {value}")
+        for (name, label_key), s in spans:
+            metric = f"{prefix}{name}_seconds"
+            if metric not in typed:
+                lines.append(f"# TYPE {metric} summary")
+                typed.add(metric)
+            lines.append(f"{metric}_count{_prom_labels(label_key)} {s['count']}")
+            lines.append(f"{metric}_sum{_prom_labels(label_key)} {s['seconds']:.6f}")
+        return "\n".join(lines) + "\n"
+
+    def reset(self):
+        with self._lock:
+            self.counters.clear()
+            self.spans.clear()
+
+
+_default_metrics = Metrics()
+
+
+def get_metrics():
+    """
+    The process-wide registry that the client, cache and export record into.
+    """
+    return _default_metrics
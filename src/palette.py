@@ -0,0 +1,118 @@
+"""
+Ranked color palette from a document's color usage.
+
+DocumentAnalysis counts every solid fill, stroke and effect color as
+(r, g, b, a) while it walks the tree. Here those counts become NumPy
+arrays, are converted to CIE Lab, and near-duplicates (within a ΔE
+threshold and a small alpha tolerance) are merged into the most-used color
+of each group, so a large file yields a short palette ranked by usage.
+"""
+import numpy as np
+
+from src.parser import rgb_to_hex
+
+# CIE76 distance; about 2.3 is a just-noticeable difference
+DEFAULT_DELTA_E = 3.0
+DEFAULT_ALPHA_TOLERANCE = 0.05
+
+# sRGB (linear) -> XYZ, D65 white
+_RGB_TO_XYZ = np.array([
+    [0.4124564, 0.3575761, 0.1804375],
+    [0.2126729, 0.7151522, 0.0721750],
+    [0.0193339, 0.1191920, 0.9503041],
+])
+_WHITE_D65 = np.array([0.95047, 1.0, 1.08883])
+
+
+def usage_arrays(color_usage):
+    """
+    {(r, g, b, a): count} -> (rgba float array of shape (n, 4), counts).
+    """
+    if not color_usage:
+        return np.zeros((0, 4)), np.zeros(0, dtype=np.int64)
+    rgba = np.array(list(color_usage.keys()), dtype=np.float64)
+    counts = np.fromiter(color_usage.values(), dtype=np.int64, count=len(color_usage))
+    return rgba, counts
+
+
+def rgb_to_lab(rgb):
+    """
+    sRGB in 0-1, shape (n, 3) -> CIE Lab, shape (n, 3).
+    """
+    rgb = np.clip(rgb, 0.0, 1.0)
+    linear = np.where(rgb <= 0.04045, rgb / 12.92, ((rgb + 0.055) / 1.055) ** 2.4)
+    xyz = linear @ _RGB_TO_XYZ.T / _WHITE_D65
+    f = np.where(xyz > (6 / 29) ** 3, np.cbrt(xyz), xyz / (3 * (6 / 29) ** 2) + 4 / 29)
+    return np.stack([
+        116 * f[:, 1] - 16,
+        500 * (f[:, 0] - f[:, 1]),
+        200 * (f[:, 1] - f[:, 2]),
+    ], axis=1)
+
+
+def _merge_exact(rgba, counts):
+    # Colors that render the same (8-bit RGB, alpha to 1/255) are one entry,
+    # represented by the first original value seen
+    keys = np.round(rgba * 255).astype(np.int32)
+    unique, first, inverse = np.unique(keys, axis=0, return_index=True, return_inverse=True)
+    merged_counts = np.bincount(inverse.ravel(), weights=counts, minlength=len(unique)).astype(np.int64)
+    return rgba[first], merged_counts
+
+
+def build_palette(color_usage, delta_e=DEFAULT_DELTA_E, alpha_tolerance=DEFAULT_ALPHA_TOLERANCE):
+    """
+    Cluster {(r, g, b, a): count} into a palette ranked by usage.
+
+    Colors are taken most-used first; each one not yet claimed becomes a
+    palette entry and claims every remaining color within `delta_e` (Lab)
+    and `alpha_tolerance`. Entries keep the seed's exact color, so tokens
+    are colors that really appear in the file.
+
+    Returns a list of {'hex', 'r', 'g', 'b', 'a', 'count', 'members'},
+    where members lists the hex codes merged into the entry.
+    """
+    rgba, counts = usage_arrays(color_usage)
+    if not len(rgba):
+        return []
+    rgba, counts = _merge_exact(rgba, counts)
+
+    order = np.argsort(-counts, kind='stable')
+    rgba, counts = rgba[order], counts[order]
+    lab = rgb_to_lab(rgba[:, :3])
+    alpha = rgba[:, 3]
+
+    # Bucket colors into Lab cells delta_e wide: anything within delta_e of
+    # a seed is in the seed's cell or one of its 26 neighbours, so each seed
+    # is compared against a handful of colors instead of all of them.
+    cells = np.floor(lab / max(delta_e, 1e-6)).astype(np.int64)
+    unique_cells, cell_of = np.unique(cells, axis=0, return_inverse=True)
+    cell_of = cell_of.ravel()
+    by_cell = np.argsort(cell_of, kind='stable')
+    starts = np.searchsorted(cell_of[by_cell], np.arange(len(unique_cells) + 1))
+    cell_members = {tuple(cell): by_cell[starts[i]:starts[i + 1]] for i, cell in enumerate(unique_cells.tolist())}
+    offsets = [(x, y, z) for x in (-1, 0, 1) for y in (-1, 0, 1) for z in (-1, 0, 1)]
+
+    unclaimed = np.ones(len(rgba), dtype=bool)
+    palette = []
+    for seed in range(len(rgba)):
+        if not unclaimed[seed]:
+            continue
+        cx, cy, cz = cells[seed].tolist()
+        nearby = [cell_members[key] for key in ((cx + x, cy + y, cz + z) for x, y, z in offsets) if key in cell_members]
+        candidates = np.concatenate(nearby)
+        candidates = candidates[unclaimed[candidates]]
+        distance = np.sqrt(((lab[candidates] - lab[seed]) ** 2).sum(axis=1))
+        close = (distance <= delta_e) & (np.abs(alpha[candidates] - alpha[seed]) <= alpha_tolerance)
+        members = candidates[close]
+        unclaimed[members] = False
+
+        r, g, b, a = (float(v) for v in rgba[seed])
+        palette.append({
+            'hex': rgb_to_hex(r, g, b),
+            'r': r, 'g': g, 'b': b, 'a': round(a, 3),
+            'count': int(counts[members].sum()),
+            'members': list(dict.fromkeys(rgb_to_hex(*rgba[m, :3]) for m in members)),
+        })
+
+    palette.sort(key=lambda entry: -entry['count'])
+    return palette
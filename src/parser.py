@@ -1,86 +1,238 @@
+import hashlib
+import io
+import json
 import re
+import sys
+
 def rgb_to_hex(r, g, b):
-    # Figma gives colors in 0-1 range
-    return '#{:02x}{:02x}{:02x}'.format(int(r * 255), int(g * 255), int(b * 255))
+    # Figma gives colors in 0-1 range; round so 0.5 doesn't become #7f
+    return '#{:02x}{:02x}{:02x}'.format(round(r * 255), round(g * 255), round(b * 255))
+
+def _add_paint_colors(paints, colors):
+    for paint in paints:
+        if paint['type'] == 'SOLID' and paint.get('visible', True) is not False:
+            color = paint['color']
+            hex_code = rgb_to_hex(color['r'], color['g'], color['b'])
+            if hex_code not in colors:
+                colors[hex_code] = color
+
+def _add_node_colors(node, colors):
+    if 'fills' in node:
+        _add_paint_colors(node['fills'], colors)
+    if 'strokes' in node:
+        _add_paint_colors(node['strokes'], colors)
+
+def _add_color_usage(node, usage):
+    """
+    Count (r, g, b, a) usages from solid fills, strokes and effect colors.
+    Alpha folds in the paint's opacity.
+    """
+    for key in ('fills', 'strokes'):
+        if key in node:
+            for paint in node[key]:
+                if paint['type'] == 'SOLID' and paint.get('visible', True) is not False:
+                    c = paint['color']
+                    rgba = (c['r'], c['g'], c['b'], c.get('a', 1) * paint.get('opacity', 1))
+                    usage[rgba] = usage.get(rgba, 0) + 1
+    if 'effects' in node:
+        for effect in node['effects']:
+            if 'color' in effect and effect.get('visible', True) is not False:
+                c = effect['color']
+                rgba = (c['r'], c['g'], c['b'], c.get('a', 1))
+                usage[rgba] = usage.get(rgba, 0) + 1
+
+def _add_text_style(node, text_styles):
+    if node['type'] == 'TEXT':
+        style = node.get('style')
+        # Create a unique key for the style hash
+        if style:
+            key = f"{style.get('fontFamily')}-{style.get('fontWeight')}-{style.get('fontSize')}"
+            if key not in text_styles:
+                text_styles[key] = style
+
+def _node_images(node):
+    images = []
+    if 'fills' in node:
+        for fill in node['fills']:
+            if fill['type'] == 'IMAGE':
+                images.append({
+                    'id': node['id'],
+                    'name': node['name'],
+                    'image_ref': fill.get('imageRef') # This ref is needed to lookup the URL
+                })
+    return images
+
+def _is_top_level_frame(node):
+    return node['type'] == 'FRAME' or node['type'] == 'SECTION'
 
-def extract_colors(document):
+def walk(node, max_depth=None, prune=None):
+    """
+    Iterate over a tree without recursion, in document (pre-)order.
+    Yields (node, depth, parent) with depth 0 for `node` itself.
+
+    max_depth: don't descend below this depth
+    prune: predicate; matching nodes are skipped together with their subtree
+           (see skip_invisible, skip_instances)
+    """
+    stack = [(node, 0, None)]
+    while stack:
+        current, depth, parent = stack.pop()
+        if prune is not None and prune(current):
+            continue
+        yield current, depth, parent
+        if 'children' in current and (max_depth is None or depth < max_depth):
+            # Reversed so children come out in document order
+            for child in reversed(current['children']):
+                stack.append((child, depth + 1, current))
+
+def skip_invisible(node):
+    return node.get('visible', True) is False
+
+def skip_instances(node):
+    return node['type'] == 'INSTANCE'
+
+def extract_colors(document, prune=None):
     """
     Traverse the document to find all unique colors.
     Returns a list of dicts: {'hex': '#RRGGBB', 'r': 0.1, ...}
     """
     colors = {}
-
-    def _traverse(node):
-        if 'fills' in node:
-            for fill in node['fills']:
-                if fill['type'] == 'SOLID' and fill.get('visible', True) is not False:
-                    color = fill['color']
-                    hex_code = rgb_to_hex(color['r'], color['g'], color['b'])
-                    if hex_code not in colors:
-                        colors[hex_code] = color
-        
-        if 'strokes' in node:
-            for stroke in node['strokes']:
-                 if stroke['type'] == 'SOLID' and stroke.get('visible', True) is not False:
-                    color = stroke['color']
-                    hex_code = rgb_to_hex(color['r'], color['g'], color['b'])
-                    if hex_code not in colors:
-                        colors[hex_code] = color
-
-        if 'children' in node:
-            for child in node['children']:
-                _traverse(child)
-
-    _traverse(document)
+    for node, _, _ in walk(document, prune=prune):
+        _add_node_colors(node, colors)
     return colors
 
-def extract_typography(document):
+def extract_typography(document, prune=None):
     """
     Traverse to find unique text styles.
     """
     text_styles = {}
-
-    def _traverse(node):
-        if node['type'] == 'TEXT':
-            style = node.get('style')
-            # Create a unique key for the style hash
-            if style:
-                key = f"{style.get('fontFamily')}-{style.get('fontWeight')}-{style.get('fontSize')}"
-                if key not in text_styles:
-                    text_styles[key] = style
-        
-        if 'children' in node:
-            for child in node['children']:
-                _traverse(child)
-
-    _traverse(document)
+    for node, _, _ in walk(document, prune=prune):
+        _add_text_style(node, text_styles)
     return text_styles.values()
 
-def extract_images(document):
+def extract_images(document, prune=None):
     """
     Find nodes that have image fills.
     Returns: list of dicts {'id': node_id, 'name': node_name, 'image_ref': ref}
     """
     images = []
-
-    def _traverse(node):
-        if 'fills' in node:
-            for fill in node['fills']:
-                if fill['type'] == 'IMAGE':
-                    images.append({
-                        'id': node['id'],
-                        'name': node['name'],
-                        'image_ref': fill.get('imageRef') # This ref is needed to lookup the URL
-                    })
-        
-        if 'children' in node:
-            for child in node['children']:
-                _traverse(child)
-
-    _traverse(document)
+    for node, _, _ in walk(document, prune=prune):
+        images.extend(_node_images(node))
     return images
 
 
+class NodeIndex:
+    """
+    Constant-time lookups into a document: id -> node, id -> parent id and
+    name -> ids. Names are not unique in Figma, so by_name holds every id
+    sharing a name, in document order.
+    """
+
+    def __init__(self):
+        self.by_id = {}
+        self.parent_of = {}
+        self.by_name = {}
+
+    def add(self, node, parent_id):
+        node_id = node['id']
+        self.by_id[node_id] = node
+        self.parent_of[node_id] = parent_id
+        self.by_name.setdefault(node.get('name'), []).append(node_id)
+
+    def get(self, node_id):
+        return self.by_id.get(node_id)
+
+    def parent(self, node_id):
+        parent_id = self.parent_of.get(node_id)
+        return self.by_id.get(parent_id) if parent_id is not None else None
+
+    def ids_for_name(self, name):
+        return self.by_name.get(name, [])
+
+    def path(self, node_id):
+        """
+        Ancestor chain from the document root down to node_id, as nodes.
+        """
+        path = []
+        while node_id is not None and node_id in self.by_id:
+            path.append(self.by_id[node_id])
+            node_id = self.parent_of.get(node_id)
+        path.reverse()
+        return path
+
+    def __contains__(self, node_id):
+        return node_id in self.by_id
+
+    def __len__(self):
+        return len(self.by_id)
+
+    @classmethod
+    def build(cls, document):
+        index = cls()
+        for node, _, parent in walk(document):
+            index.add(node, parent['id'] if parent is not None else None)
+        return index
+
+
+class DocumentAnalysis:
+    """
+    Everything the UI and exports need from a document, gathered in a
+    single traversal: colors (plus per-RGBA usage counts for the palette),
+    text styles, image-fill nodes, top-level frames, the image-fill nodes
+    inside each of those frames and a NodeIndex for id/name lookups.
+    """
+
+    def __init__(self, document=None, prune=None):
+        self.colors = {}
+        self.color_usage = {} # (r, g, b, a) -> count, see src.palette
+        self._text_styles = {}
+        self.images = []
+        self.frames = []
+        self.frame_images = {} # frame id -> list of image dicts
+        self.index = NodeIndex()
+        if document is not None:
+            self._analyze(document, prune)
+
+    @property
+    def text_styles(self):
+        return self._text_styles.values()
+
+    def images_for_frame(self, frame_id):
+        return self.frame_images.get(frame_id, [])
+
+    def visit(self, node):
+        """
+        Record one node's colors and text style. Returns the node's own
+        image fills; placing them (images, frame_images) is up to the caller
+        since that depends on traversal order.
+        """
+        _add_node_colors(node, self.colors)
+        _add_color_usage(node, self.color_usage)
+        _add_text_style(node, self._text_styles)
+        return _node_images(node)
+
+    def _analyze(self, document, prune=None):
+        # Document -> Canvas -> Frames, so top-level frames sit at depth 2.
+        # Nodes come in document order, so everything below depth 2 belongs
+        # to the most recent depth-2 node.
+        frame_id = None
+        for node, depth, parent in walk(document, prune=prune):
+            self.index.add(node, parent['id'] if parent is not None else None)
+
+            if depth <= 2:
+                frame_id = None
+            if depth == 2 and _is_top_level_frame(node):
+                frame_id = node['id']
+                self.frames.append(node)
+                self.frame_images[frame_id] = []
+
+            node_images = self.visit(node)
+            if node_images:
+                self.images.extend(node_images)
+                if frame_id is not None:
+                    self.frame_images[frame_id].extend(node_images)
+
+
 def generate_css(node):
     """
     Generate CSS for a specific node (very basic implementation).
@@ -134,56 +286,361 @@ def generate_css(node):
 
 def find_node_by_id(node, target_id):
     """
-    Recursively find a node by its ID.
+    Find a node by its ID (depth-first). Prefer NodeIndex for repeated lookups.
     """
-    if node['id'] == target_id:
-        return node
-    
-    if 'children' in node:
-        for child in node['children']:
-            found = find_node_by_id(child, target_id)
-            if found:
-                return found
+    for current, _, _ in walk(node):
+        if current['id'] == target_id:
+            return current
     return None
 
 def get_top_level_frames(document):
     """
     Get all top-level frames (children of the document/canvas).
     """
-    frames = []
     # Document -> Canvas -> Frames
-    if 'children' in document:
-        for canvas in document['children']:
-            if 'children' in canvas:
-                for child in canvas['children']:
-                    if child['type'] == 'FRAME' or child['type'] == 'SECTION':
-                       frames.append(child)
-    return frames
+    return [node for node, depth, _ in walk(document, max_depth=2)
+            if depth == 2 and _is_top_level_frame(node)]
 
-def extract_css_recursive(node, depth=0):
+def css_class_name(node_name):
+    return re.sub(r'[^a-zA-Z0-9]', '_', node_name)
+
+def write_css_rule(out, node, node_css, indent=""):
+    out.write(f"{indent}/* {node['name']} ({node['type']}) */\n")
+    out.write(f"{indent}.{css_class_name(node['name'])} {{\n")
+    # Indent each line of CSS
+    for line in node_css.split('\n'):
+        out.write(f"{indent}  {line}\n")
+    out.write(f"{indent}}}\n\n")
+
+def extract_css_recursive(node, depth=0, out=None, max_depth=None, prune=None):
     """
-    Recursively generate CSS for a node and its children.
-    Returns a string.
+    Generate CSS for a node and its children.
+    Rules are written to `out` (any object with .write) as they are generated;
+    without one, the CSS is returned as a string.
     """
-    indent = "  " * depth
-    css_output = []
-    
-    node_name = node['name']
-    node_type = node['type']
-    
-    # Generate CSS for current node
-    node_css = generate_css(node)
-    
-    if node_css:
-        css_output.append(f"{indent}/* {node_name} ({node_type}) */")
-        css_output.append(f"{indent}.{re.sub(r'[^a-zA-Z0-9]', '_', node_name)} {{")
-        # Indent each line of CSS
-        for line in node_css.split('\n'):
-            css_output.append(f"{indent}  {line}")
-        css_output.append(f"{indent}}}\n")
-        
-    if 'children' in node:
-        for child in node['children']:
-            css_output.append(extract_css_recursive(child, depth + 1))
-            
-    return "\n".join(css_output)
+    buffer = out if out is not None else io.StringIO()
+
+    for current, level, _ in walk(node, max_depth=max_depth, prune=prune):
+        node_css = generate_css(current)
+        if node_css:
+            write_css_rule(buffer, current, node_css, "  " * (depth + level))
+
+    if out is None:
+        return buffer.getvalue()
+
+
+def css_style_key(node):
+    """
+    Key over exactly the values generate_css reads: font fields, the first
+    visible solid fill, bbox size, cornerRadius and visible drop shadows.
+    Nodes with equal keys get identical CSS. Cheap to build (a tuple, no
+    serialization), so a memo hit costs less than generate_css itself.
+    """
+    font = None
+    if 'style' in node:
+        s = node['style']
+        font = (s.get('fontFamily'), s.get('fontWeight'), s.get('fontSize'),
+                'lineHeightPx' in s, s.get('lineHeightPx'))
+    fill = None
+    if 'fills' in node:
+        for paint in node['fills']:
+            if paint['type'] == 'SOLID' and paint.get('visible', True) is not False:
+                c = paint['color']
+                fill = (c['r'], c['g'], c['b'], 'opacity' in paint, paint.get('opacity'))
+                break
+    size = None
+    if 'absoluteBoundingBox' in node:
+        bbox = node['absoluteBoundingBox']
+        size = (bbox['width'], bbox['height'])
+    radius = ('cornerRadius' in node, node.get('cornerRadius'))
+    shadows = None
+    if 'effects' in node:
+        shadows = tuple((e['offset']['x'], e['offset']['y'], e['radius'],
+                         e['color']['r'], e['color']['g'], e['color']['b'])
+                        for e in node['effects']
+                        if e['type'] == 'DROP_SHADOW' and e.get('visible', True) is not False) or None
+    return font, fill, size, radius, shadows
+
+
+class CSSMemo:
+    """
+    generate_css memoized on css_style_key. Each distinct declaration block
+    gets a utility class name (s-<hash of the declarations>), so keys that
+    differ only below hex precision still share one class, and names agree
+    across worker processes.
+    """
+
+    def __init__(self):
+        self.blocks = {} # style key -> (utility class, declarations)
+        self.hits = 0
+        self.misses = 0
+        self._utilities = {} # declarations -> utility class
+        self._bodies = {} # utility class -> rule body, as extract_css_shared writes it
+        self._class_names = {} # node name -> css_class_name(name)
+        # Compact trees share style/paint objects between nodes, so most
+        # lookups can skip building the key. The objects are kept alive here
+        # so their ids stay unique while the memo exists.
+        self._by_identity = {}
+        self._pinned = []
+
+    def lookup(self, node):
+        compact = isinstance(node, CompactNode)
+        if compact:
+            style, fills, effects = node.style, node.fills, node.effects
+            bbox = node.absoluteBoundingBox
+            size = (bbox.width, bbox.height) if bbox is not None else None
+            identity = (id(style), id(fills), id(effects), size, node.cornerRadius)
+            entry = self._by_identity.get(identity)
+            if entry is not None:
+                self.hits += 1
+                return entry
+
+        key = css_style_key(node)
+        entry = self.blocks.get(key)
+        if entry is not None:
+            self.hits += 1
+        else:
+            self.misses += 1
+            node_css = generate_css(node)
+            utility = None
+            if node_css:
+                utility = self._utilities.get(node_css)
+                if utility is None:
+                    utility = "s-" + hashlib.sha1(node_css.encode("utf-8")).hexdigest()[:10]
+                    self._utilities[node_css] = utility
+            entry = self.blocks[key] = (utility, node_css)
+        if compact:
+            self._pinned.append((style, fills, effects))
+            self._by_identity[identity] = entry
+        return entry
+
+    def body(self, utility, node_css):
+        body = self._bodies.get(utility)
+        if body is None:
+            body = self._bodies[utility] = (
+                " {\n" + "".join(f"  {line}\n" for line in node_css.split('\n')) + "}\n\n")
+        return body
+
+    def class_name(self, name):
+        class_name = self._class_names.get(name)
+        if class_name is None:
+            class_name = self._class_names[name] = css_class_name(name)
+        return class_name
+
+    def stats(self):
+        total = self.hits + self.misses
+        return {
+            'hits': self.hits,
+            'misses': self.misses,
+            'blocks': len(self.blocks),
+            'hit_rate': round(self.hits / total, 3) if total else 0.0,
+        }
+
+
+def extract_css_shared(node, memo=None, out=None, max_depth=None, prune=None):
+    """
+    Like extract_css_recursive, but each distinct declaration block is
+    written once, as a utility class whose selector list also names every
+    node class that uses it, instead of repeating it per node.
+    """
+    memo = memo if memo is not None else CSSMemo()
+    groups = {} # utility class -> (declarations, {node class: None}), in first-use order
+    for current, _, _ in walk(node, max_depth=max_depth, prune=prune):
+        utility, node_css = memo.lookup(current)
+        if not node_css:
+            continue
+        group = groups.get(utility)
+        if group is None:
+            group = groups[utility] = (node_css, {utility: None})
+        group[1][memo.class_name(current['name'])] = None
+
+    buffer = out if out is not None else io.StringIO()
+    for utility, (node_css, node_classes) in groups.items():
+        buffer.write(",\n".join(["." + selector for selector in node_classes]))
+        buffer.write(memo.body(utility, node_css))
+
+    if out is None:
+        return buffer.getvalue()
+
+class BoundingBox:
+    """
+    absoluteBoundingBox without the per-node dict. Supports bbox['width']
+    so generate_css reads it like the raw JSON.
+    """
+    __slots__ = ('x', 'y', 'width', 'height')
+
+    def __init__(self, x, y, width, height):
+        self.x = x
+        self.y = y
+        self.width = width
+        self.height = height
+
+    def __getitem__(self, key):
+        try:
+            return getattr(self, key)
+        except (AttributeError, TypeError):
+            raise KeyError(key)
+
+    def get(self, key, default=None):
+        return getattr(self, key, default)
+
+    def to_dict(self):
+        return {'x': self.x, 'y': self.y, 'width': self.width, 'height': self.height}
+
+
+class CompactNode:
+    """
+    Memory-lean replacement for a raw Figma node dict.
+
+    Only the properties the parser reads are kept, in __slots__. Type names,
+    node names and font families are interned, and identical paints, effects
+    and text styles are shared between nodes. Absent properties are None, and
+    the mapping methods below treat them as missing keys, so extractors and
+    generate_css work on compact and raw trees alike.
+    """
+    __slots__ = ('id', 'name', 'type', 'visible', 'characters', 'fills', 'strokes',
+                 'style', 'effects', 'cornerRadius', 'absoluteBoundingBox', 'children')
+
+    def __getitem__(self, key):
+        try:
+            value = getattr(self, key)
+        except (AttributeError, TypeError):
+            raise KeyError(key)
+        if value is None:
+            raise KeyError(key)
+        return value
+
+    def get(self, key, default=None):
+        value = getattr(self, key, None)
+        return default if value is None else value
+
+    def __contains__(self, key):
+        return getattr(self, key, None) is not None
+
+    def keys(self):
+        return [key for key in self.__slots__ if getattr(self, key) is not None]
+
+    def to_dict(self):
+        """
+        Plain dict copy of this subtree, e.g. for st.json or json.dumps.
+        """
+        converted = {} # id(compact node) -> dict
+        for node, _, parent in walk(self):
+            data = {}
+            for key in node.keys():
+                value = getattr(node, key)
+                if key == 'children':
+                    value = [] # filled in as the children are walked
+                elif key == 'absoluteBoundingBox':
+                    value = value.to_dict()
+                elif isinstance(value, tuple):
+                    value = list(value)
+                data[key] = value
+            converted[id(node)] = data
+            if parent is not None:
+                converted[id(parent)]['children'].append(data)
+        return converted[id(self)]
+
+
+class _CompactPool:
+    """
+    Shares identical paint/effect/style objects across nodes.
+    """
+
+    def __init__(self):
+        self._shared = {}
+
+    def share(self, value):
+        key = json.dumps(value, sort_keys=True)
+        shared = self._shared.get(key)
+        if shared is None:
+            shared = self._shared[key] = value
+        return shared
+
+    def paints(self, paints):
+        if not paints:
+            return None
+        return self.share_tuple(tuple(self.share(p) for p in paints))
+
+    def share_tuple(self, values):
+        key = tuple(id(v) for v in values)
+        shared = self._shared.get(key)
+        if shared is None:
+            shared = self._shared[key] = values
+        return shared
+
+    def style(self, style):
+        if not style:
+            return None
+        style = dict(style)
+        if isinstance(style.get('fontFamily'), str):
+            style['fontFamily'] = sys.intern(style['fontFamily'])
+        return self.share(style)
+
+
+def _compact_node(node, children, pool):
+    compact = CompactNode()
+    compact.id = node['id']
+    compact.name = sys.intern(node.get('name', ''))
+    compact.type = sys.intern(node['type'])
+    compact.visible = node.get('visible')
+    compact.characters = node.get('characters')
+    compact.fills = pool.paints(node.get('fills'))
+    compact.strokes = pool.paints(node.get('strokes'))
+    compact.effects = pool.paints(node.get('effects'))
+    compact.style = pool.style(node.get('style'))
+    compact.cornerRadius = node.get('cornerRadius')
+    bbox = node.get('absoluteBoundingBox')
+    compact.absoluteBoundingBox = BoundingBox(
+        bbox.get('x'), bbox.get('y'), bbox['width'], bbox['height']
+    ) if bbox else None
+    compact.children = tuple(children) if 'children' in node else None
+    return compact
+
+
+def compact_document(document):
+    """
+    Convert a raw document (or any subtree) into CompactNode objects.
+    Converted without recursion: children are built before their parent.
+    """
+    pool = _CompactPool()
+    converted = []
+    stack = [(document, False)]
+    while stack:
+        node, children_done = stack.pop()
+        if children_done:
+            count = len(node.get('children', ()))
+            children = converted[len(converted) - count:] if count else []
+            del converted[len(converted) - count:]
+            converted.append(_compact_node(node, children, pool))
+        else:
+            stack.append((node, True))
+            for child in reversed(node.get('children', ())):
+                stack.append((child, False))
+    return converted[0]
+
+
+def node_to_dict(node):
+    """
+    Plain dict for a raw or compact node.
+    """
+    return node.to_dict() if isinstance(node, CompactNode) else node
+
+
+def node_properties(node):
+    """
+    A node's own properties as a plain dict, with children replaced by
+    their count so showing a big frame doesn't dump its whole subtree.
+    """
+    data = {}
+    for key in node.keys():
+        value = node[key]
+        if key == 'children':
+            data['childCount'] = len(value)
+            continue
+        if isinstance(value, BoundingBox):
+            value = value.to_dict()
+        elif isinstance(value, tuple):
+            value = list(value)
+        data[key] = value
+    return data
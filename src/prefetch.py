@@ -0,0 +1,173 @@
+"""
+Background prefetch of renders and assets after a file loads.
+
+A Prefetcher thread does the slow network part of an export ahead of time:
+
+1. resolves the image fill URLs (get_image_fills), unless they're given
+2. downloads the image fills the document uses into the blob store, under
+   their imageRef like export_assets does
+3. requests renders for the top-level frames in chunks and stores them in
+   the blob store under export.render_ref, i.e. for the file version
+   that was loaded
+
+An export_file run against the same blob store then finds renders and
+assets locally and mostly packages bytes. Prefetch API calls go through
+RateLimiter.background(), so they only use budget that foreground calls
+don't need, and downloads use a handful of threads.
+"""
+import threading
+import time
+
+from src.cache import get_default_blob_store
+from src.export import render_ref, threaded_download_many
+from src.figma_client import chunk_ids
+from src.metrics import get_metrics
+
+DEFAULT_CHUNK_SIZE = 10
+DEFAULT_WORKERS = 4
+STAGES = ('image_fills', 'assets', 'renders')
+
+
+class Prefetcher:
+    """
+    See the module docstring. start() returns immediately; status() is
+    safe to poll from the UI thread, cancel() stops after the current chunk.
+
+    client: FigmaClient; a copy pacing calls with a background limiter is used
+    analysis: parser.DocumentAnalysis of the loaded file (an outline is
+              enough: renders are keyed by node ID)
+    version: file version the analysis was built from (data['version']);
+             probed from the API if not given
+    image_urls: imageRef -> URL map if already fetched
+    reserve: rate-limit tokens left for foreground calls (default: half)
+    """
+
+    def __init__(self, client, file_key, analysis, blob_store=None, image_urls=None, scale=1, version=None,
+                 chunk_size=DEFAULT_CHUNK_SIZE, workers=DEFAULT_WORKERS, reserve=None, download_many=None):
+        self.client = client.with_rate_limiter(client.rate_limiter.background(reserve))
+        self.file_key = file_key
+        self.analysis = analysis
+        self.version = version
+        self.blob_store = blob_store or get_default_blob_store()
+        self.image_urls = image_urls
+        self.scale = scale
+        self.chunk_size = chunk_size
+        self.download_many = download_many or (lambda urls: threaded_download_many(urls, max_workers=workers))
+        self.progress = {stage: [0, 0] for stage in STAGES} # stage -> [done, total]
+        self.stage = None
+        self.errors = []
+        self.started_at = None
+        self.finished_at = None
+        self._stop = threading.Event()
+        self._lock = threading.Lock()
+        self._thread = None
+
+    def start(self):
+        self.started_at = time.time()
+        self._thread = threading.Thread(target=self._run, name=f"prefetch-{self.file_key}", daemon=True)
+        self._thread.start()
+        return self
+
+    def cancel(self):
+        self._stop.set()
+
+    def join(self, timeout=None):
+        if self._thread is not None:
+            self._thread.join(timeout)
+
+    @property
+    def done(self):
+        return self.finished_at is not None
+
+    def status(self):
+        """
+        {'stage', 'progress': {stage: (done, total)}, 'errors', 'seconds',
+        'done', 'cancelled'}
+        """
+        with self._lock:
+            progress = {stage: tuple(counts) for stage, counts in self.progress.items()}
+            errors = list(self.errors)
+        end = self.finished_at or time.time()
+        return {'stage': self.stage, 'progress': progress, 'errors': errors,
+                'seconds': end - self.started_at if self.started_at else 0.0,
+                'done': self.done, 'cancelled': self._stop.is_set()}
+
+    def _set(self, stage, done=None, total=None):
+        with self._lock:
+            counts = self.progress[stage]
+            if total is not None:
+                counts[1] = total
+            if done is not None:
+                counts[0] = done
+
+    def _advance(self, stage, count=1):
+        with self._lock:
+            self.progress[stage][0] += count
+
+    def _error(self, message):
+        print(f"Prefetch: {message}")
+        with self._lock:
+            self.errors.append(message)
+
+    def _run(self):
+        metrics = get_metrics()
+        try:
+            for stage, step in (('image_fills', self._image_fills), ('assets', self._assets),
+                                ('renders', self._renders)):
+                if self._stop.is_set():
+                    break
+                self.stage = stage
+                with metrics.span('prefetch', stage=stage):
+                    step()
+        except Exception as e:
+            self._error(f"{self.stage} failed: {e}")
+        finally:
+            self.stage = "cancelled" if self._stop.is_set() else "done"
+            self.finished_at = time.time()
+
+    def _image_fills(self):
+        self._set('image_fills', 0, 1)
+        if self.image_urls is None:
+            fills = self.client.get_image_fills(self.file_key) or {}
+            self.image_urls = fills.get('meta', {}).get('images') or {}
+        self._set('image_fills', 1)
+
+    def _download_into_store(self, stage, urls, refs):
+        """
+        Download {key: url} a chunk at a time, storing each under refs[key].
+        """
+        keys = list(urls)
+        for chunk in chunk_ids(keys, self.chunk_size * 4):
+            if self._stop.is_set():
+                return
+            for key, data in self.download_many({key: urls[key] for key in chunk}):
+                if data is None:
+                    self._error(f"download failed for {key}")
+                else:
+                    self.blob_store.put(data, ref=refs[key])
+                self._advance(stage)
+
+    def _assets(self):
+        refs = {img['image_ref'] for img in self.analysis.images
+                if img.get('image_ref') in self.image_urls}
+        missing = {ref: self.image_urls[ref] for ref in refs if self.blob_store.lookup(ref) is None}
+        self._set('assets', len(refs) - len(missing), len(refs))
+        self._download_into_store('assets', missing, {ref: ref for ref in missing})
+
+    def _renders(self):
+        frames = self.analysis.frames
+        if self.version is None:
+            self.version = self.client.get_file_version(self.file_key)
+        refs = {f['id']: render_ref(self.file_key, self.version, f['id'], self.scale) for f in frames}
+        missing = [f['id'] for f in frames if self.blob_store.lookup(refs[f['id']]) is None]
+        self._set('renders', len(frames) - len(missing), len(frames))
+        # One render request per chunk, so the queue yields to the limiter often
+        for chunk in chunk_ids(missing, self.chunk_size):
+            if self._stop.is_set():
+                return
+            rendered = self.client.get_images(self.file_key, chunk, scale=self.scale)
+            urls = {frame_id: url for frame_id, url in rendered.get('images', {}).items() if url}
+            for frame_id, reason in rendered.get('failed', {}).items():
+                self._error(f"render failed for {frame_id}: {reason}")
+            self._advance('renders', len(chunk) - len(urls))
+            self._download_into_store('renders', urls, refs)
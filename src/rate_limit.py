@@ -0,0 +1,199 @@
+import asyncio
+import hashlib
+import json
+import os
+import tempfile
+import threading
+import time
+
+from src.metrics import get_metrics
+
+try:
+    import fcntl
+except ImportError: # Windows: pace within this process only
+    fcntl = None
+
+# Relative cost of one call per endpoint. Figma meters /files, /nodes and
+# /images renders much more heavily than the image-fill lookup.
+ENDPOINT_COSTS = {
+    'files': 5,
+    'nodes': 3,
+    'images': 5,
+    'image_fills': 1,
+}
+
+
+class RateLimiter:
+    """
+    Token bucket shared by every thread, and by every worker process on this
+    host that uses the same token, so calls are paced before Figma has to
+    answer with a 429.
+
+    Bucket state lives in a small JSON file guarded by an exclusive lock;
+    without fcntl it falls back to an in-process bucket.
+    """
+
+    def __init__(self, capacity=60, refill_rate=2.0, state_path=None, costs=None):
+        self.capacity = capacity
+        self.refill_rate = refill_rate # tokens per second
+        self.costs = dict(ENDPOINT_COSTS, **(costs or {}))
+        self.state_path = state_path if fcntl else None
+
+        self._lock = threading.Lock()
+        self._tokens = float(capacity)
+        self._updated = time.time()
+        self._waiting = 0
+        self.total_wait = 0.0
+
+    def _refill(self, tokens, updated, now):
+        return min(self.capacity, tokens + (now - updated) * self.refill_rate)
+
+    def _take(self, cost, reserve=0):
+        """
+        Try to take `cost` tokens, leaving at least `reserve` in the bucket.
+        Returns 0 on success, otherwise the number of seconds until enough
+        tokens will be available.
+        """
+        now = time.time()
+        with self._lock:
+            if self.state_path is None:
+                self._tokens = self._refill(self._tokens, self._updated, now)
+                self._updated = now
+                if self._tokens >= cost + reserve:
+                    self._tokens -= cost
+                    return 0
+                return (cost + reserve - self._tokens) / self.refill_rate
+
+            with open(self.state_path, 'a+') as f:
+                fcntl.flock(f, fcntl.LOCK_EX)
+                try:
+                    f.seek(0)
+                    try:
+                        state = json.loads(f.read() or '{}')
+                    except ValueError:
+                        state = {}
+                    tokens = self._refill(state.get('tokens', self.capacity), state.get('updated', now), now)
+                    wait = 0
+                    if tokens >= cost + reserve:
+                        tokens -= cost
+                    else:
+                        wait = (cost + reserve - tokens) / self.refill_rate
+                    f.seek(0)
+                    f.truncate()
+                    f.write(json.dumps({'tokens': tokens, 'updated': now}))
+                    f.flush()
+                    self._tokens, self._updated = tokens, now
+                    return wait
+                finally:
+                    fcntl.flock(f, fcntl.LOCK_UN)
+
+    def acquire(self, endpoint, reserve=0):
+        """
+        Block until the call to `endpoint` fits the budget.
+        reserve: tokens that must be left over afterwards, so low-priority
+                 callers wait while foreground calls still get through
+        Returns the number of seconds spent waiting.
+        """
+        cost = min(self.costs.get(endpoint, 1), self.capacity)
+        reserve = max(0, min(reserve, self.capacity - cost))
+        waited = 0.0
+        with self._lock:
+            self._waiting += 1
+        try:
+            while True:
+                wait = self._take(cost, reserve)
+                if not wait:
+                    break
+                time.sleep(wait)
+                waited += wait
+        finally:
+            with self._lock:
+                self._waiting -= 1
+                self.total_wait += waited
+            self._record_wait(endpoint, waited)
+        return waited
+
+    async def acquire_async(self, endpoint):
+        """
+        acquire() for asyncio callers: waits with asyncio.sleep instead of
+        blocking the event loop.
+        """
+        cost = min(self.costs.get(endpoint, 1), self.capacity)
+        waited = 0.0
+        with self._lock:
+            self._waiting += 1
+        try:
+            while True:
+                wait = self._take(cost)
+                if not wait:
+                    break
+                await asyncio.sleep(wait)
+                waited += wait
+        finally:
+            with self._lock:
+                self._waiting -= 1
+                self.total_wait += waited
+            self._record_wait(endpoint, waited)
+        return waited
+
+    def _record_wait(self, endpoint, waited):
+        if waited:
+            metrics = get_metrics()
+            metrics.incr('rate_limit_waits_total', endpoint=endpoint)
+            metrics.incr('rate_limit_wait_seconds_total', waited, endpoint=endpoint)
+
+    def background(self, reserve=None):
+        """
+        Low-priority view of this bucket for background work such as
+        prefetching: its calls only go out while `reserve` tokens (default
+        half the capacity) would be left for everyone else.
+        """
+        return BackgroundLimiter(self, self.capacity / 2 if reserve is None else reserve)
+
+    def status(self):
+        """
+        Current budget and queue depth, for showing why an export is waiting.
+        The budget is as of the last call made from this process.
+        """
+        with self._lock:
+            budget = self._refill(self._tokens, self._updated, time.time())
+            return {
+                'budget': round(budget, 2),
+                'capacity': self.capacity,
+                'queue_depth': self._waiting,
+                'total_wait': round(self.total_wait, 2),
+            }
+
+
+class BackgroundLimiter:
+    """
+    See RateLimiter.background. Has the acquire/status interface the
+    clients expect.
+    """
+
+    def __init__(self, limiter, reserve):
+        self.limiter = limiter
+        self.reserve = reserve
+
+    def acquire(self, endpoint):
+        return self.limiter.acquire(endpoint, reserve=self.reserve)
+
+    def status(self):
+        return self.limiter.status()
+
+
+_limiters = {}
+_limiters_lock = threading.Lock()
+
+
+def get_rate_limiter(token):
+    """
+    One limiter per token per process, backed by a per-token state file so
+    other processes on the host share the same budget.
+    """
+    token_hash = hashlib.sha256(token.encode()).hexdigest()[:16]
+    with _limiters_lock:
+        if token_hash not in _limiters:
+            state_path = os.path.join(tempfile.gettempdir(), f"figma-ratelimit-{token_hash}.json")
+            _limiters[token_hash] = RateLimiter(state_path=state_path)
+        return _limiters[token_hash]
@@ -0,0 +1,186 @@
+"""
+Prebuilt search index over a document's nodes.
+
+Built in one walk, it maps terms to posting lists of node ordinals (walk
+order, so results come back in document order):
+
+    name:<word>  text:<word>  type:<TYPE>  font:<family>  weight:<n>
+    size:<n>  fill:<#hex>
+
+Words from names and text content also go into a sorted vocabulary with a
+trigram table over it, so a query word matches any word containing it
+(prefix lookup for words shorter than three characters) without scanning
+every node. Queries are words and field:value filters, ANDed together:
+
+    TEXT Inter 600
+    type:TEXT font:inter weight:600
+    button
+"""
+import bisect
+import re
+from array import array
+
+from src.parser import rgb_to_hex, walk
+
+WORD_RE = re.compile(r"[0-9a-z]+")
+# Only the start of long text layers is indexed
+MAX_TEXT_WORDS = 32
+FIELDS = ('name', 'text', 'type', 'font', 'weight', 'size', 'fill')
+
+
+def _words(text, limit=None):
+    words = WORD_RE.findall(text.lower())
+    return words[:limit] if limit else words
+
+
+def _number(value):
+    # 600.0 and 600 should be the same term
+    if isinstance(value, float) and value.is_integer():
+        value = int(value)
+    return str(value)
+
+
+def node_terms(node):
+    """
+    Every term a node is indexed under.
+    """
+    terms = {f"type:{node['type']}"}
+    terms.update(f"name:{word}" for word in _words(node.get('name') or ""))
+    if node['type'] == 'TEXT':
+        terms.update(f"text:{word}" for word in _words(node.get('characters') or "", MAX_TEXT_WORDS))
+    style = node.get('style')
+    if style:
+        if style.get('fontFamily'):
+            terms.add(f"font:{style['fontFamily'].lower()}")
+        if style.get('fontWeight') is not None:
+            terms.add(f"weight:{_number(style['fontWeight'])}")
+        if style.get('fontSize') is not None:
+            terms.add(f"size:{_number(style['fontSize'])}")
+    for paint in node.get('fills') or ():
+        if paint['type'] == 'SOLID' and paint.get('visible', True) is not False:
+            c = paint['color']
+            terms.add(f"fill:{rgb_to_hex(c['r'], c['g'], c['b'])}")
+    return terms
+
+
+class SearchIndex:
+    """
+    See the module docstring. `ids[ordinal]` maps results back to node IDs.
+    """
+
+    def __init__(self, document=None, prune=None):
+        self.ids = []
+        self.postings = {} # term -> array of ordinals
+        self.vocabulary = [] # sorted words from names and text, plus font families
+        self.trigrams = {} # trigram -> array of vocabulary positions
+        if document is not None:
+            self._build(document, prune)
+
+    def _build(self, document, prune=None):
+        postings = {}
+        for ordinal, (node, _, _) in enumerate(walk(document, prune=prune)):
+            self.ids.append(node['id'])
+            for term in node_terms(node):
+                postings.setdefault(term, []).append(ordinal)
+        self.postings = {term: array('I', ordinals) for term, ordinals in postings.items()}
+
+        words = set()
+        for term in self.postings:
+            field, _, value = term.partition(":")
+            if field in ('name', 'text', 'font'):
+                words.add(value)
+        self.vocabulary = sorted(words)
+        trigrams = {}
+        for position, word in enumerate(self.vocabulary):
+            for i in range(len(word) - 2):
+                trigrams.setdefault(word[i:i + 3], set()).add(position)
+        self.trigrams = {gram: array('I', sorted(positions)) for gram, positions in trigrams.items()}
+
+    def __len__(self):
+        return len(self.ids)
+
+    def _prefixed(self, prefix):
+        start = bisect.bisect_left(self.vocabulary, prefix)
+        end = bisect.bisect_left(self.vocabulary, prefix + "\uffff")
+        return self.vocabulary[start:end]
+
+    def matching_words(self, fragment):
+        """
+        Vocabulary words containing `fragment` (starting with it, if it is
+        shorter than a trigram).
+        """
+        fragment = fragment.lower()
+        if len(fragment) < 3:
+            return self._prefixed(fragment)
+        grams = [fragment[i:i + 3] for i in range(len(fragment) - 2)]
+        lists = sorted((self.trigrams.get(gram, ()) for gram in grams), key=len)
+        if not lists or not lists[0]:
+            return []
+        candidates = set(lists[0])
+        for positions in lists[1:]:
+            candidates.intersection_update(positions)
+            if not candidates:
+                return []
+        return [self.vocabulary[p] for p in sorted(candidates) if fragment in self.vocabulary[p]]
+
+    def _union(self, terms):
+        result = set()
+        for term in terms:
+            result.update(self.postings.get(term, ()))
+        return result
+
+    def _word_matches(self, word):
+        """
+        Ordinals for a bare query word: names/text containing it, or an
+        exact type, font family, weight, size or fill.
+        """
+        words = self.matching_words(word)
+        terms = [f"{field}:{w}" for w in words for field in ('name', 'text', 'font')]
+        terms.append(f"type:{word.upper()}")
+        terms.extend(f"{field}:{word}" for field in ('weight', 'size'))
+        if word.startswith("#"):
+            terms.append(f"fill:{word.lower()}")
+        return self._union(terms)
+
+    def _filter_matches(self, field, value):
+        value = value.lower()
+        if field == 'type':
+            return self._union([f"type:{value.upper()}"])
+        if field in ('name', 'text'):
+            return self._union(f"{field}:{w}" for w in self.matching_words(value))
+        if field == 'font':
+            # Whole family names ("sf pro text") are in the vocabulary too
+            return self._union(f"font:{w}" for w in self._prefixed(value))
+        if field == 'fill' and not value.startswith("#"):
+            value = "#" + value
+        return self._union([f"{field}:{value}"])
+
+    def search(self, query, limit=200):
+        """
+        Returns (total matches, [node ids] of the first `limit` in
+        document order).
+        """
+        clauses = []
+        for token in re.findall(r'\w+:"[^"]*"|\S+', query.strip()):
+            field, sep, value = token.partition(":")
+            if sep and field.lower() in FIELDS and value:
+                clauses.append((field.lower(), value.strip('"')))
+            else:
+                clauses.append((None, token))
+        if not clauses:
+            return 0, []
+
+        matches = []
+        for field, value in clauses:
+            matches.append(self._filter_matches(field, value) if field else self._word_matches(value))
+            if not matches[-1]:
+                return 0, []
+        # Intersect smallest first so the running set only shrinks
+        matches.sort(key=len)
+        result = matches[0]
+        for other in matches[1:]:
+            result = result & other
+            if not result:
+                return 0, []
+        ordered = sorted(result)
+        return len(ordered), [self.ids[i] for i in ordered[:limit]]
@@ -0,0 +1,198 @@
+"""
+Incremental parsing of Figma file JSON.
+
+The response is read from the socket (or from a cached gzip entry) in small
+chunks and turned into nodes one at a time. Each node is handed to a
+DocumentAnalysis as soon as it is complete, and only the node properties the
+parser uses are kept, so the raw payload is never held in memory.
+
+This bounds memory by the pruned tree, not by a constant: with keep_tree
+(the default, and what the app uses) every node is still kept, plus one
+index entry per node. keep_tree=False keeps only the analysis results, but
+its top-level frames have no children, so it is only useful to callers that
+need colors, typography and image fills, not the inspector or CSS export.
+"""
+from src.parser import DocumentAnalysis, _is_top_level_frame
+
+try:
+    import ijson
+except ImportError: # streaming mode is unavailable, full get_file still works
+    ijson = None
+
+# Node properties the parser, CSS generator and exports actually read
+PRUNED_NODE_KEYS = frozenset([
+    'id', 'name', 'type', 'children', 'visible', 'characters',
+    'fills', 'strokes', 'style', 'effects', 'cornerRadius', 'absoluteBoundingBox',
+])
+
+# Top-level file metadata kept next to the document
+FILE_META_KEYS = frozenset([
+    'name', 'lastModified', 'version', 'thumbnailUrl', 'editorType', 'role', 'schemaVersion',
+])
+
+_SCALAR_EVENTS = frozenset(['null', 'boolean', 'integer', 'double', 'number', 'string'])
+
+
+class TeeReader:
+    """
+    File-like wrapper that copies everything read from `source` into `sink`,
+    so a response can be parsed and written to the disk cache in one pass.
+    With sink=None it only counts what was read (bytes_read).
+    """
+
+    def __init__(self, source, sink=None):
+        self.source = source
+        self.sink = sink
+        self.bytes_read = 0
+
+    def read(self, size=-1):
+        data = self.source.read(size)
+        if data:
+            self.bytes_read += len(data)
+            if self.sink is not None:
+                self.sink.write(data)
+        return data
+
+
+class _Frame:
+    __slots__ = ('kind', 'obj', 'key', 'depth', 'images', 'ordinal', 'child_ordinals')
+
+    def __init__(self, kind, obj, depth=0, ordinal=None):
+        self.kind = kind # 'root', 'node', 'children' or 'value'
+        self.obj = obj
+        self.key = None
+        self.depth = depth
+        self.images = [] # image fills in this node's subtree, document order
+        self.ordinal = ordinal # position of a node in document (pre-)order
+        self.child_ordinals = []
+
+
+def parse_file_stream(fileobj, prefix='', keep_tree=True, analysis=None):
+    """
+    Parse a Figma file response incrementally.
+
+    fileobj: binary file-like object (e.g. response.raw)
+    prefix: ijson prefix of the file response inside the stream ('' for a
+            raw API response, 'value' for a DiskCache entry)
+    keep_tree: keep the pruned document tree. When False, nodes are dropped
+               once analysed and only the analysis results (plus the
+               childless top-level frames) remain; nothing that walks
+               frame subtrees (CSS, the inspector, exports) works on that.
+
+    Returns (data, analysis) where data mirrors the get_file response with a
+    pruned 'document'.
+    """
+    if ijson is None:
+        raise ImportError("Streaming mode needs the 'ijson' package: pip install ijson")
+
+    analysis = analysis or DocumentAnalysis()
+    stack = []
+    # [node, parent id] per node in document order. Nodes only close after
+    # their children, so index entries wait here and are added in order at
+    # the end, matching a NodeIndex built by walking the full tree.
+    index_entries = []
+    result = None
+    skip_depth = 0
+    skip_next = False
+
+    def _open_node(depth):
+        ordinal = None
+        if keep_tree:
+            ordinal = len(index_entries)
+            index_entries.append(None)
+        stack.append(_Frame('node', {}, depth=depth, ordinal=ordinal))
+
+    def _attach(value):
+        parent = stack[-1]
+        if isinstance(parent.obj, list):
+            parent.obj.append(value)
+        else:
+            parent.obj[parent.key] = value
+
+    def _close_node(frame):
+        node = frame.obj
+        # Pre-order: a node's own image fills come before its descendants'
+        images = analysis.visit(node) + frame.images
+
+        if keep_tree:
+            index_entries[frame.ordinal] = [node, None]
+            # Children closed before their parent's id was necessarily known
+            for ordinal in frame.child_ordinals:
+                index_entries[ordinal][1] = node['id']
+        else:
+            node.pop('children', None)
+
+        if frame.depth == 2 and _is_top_level_frame(node):
+            analysis.frames.append(node)
+            analysis.frame_images[node['id']] = images
+        if frame.depth == 0:
+            analysis.images = images
+        elif len(stack) >= 2:
+            # stack[-1] is the parent's children array, stack[-2] the parent node
+            owner = stack[-2]
+            owner.images.extend(images)
+            if keep_tree:
+                owner.child_ordinals.append(frame.ordinal)
+
+        if keep_tree or frame.depth == 0:
+            _attach(node)
+
+    for event_prefix, event, value in ijson.parse(fileobj, use_float=True):
+        if skip_next:
+            skip_next = False
+            if event in ('start_map', 'start_array'):
+                skip_depth = 1
+            continue
+        if skip_depth:
+            if event in ('start_map', 'start_array'):
+                skip_depth += 1
+            elif event in ('end_map', 'end_array'):
+                skip_depth -= 1
+            continue
+
+        if not stack:
+            # Wait for the file response object itself
+            if event == 'start_map' and event_prefix == prefix:
+                stack.append(_Frame('root', {}))
+            continue
+
+        top = stack[-1]
+        if event == 'map_key':
+            if top.kind == 'node' and value not in PRUNED_NODE_KEYS:
+                skip_next = True
+            elif top.kind == 'root' and value != 'document' and value not in FILE_META_KEYS:
+                skip_next = True
+            else:
+                top.key = value
+        elif event == 'start_map':
+            if top.kind == 'root' and top.key == 'document':
+                _open_node(0)
+            elif top.kind == 'children':
+                _open_node(top.depth + 1)
+            else:
+                stack.append(_Frame('value', {}))
+        elif event == 'start_array':
+            if top.kind == 'node' and top.key == 'children':
+                stack.append(_Frame('children', [], depth=top.depth))
+            else:
+                stack.append(_Frame('value', []))
+        elif event in ('end_map', 'end_array'):
+            frame = stack.pop()
+            if frame.kind == 'root':
+                result = frame.obj
+                break
+            if frame.kind == 'node':
+                _close_node(frame)
+            elif frame.kind == 'children' and not keep_tree:
+                continue
+            else:
+                _attach(frame.obj)
+        elif event in _SCALAR_EVENTS:
+            _attach(value)
+
+    if result is None:
+        raise ValueError("Incomplete Figma file stream")
+    if keep_tree:
+        for node, parent_id in index_entries:
+            analysis.index.add(node, parent_id)
+    return result, analysis
@@ -0,0 +1,103 @@
+import random
+import threading
+import time
+
+import requests
+from requests.adapters import HTTPAdapter
+
+from src.metrics import get_metrics
+
+# Status codes worth retrying: rate limiting and transient server errors
+RETRY_STATUSES = {429, 500, 502, 503, 504}
+
+
+def backoff_delay(retry_after, attempt, backoff_base=1.0, backoff_max=60.0):
+    """
+    Seconds to wait before retry number `attempt`. A Retry-After header
+    value wins when the server sends one, otherwise exponential backoff
+    with full jitter.
+    """
+    if retry_after:
+        try:
+            return min(float(retry_after), backoff_max)
+        except ValueError:
+            pass
+    return random.uniform(0, min(backoff_max, backoff_base * (2 ** attempt)))
+
+
+class Transport:
+    """
+    Shared HTTP layer for the Figma API and image CDN downloads.
+    Keeps a keep-alive connection pool sized to the number of workers and
+    retries 429/5xx responses with exponential backoff and jitter.
+    """
+
+    def __init__(self, pool_size=32, max_retries=4, backoff_base=1.0,
+                 backoff_max=60.0, timeout=(5, 30)):
+        self.pool_size = pool_size
+        self.max_retries = max_retries
+        self.backoff_base = backoff_base
+        self.backoff_max = backoff_max
+        # (connect, read) timeout in seconds, applied to every request
+        self.timeout = timeout
+
+        self.session = requests.Session()
+        adapter = HTTPAdapter(pool_connections=pool_size, pool_maxsize=pool_size)
+        self.session.mount("https://", adapter)
+        self.session.mount("http://", adapter)
+
+    def _retry_delay(self, response, attempt):
+        retry_after = response.headers.get("Retry-After") if response is not None else None
+        return backoff_delay(retry_after, attempt, self.backoff_base, self.backoff_max)
+
+    def get(self, url, headers=None, timeout=None, **kwargs):
+        """
+        GET with retries. Returns the final response; raising on error
+        status is left to the caller, as with requests.get.
+        """
+        timeout = timeout or self.timeout
+        metrics = get_metrics()
+        # API calls vs. image/render downloads from the CDN
+        host = "api" if "/v1/" in url else "download"
+        attempt = 0
+        while True:
+            try:
+                with metrics.span('http_request', host=host):
+                    response = self.session.get(url, headers=headers, timeout=timeout, **kwargs)
+            except (requests.exceptions.ConnectionError, requests.exceptions.Timeout):
+                metrics.incr('http_requests_total', host=host, status="error")
+                if attempt >= self.max_retries:
+                    raise
+                delay = self._retry_delay(None, attempt)
+                metrics.incr('http_retries_total', host=host, reason="connection")
+            else:
+                metrics.incr('http_requests_total', host=host, status=response.status_code)
+                if response.status_code not in RETRY_STATUSES or attempt >= self.max_retries:
+                    if not kwargs.get('stream'):
+                        # Body is already read; streamed bodies are counted by their reader
+                        metrics.incr('http_bytes_total', len(response.content), host=host)
+                    return response
+                delay = self._retry_delay(response, attempt)
+                response.close()
+                metrics.incr('http_retries_total', host=host, reason=response.status_code)
+                print(f"Got {response.status_code} for {url}. Retrying in {delay:.1f} seconds...")
+
+            metrics.incr('http_retry_sleep_seconds_total', delay, host=host)
+            time.sleep(delay)
+            attempt += 1
+
+
+_default_transport = None
+_default_lock = threading.Lock()
+
+
+def get_transport(pool_size=32):
+    """
+    Process-wide transport so the API client and the downloaders share
+    one connection pool.
+    """
+    global _default_transport
+    with _default_lock:
+        if _default_transport is None:
+            _default_transport = Transport(pool_size=pool_size)
+        return _default_transport
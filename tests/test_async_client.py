@@ -0,0 +1,80 @@
+import asyncio
+
+import pytest
+
+from bench.mock_server import MockFigmaServer
+from bench.synthetic import DocumentSpec, build_document
+from src.async_client import AsyncFigmaClient, aiohttp
+from src.cache import DiskCache
+from src.rate_limit import RateLimiter
+
+pytestmark = pytest.mark.skipif(aiohttp is None, reason="aiohttp not installed")
+
+
+@pytest.fixture(scope="module")
+def server():
+    with MockFigmaServer(build_document(DocumentSpec(nodes=600, frames=3))) as server:
+        yield server
+
+
+def _client(server, tmp_path):
+    return AsyncFigmaClient("test", rate_limiter=RateLimiter(capacity=10 ** 6, refill_rate=10 ** 6),
+                            cache=DiskCache(str(tmp_path)), base_url=server.base_url)
+
+
+def _run(client, coro_fn):
+    async def _main():
+        try:
+            return await coro_fn()
+        finally:
+            await client.close()
+    return asyncio.run(_main())
+
+
+def test_get_file_depth_and_version_probe_cache(server, tmp_path):
+    client = _client(server, tmp_path)
+
+    async def _calls():
+        outline = await client.get_file("KEY", depth=2)
+        full = await client.get_file("KEY")
+        before = server.requests
+        again = await client.get_file("KEY") # probe is still fresh: no API call
+        return outline, full, again, server.requests - before
+
+    outline, full, again, calls = _run(client, _calls)
+    frame = outline['document']['children'][0]['children'][0]
+    assert 'children' not in frame
+    assert 'children' in full['document']['children'][0]['children'][0]
+    assert again == full
+    assert calls == 0
+
+
+def test_render_urls_are_cached(server, tmp_path):
+    client = _client(server, tmp_path)
+    ids = [f"1:{i}" for i in (1, 2)]
+
+    async def _calls():
+        first = await client.get_images("KEY", ids)
+        before = server.requests
+        second = await client.get_images("KEY", ids)
+        return first, second, server.requests - before
+
+    first, second, calls = _run(client, _calls)
+    assert first['images'] == second['images']
+    assert calls == 0
+
+
+def test_timed_out_chunk_fails_only_its_ids(server, tmp_path):
+    client = AsyncFigmaClient("test", rate_limiter=RateLimiter(capacity=10 ** 6, refill_rate=10 ** 6),
+                              base_url=server.base_url, nodes_chunk_size=1)
+    real_api_get = client._api_get
+
+    async def flaky_api_get(endpoint, url):
+        if "1%3A2" in url or "1:2" in url:
+            raise asyncio.TimeoutError()
+        return await real_api_get(endpoint, url)
+    client._api_get = flaky_api_get
+
+    result = _run(client, lambda: client.get_file_nodes("KEY", ["1:1", "1:2"]))
+    assert result['nodes']['1:1'] is not None
+    assert "1:2" in result['failed']
@@ -0,0 +1,90 @@
+import os
+import time
+
+import src.cache as cache
+from src.cache import BlobStore, DiskCache
+
+
+def _age(path, seconds):
+    stamp = time.time() - seconds
+    os.utime(path, (stamp, stamp))
+
+
+def test_disk_cache_round_trip(tmp_path):
+    disk = DiskCache(str(tmp_path))
+    disk.set('files', "abc@1", {'document': {'id': "0:0"}})
+    assert disk.get('files', "abc@1") == {'document': {'id': "0:0"}}
+    assert disk.get('files', "abc@2") is None
+    assert disk.stats() == {'hits': 1, 'misses': 1}
+
+
+def test_disk_cache_max_age(tmp_path, monkeypatch):
+    disk = DiskCache(str(tmp_path))
+    disk.set('renders', "k", {'1:2': "https://example.com/a.png"})
+    later = time.time() + 100
+    monkeypatch.setattr(cache.time, "time", lambda: later)
+    assert disk.get('renders', "k", max_age=10) is None
+    assert disk.get('renders', "k", max_age=1000) is not None
+
+
+def test_disk_cache_evicts_least_recently_used(tmp_path):
+    disk = DiskCache(str(tmp_path), max_bytes=10 ** 9)
+    payload = os.urandom(2000).hex() # doesn't compress away
+    for i in range(4):
+        disk.set('files', f"f{i}", payload)
+        _age(disk._path('files', f"f{i}"), 100 - i)
+    entry_size = os.path.getsize(disk._path('files', "f0"))
+
+    disk.get('files', "f0") # a hit makes f0 the most recently used
+    disk.max_bytes = entry_size * 3
+    disk.set('files', "f4", payload)
+
+    assert disk.get('files', "f1") is None
+    assert disk.get('files', "f0") == payload
+    assert disk.get('files', "f4") == payload
+
+
+def test_disk_cache_writes_do_not_rescan_under_budget(tmp_path, monkeypatch):
+    scans = []
+    real_walk = os.walk
+    monkeypatch.setattr(cache.os, "walk", lambda root: scans.append(root) or real_walk(root))
+    disk = DiskCache(str(tmp_path), max_bytes=10 ** 9)
+    for i in range(50):
+        disk.set('nodes', f"k@1:{i}", {'id': i})
+    # Only the first write needs to learn the size of the directory
+    assert len(scans) == 1
+
+
+def test_blob_store_dedupes_content(tmp_path):
+    store = BlobStore(str(tmp_path))
+    first = store.put(b"same bytes", ref="ref-a")
+    second = store.put(b"same bytes", ref="ref-b")
+    assert first == second
+    assert len(os.listdir(tmp_path / "blobs")) == 1
+    assert store.lookup("ref-a") == store.lookup("ref-b") == first
+    assert store.read(first) == b"same bytes"
+    assert store.lookup("unknown") is None
+
+
+def test_blob_store_evicts_least_recently_used(tmp_path):
+    store = BlobStore(str(tmp_path), max_bytes=10 ** 9)
+    digests = [store.put(bytes([i]) * 1000, ref=f"r{i}") for i in range(3)]
+    for age, digest in zip((30, 20, 10), digests):
+        stamp = time.time() - age
+        os.utime(store._blob_path(digest), (stamp, stamp))
+
+    store.lookup("r0") # a hit makes r0 the most recently used
+    store.max_bytes = 3000
+    newest = store.put(b"x" * 1000, ref="r3")
+
+    assert store.lookup("r1") is None
+    assert store.lookup("r0") == digests[0]
+    assert store.lookup("r3") == newest
+    # The ref to the evicted blob is gone too
+    assert len(os.listdir(tmp_path / "refs")) == 3
+
+
+def test_blob_store_keeps_a_blob_larger_than_the_budget(tmp_path):
+    store = BlobStore(str(tmp_path), max_bytes=100)
+    digest = store.put(b"y" * 1000, ref="big")
+    assert store.lookup("big") == digest
@@ -0,0 +1,90 @@
+import re
+
+from src import parser
+
+
+def rect(node_id, name, **props):
+    node = {'id': node_id, 'name': name, 'type': 'RECTANGLE',
+            'absoluteBoundingBox': {'x': 0, 'y': 0, 'width': 100, 'height': 40}}
+    node.update(props)
+    return node
+
+
+def solid(r, g, b, **extra):
+    paint = {'type': 'SOLID', 'color': {'r': r, 'g': g, 'b': b, 'a': 1}}
+    paint.update(extra)
+    return paint
+
+
+def frame_of(children):
+    return {'id': '0:1', 'name': 'Screen', 'type': 'FRAME', 'children': children}
+
+
+def test_fields_generate_css_ignores_do_not_split_classes():
+    base = rect('1:1', 'A', fills=[solid(1, 0, 0)])
+    variants = [
+        rect('1:2', 'B', fills=[solid(1, 0, 0)], blendMode='MULTIPLY'),
+        rect('1:3', 'C', fills=[{'type': 'IMAGE', 'imageRef': 'abc'}, solid(1, 0, 0)]),
+        rect('1:4', 'D', fills=[solid(0, 1, 0, visible=False), solid(1, 0, 0)]),
+        rect('1:5', 'E', fills=[solid(1, 0, 0)], effects=[{'type': 'LAYER_BLUR', 'radius': 4}]),
+        rect('1:6', 'F', fills=[solid(1, 0, 0)],
+             absoluteBoundingBox={'x': 500, 'y': 300, 'width': 100, 'height': 40}),
+    ]
+    for node in variants:
+        assert parser.generate_css(node) == parser.generate_css(base)
+        assert parser.css_style_key(node) == parser.css_style_key(base)
+
+
+def test_presence_of_zero_values_is_part_of_the_key():
+    without = rect('1:1', 'A', fills=[solid(1, 0, 0)])
+    zero_radius = rect('1:2', 'B', fills=[solid(1, 0, 0)], cornerRadius=0)
+    zero_opacity = rect('1:3', 'C', fills=[solid(1, 0, 0, opacity=0)])
+    keys = {parser.css_style_key(node) for node in (without, zero_radius, zero_opacity)}
+    assert len(keys) == 3
+
+    memo = parser.CSSMemo()
+    for node in (without, zero_radius, zero_opacity):
+        assert memo.lookup(node)[1] == parser.generate_css(node)
+
+
+def test_one_utility_per_distinct_declaration_block():
+    # Colors that differ below hex precision produce the same declarations
+    children = [rect(f'1:{i}', f'Box {i}', fills=[solid(0.5 + i * 1e-5, 0, 0)]) for i in range(5)]
+    children.append(rect('2:1', 'Other', fills=[solid(0, 0, 1)]))
+    memo = parser.CSSMemo()
+    css = parser.extract_css_shared(frame_of(children), memo)
+
+    # Six keys plus the frame's own, which has no declarations
+    assert memo.stats()['blocks'] == 7
+    utilities = {utility for utility, node_css in memo.blocks.values() if node_css}
+    assert len(utilities) == 2
+    assert len(re.findall(r"^\.s-[0-9a-f]{10}", css, flags=re.M)) == 2
+    for i in range(5):
+        assert f".Box_{i}" in css
+
+
+def test_shared_css_covers_every_node_of_recursive_css():
+    children = [rect(f'1:{i}', f'Layer {i % 3}', fills=[solid(i % 2, 0, 0)], cornerRadius=i % 2)
+                for i in range(12)]
+    children.append({'id': '3:1', 'name': 'Label', 'type': 'TEXT',
+                     'style': {'fontFamily': 'Inter', 'fontWeight': 400, 'fontSize': 12, 'lineHeightPx': 16}})
+    frame = frame_of(children)
+    recursive = parser.extract_css_recursive(frame)
+    shared = parser.extract_css_shared(frame)
+
+    for node in children:
+        assert f".{parser.css_class_name(node['name'])}" in recursive
+        assert f".{parser.css_class_name(node['name'])}" in shared
+    declarations = lambda css: {line.strip() for line in css.splitlines() if line.strip().endswith(';')}
+    assert declarations(shared) == declarations(recursive)
+    assert len(shared) < len(recursive)
+
+
+def test_compact_tree_gives_the_same_shared_css():
+    children = [rect(f'1:{i}', f'Layer {i}', fills=[solid(i % 3 / 2, 0, 0)]) for i in range(9)]
+    document = {'id': '0:0', 'name': 'Document', 'type': 'DOCUMENT',
+                'children': [{'id': '0:2', 'name': 'Page', 'type': 'CANVAS', 'children': [frame_of(children)]}]}
+    compact = parser.compact_document(document)
+    raw_frame = parser.get_top_level_frames(document)[0]
+    compact_frame = parser.get_top_level_frames(compact)[0]
+    assert parser.extract_css_shared(compact_frame) == parser.extract_css_shared(raw_frame)
@@ -0,0 +1,89 @@
+import copy
+
+import pytest
+
+import src.parser as parser
+from bench.synthetic import DocumentSpec, build_document
+from src.cache import DiskCache
+from src.diff import diff_cached_versions, diff_documents, diff_frame_hashes, frame_hashes, subtree_hashes
+
+
+@pytest.fixture(scope="module")
+def document():
+    return build_document(DocumentSpec(nodes=1500, frames=5, seed=3))['document']
+
+
+def _frames(document):
+    return parser.get_top_level_frames(document)
+
+
+def _leaf(frame):
+    node = frame
+    while node.get('children'):
+        node = node['children'][-1]
+    return node
+
+
+def test_hashes_are_stable_and_cover_every_node(document):
+    hashes = subtree_hashes(document)
+    assert len(hashes) == len(parser.NodeIndex.build(document))
+    assert subtree_hashes(copy.deepcopy(document)) == hashes
+
+
+def test_compact_trees_hash_like_raw_trees(document):
+    compact = parser.compact_document(document)
+    assert frame_hashes(_frames(compact)) == frame_hashes(_frames(document))
+
+
+def test_a_deep_change_only_affects_its_frame_and_ancestors(document):
+    changed = copy.deepcopy(document)
+    frame = _frames(changed)[2]
+    _leaf(frame)['name'] = "Renamed"
+
+    old, new = subtree_hashes(document), subtree_hashes(changed)
+    differing = {node_id for node_id in old if old[node_id] != new[node_id]}
+    index = parser.NodeIndex.build(changed)
+    assert differing == {node['id'] for node in index.path(_leaf(frame)['id'])}
+
+    result = diff_documents(document, changed)
+    assert result['changed'] == [frame['id']]
+    assert len(result['unchanged']) == 4
+    assert result['added'] == result['removed'] == []
+
+
+def test_only_css_properties_are_hashed(document):
+    # The hash decides CSS reuse only: edits the CSS doesn't read, including
+    # ones that change the rendered screen, leave it unchanged (export_file
+    # reuses screen images by file version instead)
+    changed = copy.deepcopy(document)
+    leaf = _leaf(_frames(changed)[0])
+    leaf['pluginData'] = {'anything': 1}
+    leaf['strokeWeight'] = 7
+    leaf['opacity'] = 0.5
+    assert diff_documents(document, changed)['changed'] == []
+
+
+def test_child_order_matters(document):
+    changed = copy.deepcopy(document)
+    frame = _frames(changed)[1]
+    frame['children'].reverse()
+    assert diff_documents(document, changed)['changed'] == [frame['id']]
+
+
+def test_added_and_removed_frames():
+    old = {'a': "1", 'b': "2", 'c': "3"}
+    new = {'a': "1", 'b': "changed", 'd': "4"}
+    assert diff_frame_hashes(old, new) == {
+        'changed': ['b'], 'added': ['d'], 'removed': ['c'], 'unchanged': ['a'],
+    }
+
+
+def test_diff_cached_versions(document, tmp_path):
+    cache = DiskCache(str(tmp_path))
+    changed = copy.deepcopy(document)
+    _leaf(_frames(changed)[4])['characters'] = "New copy"
+    cache.set('files', "KEY@1", {'document': document})
+    cache.set('files', "KEY@2", {'document': changed})
+
+    assert diff_cached_versions(cache, "KEY", "1", "2")['changed'] == [_frames(changed)[4]['id']]
+    assert diff_cached_versions(cache, "KEY", "1", "3") is None
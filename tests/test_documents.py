@@ -0,0 +1,100 @@
+import gc
+import threading
+
+import pytest
+
+from src.documents import DocumentStore
+
+
+class FakeClient:
+    def __init__(self, version="1", allowed=True):
+        self.version = version
+        self.allowed = allowed
+        self.loads = 0
+
+    def get_file_version(self, file_key):
+        if not self.allowed:
+            raise PermissionError("403 Forbidden")
+        return self.version
+
+    def get_file(self, file_key):
+        self.loads += 1
+        return {'document': {'id': '0:0', 'file': file_key}, 'version': self.version}
+
+
+def test_sessions_share_one_document_and_refcount_leases():
+    store = DocumentStore()
+    client = FakeClient()
+    first = store.acquire(client, "A")
+    second = store.acquire(client, "A")
+    assert first.data is second.data
+    assert client.loads == 1
+    assert store.stats()['leases'] == 2
+    first.release()
+    first.release() # idempotent
+    assert store.stats()['leases'] == 1
+    del second
+    gc.collect()
+    assert store.stats() == {'documents': 1, 'leases': 0, 'hits': 1, 'misses': 1, 'evictions': 0}
+
+
+def test_access_is_checked_before_serving_a_stored_document():
+    store = DocumentStore()
+    lease = store.acquire(FakeClient(), "A")
+    with pytest.raises(PermissionError):
+        store.acquire(FakeClient(allowed=False), "A")
+    assert store.stats()['leases'] == 1
+    lease.release()
+
+
+def test_new_version_is_a_separate_document():
+    store = DocumentStore()
+    old = store.acquire(FakeClient("1"), "A")
+    new = store.acquire(FakeClient("2"), "A")
+    assert old.key != new.key
+    assert old.data is not new.data
+
+
+def test_derived_values_are_built_once_per_document():
+    store = DocumentStore()
+    client = FakeClient()
+    builds = []
+
+    def build():
+        builds.append(1)
+        return {'analysis': len(builds)}
+
+    leases = [store.acquire(client, "A") for _ in range(4)]
+    results = []
+    threads = [threading.Thread(target=lambda lease=lease: results.append(lease.derived('analysis', build)))
+               for lease in leases]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    assert len(builds) == 1
+    assert all(result is results[0] for result in results)
+    # Other names are built separately
+    assert leases[0].derived('search_index', lambda: "index") == "index"
+
+
+def test_derived_values_are_dropped_with_the_document():
+    store = DocumentStore(max_idle=1)
+    client = FakeClient()
+    lease = store.acquire(client, "A")
+    lease.derived('analysis', lambda: "analysis of A")
+    lease.release()
+    with pytest.raises(ValueError):
+        lease.derived('analysis', lambda: "stale")
+
+    # Still idle in the store: reacquiring reuses the derived value
+    lease = store.acquire(client, "A")
+    assert lease.derived('analysis', lambda: "rebuilt") == "analysis of A"
+    lease.release()
+
+    # B and C push A out of the idle set; loading A again rebuilds it
+    store.acquire(client, "B").release()
+    store.acquire(client, "C").release()
+    assert store.evictions == 2
+    lease = store.acquire(client, "A")
+    assert lease.derived('analysis', lambda: "rebuilt") == "rebuilt"
@@ -0,0 +1,61 @@
+import zipfile
+
+import pytest
+
+import src.export as export
+import src.parser as parser
+from src.export import ZipExportWriter, export_file, generate_frames_css
+
+
+def deep_frame(frame_id, depth):
+    """
+    A top-level frame with a single chain of `depth` nested layers, deeper
+    than pickle can handle.
+    """
+    def layer(node_id, kind):
+        return {'id': node_id, 'name': f"Layer {node_id}", 'type': kind, 'children': [],
+                'absoluteBoundingBox': {'x': 0, 'y': 0, 'width': 10, 'height': 10},
+                'fills': [{'type': 'SOLID', 'color': {'r': 1, 'g': 0, 'b': 0, 'a': 1}}]}
+    root = current = layer(f"{frame_id}:0", 'FRAME')
+    for i in range(depth):
+        child = layer(f"{frame_id}:{i + 1}", 'GROUP')
+        current['children'].append(child)
+        current = child
+    return root
+
+
+def document_with(frames):
+    return {'id': "0:0", 'name': "Document", 'type': 'DOCUMENT',
+            'children': [{'id': "0:1", 'name': "Page 1", 'type': 'CANVAS', 'children': frames}]}
+
+
+@pytest.mark.parametrize("shared", [True, False])
+@pytest.mark.parametrize("compact", [False, True])
+def test_deep_frames_fall_back_to_in_process_generation(shared, compact):
+    frames = [deep_frame(1, 1500), deep_frame(2, 3)]
+    if compact:
+        frames = parser.get_top_level_frames(parser.compact_document(document_with(frames)))
+
+    pooled = list(generate_frames_css(frames, workers=2, shared=shared))
+    serial = list(generate_frames_css(frames, workers=1, shared=shared))
+
+    assert [frame['id'] for frame, _ in pooled] == ["1:0", "2:0"]
+    assert [css for _, css in pooled] == [css for _, css in serial]
+    # The innermost layer made it into the CSS
+    assert "Layer_1_1500" in pooled[0][1]
+
+
+def test_export_file_with_a_deep_frame(tmp_path):
+    analysis = parser.DocumentAnalysis(document_with([deep_frame(1, 1500), deep_frame(2, 3)]))
+    with ZipExportWriter(export_dir=str(tmp_path)) as writer:
+        stats = export_file(None, "KEY", analysis, writer, include_images=False, css_workers=2)
+    assert stats['css_frames'] == 2
+    with zipfile.ZipFile(writer.path) as zf:
+        assert len([n for n in zf.namelist() if n.startswith("screens/css/")]) == 2
+
+
+def test_fallback_does_not_fill_the_process_wide_memo(monkeypatch):
+    monkeypatch.setattr(export, '_worker_memo', None)
+    frames = parser.get_top_level_frames(document_with([deep_frame(1, 1500), deep_frame(2, 3)]))
+    list(generate_frames_css(frames, workers=2, shared=True))
+    assert export._worker_memo is None
@@ -0,0 +1,67 @@
+import itertools
+import zipfile
+
+import pytest
+
+import src.parser as parser
+from bench.synthetic import DocumentSpec, build_document
+from src.cache import BlobStore
+from src.export import ZipExportWriter, export_file
+
+PNG = b'\x89PNG\r\n\x1a\n'
+
+
+class FakeClient:
+    def __init__(self):
+        self.rendered = []
+
+    def get_images(self, file_key, ids, scale=1):
+        self.rendered.extend(ids)
+        return {'images': {i: f"https://cdn/{i}" for i in ids}, 'failed': {}}
+
+
+@pytest.fixture
+def analysis():
+    document = build_document(DocumentSpec(nodes=300, frames=3, seed=5))['document']
+    return parser.DocumentAnalysis(document)
+
+
+def run_export(tmp_path, analysis, version, previous=None):
+    client = FakeClient()
+    counter = itertools.count()
+
+    def download_many(urls):
+        # Every render is distinct, so copied images can be told apart
+        for frame_id in urls:
+            yield frame_id, PNG + str(next(counter)).encode()
+
+    with ZipExportWriter(export_dir=str(tmp_path)) as writer:
+        stats = export_file(client, "KEY", analysis, writer, css_workers=1, download_many=download_many,
+                            blob_store=BlobStore(str(tmp_path / f"blobs-{version}-{bool(previous)}")),
+                            previous_export=previous, version=version)
+    with zipfile.ZipFile(writer.path) as zf:
+        images = {name: zf.read(name) for name in zf.namelist() if name.startswith("screens/images/")}
+    return writer.path, client, stats, images
+
+
+def test_screens_are_copied_only_from_the_same_version(tmp_path, analysis):
+    first, client, _, images = run_export(tmp_path, analysis, "1")
+    assert len(client.rendered) == 3
+
+    _, client, stats, same = run_export(tmp_path, analysis, "1", previous=first)
+    assert client.rendered == []
+    assert same == images
+    assert stats['reused_frames'] == 3
+
+    # A new version may only differ in properties the CSS hash ignores, so
+    # its screens are rendered again while the CSS is still reused
+    _, client, stats, newer = run_export(tmp_path, analysis, "2", previous=first)
+    assert len(client.rendered) == 3
+    assert stats['css_frames'] == 0
+    assert newer.keys() == images.keys()
+
+
+def test_no_screen_reuse_without_a_version(tmp_path, analysis):
+    first, _, _, _ = run_export(tmp_path, analysis, None)
+    _, client, _, _ = run_export(tmp_path, analysis, None, previous=first)
+    assert len(client.rendered) == 3
@@ -0,0 +1,55 @@
+import os
+import threading
+import time
+import zipfile
+
+import pytest
+
+from src.export import ZipExportWriter, cleanup_exports
+
+
+def test_writer_streams_entries_to_disk(tmp_path):
+    with ZipExportWriter(export_dir=str(tmp_path)) as writer:
+        writer.writestr("colors.json", "[]")
+        writer.writestr("screens/images/a.png", b"\x89PNG" + os.urandom(100))
+        path = writer.path
+    assert writer.entries == 2
+    assert writer.bytes_written == 2 + 104
+    with zipfile.ZipFile(path) as zf:
+        infos = {info.filename: info for info in zf.infolist()}
+        assert zf.read("colors.json") == b"[]"
+    # PNGs are already compressed, so they are stored as-is
+    assert infos["screens/images/a.png"].compress_type == zipfile.ZIP_STORED
+    assert infos["colors.json"].compress_type == zipfile.ZIP_DEFLATED
+
+
+def test_writer_removes_partial_archive_on_error(tmp_path):
+    with pytest.raises(RuntimeError):
+        with ZipExportWriter(export_dir=str(tmp_path)) as writer:
+            writer.writestr("colors.json", "[]")
+            raise RuntimeError("export failed")
+    assert not os.path.exists(writer.path)
+
+
+def test_writer_is_thread_safe(tmp_path):
+    with ZipExportWriter(export_dir=str(tmp_path)) as writer:
+        threads = [threading.Thread(target=lambda i=i: [writer.writestr(f"t{i}/{j}.css", "a{}") for j in range(50)])
+                   for i in range(8)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+    with zipfile.ZipFile(writer.path) as zf:
+        assert zf.testzip() is None
+        assert len(zf.namelist()) == 400
+
+
+def test_cleanup_exports_removes_old_archives(tmp_path):
+    old, new = tmp_path / "old.zip", tmp_path / "new.zip"
+    old.write_bytes(b"")
+    new.write_bytes(b"")
+    stamp = time.time() - 7200
+    os.utime(old, (stamp, stamp))
+    cleanup_exports(str(tmp_path), max_age=3600)
+    assert not old.exists()
+    assert new.exists()
@@ -0,0 +1,133 @@
+import io
+import zipfile
+
+import pytest
+
+from src.cache import BlobStore
+from src.export import ZipExportWriter, export_assets, export_screens
+from src.images import ImageProcessor, can_encode, process_image, sniff_format, strip_metadata
+
+Image = pytest.importorskip("PIL.Image")
+
+
+def png_bytes(color):
+    out = io.BytesIO()
+    Image.new("RGB", (8, 8), color).save(out, format="PNG")
+    return out.getvalue()
+
+
+class FakeClient:
+    def __init__(self, urls):
+        self.urls = urls
+
+    def get_images(self, file_key, ids, scale=1):
+        return {'images': {i: self.urls[i] for i in ids if i in self.urls},
+                'failed': {i: "Not returned by Figma" for i in ids if i not in self.urls}}
+
+
+@pytest.mark.parametrize("workers", [1, 2])
+def test_export_screens_through_an_image_processor(tmp_path, workers):
+    frames = [{'id': f'1:{i}', 'name': f'Screen {i}'} for i in range(4)]
+    urls = {'1:0': 'u0', '1:1': 'u1', '1:2': 'u2'} # 1:3 is not rendered
+    content = {'u0': png_bytes("red"), 'u1': png_bytes("blue"), 'u2': None} # u2 download fails
+
+    def download_many(to_download):
+        for frame_id, url in to_download.items():
+            yield frame_id, content[url]
+
+    blob_store = BlobStore(str(tmp_path / "blobs"))
+    processor = ImageProcessor(blob_store, target_format="webp", workers=workers)
+    target = "webp" if processor.options['target_format'] else "png"
+    progress = []
+    with ZipExportWriter(export_dir=str(tmp_path)) as writer:
+        written, failed = export_screens(FakeClient(urls), "KEY", frames, writer,
+                                         download_many=download_many, image_processor=processor,
+                                         progress=lambda done, total: progress.append((done, total)))
+
+    assert sorted(written) == ['1:0', '1:1']
+    assert failed == {'1:2': "Download failed", '1:3': "Not returned by Figma"}
+    assert all(name.endswith("." + target) for name in written.values())
+    # The failed download counts too, so progress reaches its total
+    assert progress[-1] == (3, 3)
+    assert sorted(done for done, _ in progress) == [1, 2, 3]
+    with zipfile.ZipFile(writer.path) as zf:
+        for name in written.values():
+            assert sniff_format(zf.read(name)) == target
+    assert processor.stats() == {'hits': 0, 'misses': 2}
+
+
+def exif_bytes():
+    exif = Image.Exif()
+    exif[0x010F] = "CameraMaker" # Make
+    return exif.tobytes()
+
+
+def jpeg_with_metadata():
+    out = io.BytesIO()
+    Image.new("RGB", (32, 32), "orange").save(out, format="JPEG", quality=20, exif=exif_bytes(),
+                                              icc_profile=b"fake-profile", comment=b"a comment")
+    return out.getvalue()
+
+
+def test_strip_removes_jpeg_metadata_without_reencoding():
+    data = jpeg_with_metadata()
+    stripped = strip_metadata(data)
+    assert b"CameraMaker" not in stripped and b"a comment" not in stripped
+    # ICC profile kept, scan data copied byte for byte
+    assert b"ICC_PROFILE\x00" in stripped
+    assert stripped[stripped.index(b"\xff\xda"):] == data[data.index(b"\xff\xda"):]
+    assert Image.open(io.BytesIO(stripped)).tobytes() == Image.open(io.BytesIO(data)).tobytes()
+
+
+def test_process_image_never_falls_back_to_the_unstripped_source():
+    data = jpeg_with_metadata()
+    [(suffix, ext, main)] = process_image(data, strip=True)
+    assert (suffix, ext) == ("", "jpg")
+    assert main == strip_metadata(data) != data
+    assert process_image(data, strip=False) == [("", "jpg", data)]
+
+
+def test_strip_png_text_chunks():
+    from PIL.PngImagePlugin import PngInfo
+    info = PngInfo()
+    info.add_text("Software", "Secret Editor")
+    out = io.BytesIO()
+    Image.new("RGBA", (8, 8), "teal").save(out, format="PNG", pnginfo=info)
+    data = out.getvalue()
+    stripped = strip_metadata(data)
+    assert b"Secret Editor" not in stripped
+    assert stripped.endswith(b"IEND\xaeB`\x82")
+    assert Image.open(io.BytesIO(stripped)).tobytes() == Image.open(io.BytesIO(data)).tobytes()
+
+
+def test_strip_webp_exif():
+    if not can_encode('webp'):
+        pytest.skip("Pillow built without WebP")
+    out = io.BytesIO()
+    Image.new("RGB", (8, 8), "navy").save(out, format="WEBP", exif=exif_bytes())
+    data = out.getvalue()
+    stripped = strip_metadata(data)
+    assert b"CameraMaker" not in stripped
+    assert int.from_bytes(stripped[4:8], 'little') == len(stripped) - 8
+    vp8x = stripped.index(b"VP8X")
+    assert stripped[vp8x + 8] & 0x0C == 0 # EXIF and XMP flags cleared
+    img = Image.open(io.BytesIO(stripped))
+    assert not img.info.get('exif')
+    assert img.tobytes() == Image.open(io.BytesIO(data)).tobytes()
+
+
+def test_2x_variant_points_at_the_main_file(tmp_path):
+    data = png_bytes("green")
+    blob_store = BlobStore(str(tmp_path / "blobs"))
+    processor = ImageProcessor(blob_store, variants=True, strip=False, workers=1)
+    images = [{'id': '1:1', 'name': 'Photo', 'image_ref': 'ref1'}]
+    with ZipExportWriter(export_dir=str(tmp_path)) as writer:
+        manifest = export_assets(images, {'ref1': 'u'}, writer, blob_store,
+                                 download_many=lambda urls: ((key, data) for key in urls),
+                                 image_processor=processor)
+    asset = manifest['assets']['1:1']
+    assert asset['variants']['2x'] == asset['file']
+    assert asset['variants']['1x'] != asset['file']
+    with zipfile.ZipFile(writer.path) as zf:
+        names = [n for n in zf.namelist() if n.startswith("images/") and not n.endswith(".json")]
+    assert sorted(names) == sorted([asset['file'], asset['variants']['1x']])
@@ -0,0 +1,53 @@
+from src.lazy import LazyDocument
+
+
+def frame(frame_id, children=()):
+    return {'id': frame_id, 'name': f"Screen {frame_id}", 'type': 'FRAME', 'children': list(children)}
+
+
+class FakeClient:
+    def __init__(self):
+        self.full = {
+            '1:1': frame('1:1', [{'id': '2:1', 'name': 'Button', 'type': 'INSTANCE', 'children': []}]),
+            '1:2': frame('1:2'),
+            '2:1': {'id': '2:1', 'name': 'Button', 'type': 'INSTANCE', 'children': []},
+        }
+        self.requests = []
+
+    def get_file(self, file_key, depth=None):
+        return {'version': "1", 'document': {'id': '0:0', 'name': 'Document', 'type': 'DOCUMENT', 'children': [
+            {'id': '0:1', 'name': 'Page', 'type': 'CANVAS', 'children': [frame('1:1'), frame('1:2')]},
+        ]}}
+
+    def get_file_nodes(self, file_key, ids):
+        self.requests.append(list(ids))
+        return {'nodes': {i: {'document': self.full[i]} for i in ids if i in self.full},
+                'failed': {i: "Not returned by Figma" for i in ids if i not in self.full}}
+
+
+def test_loading_frames_splices_them_into_the_document():
+    lazy = LazyDocument(FakeClient(), "KEY")
+    assert lazy.load(['1:1']) == {}
+    page = lazy.document['children'][0]
+    assert page['children'][0]['children'][0]['id'] == '2:1'
+    assert lazy.loaded_key() == ('1:1',)
+    assert lazy.load(['1:1']) == {}
+    assert lazy.client.requests == [['1:1']]
+
+
+def test_inspecting_other_nodes_leaves_loaded_frames_alone():
+    lazy = LazyDocument(FakeClient(), "KEY")
+    assert lazy.get_node('2:1')['name'] == 'Button'
+    assert lazy.get_node('2:1')['name'] == 'Button'
+    assert lazy.loaded_key() == ()
+    assert lazy.loaded == set()
+    assert lazy.client.requests == [['2:1']]
+
+
+def test_failed_ids_are_not_requested_again():
+    lazy = LazyDocument(FakeClient(), "KEY")
+    assert lazy.get_node('9:9') is None
+    assert lazy.get_node('9:9') is None
+    assert lazy.client.requests == [['9:9']]
+    assert lazy.failed == {'9:9': "Not returned by Figma"}
+    assert lazy.loaded_key() == ()
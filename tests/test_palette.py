@@ -0,0 +1,93 @@
+import numpy as np
+import pytest
+
+from src import parser
+from src.palette import build_palette, rgb_to_lab
+
+
+def test_rgb_to_lab_reference_values():
+    lab = rgb_to_lab(np.array([[1.0, 1.0, 1.0], [0.0, 0.0, 0.0], [1.0, 0.0, 0.0], [0.0, 0.0, 1.0]]))
+    assert lab[0] == pytest.approx([100.0, 0.0, 0.0], abs=0.01)
+    assert lab[1] == pytest.approx([0.0, 0.0, 0.0], abs=0.01)
+    assert lab[2] == pytest.approx([53.24, 80.09, 67.20], abs=0.05)
+    assert lab[3] == pytest.approx([32.30, 79.19, -107.86], abs=0.05)
+
+
+def test_empty_usage():
+    assert build_palette({}) == []
+
+
+def test_near_duplicates_merge_into_the_most_used_original_color():
+    usage = {
+        (0.2, 0.4, 0.8, 1.0): 5,
+        (0.201, 0.402, 0.799, 1.0): 9, # within delta E of the first, used more
+        (0.203, 0.398, 0.801, 1.0): 1,
+        (0.9, 0.1, 0.1, 1.0): 3,
+    }
+    palette = build_palette(usage)
+    assert [entry['count'] for entry in palette] == [15, 3]
+    top = palette[0]
+    # The seed keeps its exact value instead of an average
+    assert (top['r'], top['g'], top['b']) == (0.201, 0.402, 0.799)
+    assert top['hex'] == parser.rgb_to_hex(0.201, 0.402, 0.799)
+    assert set(top['members']) == {parser.rgb_to_hex(*rgba[:3]) for rgba in list(usage)[:3]}
+    assert palette[1]['hex'] == parser.rgb_to_hex(0.9, 0.1, 0.1)
+
+
+def test_exact_8bit_duplicates_count_as_one_color():
+    palette = build_palette({(0.5, 0.5, 0.5, 1.0): 2, (0.5001, 0.5001, 0.5001, 1.0): 3}, delta_e=0)
+    assert len(palette) == 1
+    assert palette[0]['count'] == 5
+
+
+def test_alpha_tolerance_keeps_translucent_variants_apart():
+    usage = {(0, 0, 0, 1.0): 4, (0, 0, 0, 0.98): 2, (0, 0, 0, 0.5): 3}
+    palette = build_palette(usage, alpha_tolerance=0.05)
+    assert [(entry['a'], entry['count']) for entry in palette] == [(1.0, 6), (0.5, 3)]
+
+
+def test_delta_e_threshold_controls_merging():
+    usage = {(0.5, 0.5, 0.5, 1.0): 2, (0.53, 0.5, 0.5, 1.0): 1}
+    assert len(build_palette(usage, delta_e=1.0)) == 2
+    assert len(build_palette(usage, delta_e=10.0)) == 1
+
+
+def test_grid_matches_brute_force_clustering():
+    rng = np.random.default_rng(7)
+    rgba = np.round(rng.random((400, 4)), 3)
+    rgba[:, 3] = 1.0
+    usage = {tuple(color): int(count) for color, count in zip(rgba.tolist(), rng.integers(1, 50, 400))}
+    delta_e = 8.0
+
+    # Same greedy, most-used-first clustering against every color
+    colors = list(usage)
+    order = sorted(range(len(colors)), key=lambda i: -usage[colors[i]])
+    lab = rgb_to_lab(np.array([c[:3] for c in colors]))
+    unclaimed = set(range(len(colors)))
+    expected = []
+    for seed in order:
+        if seed not in unclaimed:
+            continue
+        members = [i for i in unclaimed if np.linalg.norm(lab[i] - lab[seed]) <= delta_e]
+        unclaimed -= set(members)
+        expected.append(sum(usage[colors[i]] for i in members))
+
+    palette = build_palette(usage, delta_e=delta_e)
+    assert sorted(entry['count'] for entry in palette) == sorted(expected)
+    assert sum(entry['count'] for entry in palette) == sum(usage.values())
+
+
+def test_analysis_counts_color_usage_with_opacity():
+    document = {'id': '0:0', 'name': 'Document', 'type': 'DOCUMENT', 'children': [
+        {'id': '0:1', 'name': 'Page', 'type': 'CANVAS', 'children': [
+            {'id': '1:1', 'name': 'A', 'type': 'RECTANGLE',
+             'fills': [{'type': 'SOLID', 'color': {'r': 1, 'g': 0, 'b': 0, 'a': 1}, 'opacity': 0.5}],
+             'strokes': [{'type': 'SOLID', 'color': {'r': 1, 'g': 0, 'b': 0, 'a': 1}}]},
+            {'id': '1:2', 'name': 'B', 'type': 'RECTANGLE',
+             'fills': [{'type': 'SOLID', 'visible': False, 'color': {'r': 0, 'g': 1, 'b': 0, 'a': 1}}],
+             'effects': [{'type': 'DROP_SHADOW', 'color': {'r': 1, 'g': 0, 'b': 0, 'a': 1},
+                          'offset': {'x': 0, 'y': 1}, 'radius': 2}]},
+        ]},
+    ]}
+    usage = parser.DocumentAnalysis(document).color_usage
+    assert usage == {(1, 0, 0, 0.5): 1, (1, 0, 0, 1): 2}
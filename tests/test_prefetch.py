@@ -0,0 +1,59 @@
+import pytest
+
+import src.parser as parser
+from bench.mock_server import MockFigmaServer
+from bench.synthetic import DocumentSpec, build_document
+from src.cache import BlobStore
+from src.export import ZipExportWriter, export_file, render_ref
+from src.figma_client import FigmaClient
+from src.prefetch import Prefetcher
+from src.rate_limit import RateLimiter
+
+
+@pytest.fixture
+def server():
+    data = build_document(DocumentSpec(nodes=400, frames=3))
+    data['version'] = "7"
+    with MockFigmaServer(data) as server:
+        yield server
+
+
+def client_for(server):
+    return FigmaClient("test", rate_limiter=RateLimiter(capacity=10 ** 6, refill_rate=10 ** 6),
+                       base_url=server.base_url)
+
+
+def test_export_packages_renders_prefetched_for_the_same_version(server, tmp_path):
+    client = client_for(server)
+    data = client.get_file("KEY")
+    analysis = parser.DocumentAnalysis(data['document'])
+    blob_store = BlobStore(str(tmp_path / "blobs"))
+
+    prefetcher = Prefetcher(client, "KEY", analysis, blob_store, image_urls={}, version=data['version']).start()
+    prefetcher.join(30)
+    assert prefetcher.status()['progress']['renders'] == (3, 3)
+    frame_id = analysis.frames[0]['id']
+    assert blob_store.lookup(render_ref("KEY", "7", frame_id)) is not None
+    # Neither another file nor another version of this one sees the render
+    assert blob_store.lookup(render_ref("OTHER", "7", frame_id)) is None
+    assert blob_store.lookup(render_ref("KEY", "8", frame_id)) is None
+
+    def export(version):
+        with ZipExportWriter(export_dir=str(tmp_path)) as writer:
+            return export_file(client, "KEY", analysis, writer, blob_store=blob_store, css_workers=1,
+                               version=version)
+
+    assert export("7")['screens_cached'] == 3
+    # The file changed since: everything is rendered again
+    assert export("8").get('screens_cached', 0) == 0
+    assert export(None).get('screens_cached', 0) == 0
+
+
+def test_prefetch_probes_the_version_if_not_given(server, tmp_path):
+    client = client_for(server)
+    analysis = parser.DocumentAnalysis(client.get_file("KEY")['document'])
+    blob_store = BlobStore(str(tmp_path / "blobs"))
+    prefetcher = Prefetcher(client, "KEY", analysis, blob_store, image_urls={}).start()
+    prefetcher.join(30)
+    assert prefetcher.version == "7"
+    assert all(blob_store.lookup(render_ref("KEY", "7", f['id'])) for f in analysis.frames)
@@ -0,0 +1,76 @@
+import pytest
+
+from bench.synthetic import DocumentSpec, build_document
+from src.parser import walk
+from src.search import SearchIndex, node_terms
+
+
+def text(node_id, name, characters, family="Inter", weight=400, size=14, fill=(0, 0, 0)):
+    return {'id': node_id, 'name': name, 'type': 'TEXT', 'characters': characters,
+            'style': {'fontFamily': family, 'fontWeight': weight, 'fontSize': size},
+            'fills': [{'type': 'SOLID', 'color': {'r': fill[0], 'g': fill[1], 'b': fill[2], 'a': 1}}]}
+
+
+@pytest.fixture
+def document():
+    return {'id': '0:0', 'name': 'Document', 'type': 'DOCUMENT', 'children': [
+        {'id': '0:1', 'name': 'Page', 'type': 'CANVAS', 'children': [
+            {'id': '1:1', 'name': 'Checkout Screen', 'type': 'FRAME', 'children': [
+                {'id': '2:1', 'name': 'Primary Button', 'type': 'INSTANCE', 'children': [
+                    text('3:1', 'Label', "Pay now", weight=600.0),
+                ]},
+                text('3:2', 'Title', "Shopping cart", family="SF Pro Text", size=24, fill=(1, 0, 0)),
+                {'id': '2:2', 'name': 'Secondary button', 'type': 'INSTANCE'},
+                text('3:3', 'Footnote', "Buttons are disabled offline", size=10),
+            ]},
+        ]},
+    ]}
+
+
+def test_substring_matches_through_trigrams(document):
+    index = SearchIndex(document)
+    assert index.matching_words("utto") == ["button", "buttons"]
+    assert index.search("utto") == (3, ['2:1', '2:2', '3:3'])
+    # A trigram hit must still contain the whole fragment
+    assert index.matching_words("butons") == []
+
+
+def test_short_words_match_by_prefix(document):
+    index = SearchIndex(document)
+    assert index.matching_words("ca") == ["cart"]
+    assert index.search("ca")[1] == ['3:2']
+    # "cart" contains "rt", but short fragments only match word starts
+    assert index.search("rt") == (0, [])
+
+
+def test_field_filters(document):
+    index = SearchIndex(document)
+    assert index.search("type:text")[1] == ['3:1', '3:2', '3:3']
+    assert index.search("weight:600")[1] == ['3:1']
+    assert index.search("size:24")[1] == ['3:2']
+    assert index.search("fill:ff0000")[1] == ['3:2']
+    assert index.search('font:"sf pro"')[1] == ['3:2']
+    assert index.search("text:cart")[1] == ['3:2']
+    assert index.search("name:cart") == (0, [])
+
+
+def test_clauses_are_anded(document):
+    index = SearchIndex(document)
+    assert index.search("button")[0] == 3
+    assert index.search("button type:instance")[1] == ['2:1', '2:2']
+    assert index.search("TEXT inter 600")[1] == ['3:1']
+    assert index.search("button nothing-here") == (0, [])
+
+
+def test_limit_keeps_document_order_and_total():
+    document = build_document(DocumentSpec(nodes=3000))['document']
+    index = SearchIndex(document)
+    order = [node['id'] for node, _, _ in walk(document)]
+    expected = [node['id'] for node, _, _ in walk(document) if "type:TEXT" in node_terms(node)]
+    assert len(expected) > 20
+
+    total, ids = index.search("type:TEXT", limit=20)
+    assert total == len(expected)
+    assert ids == expected[:20]
+    assert ids == sorted(ids, key=order.index)
+    assert len(index) == len(order)
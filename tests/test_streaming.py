@@ -0,0 +1,59 @@
+import io
+import json
+
+import pytest
+
+from bench.synthetic import DocumentSpec, build_document
+from src.parser import DocumentAnalysis
+from src.streaming import ijson, parse_file_stream
+
+pytestmark = pytest.mark.skipif(ijson is None, reason="ijson not installed")
+
+
+@pytest.fixture(scope="module")
+def data():
+    return build_document(DocumentSpec(nodes=3000, depth=5, frames=4, pages=2, seed=7))
+
+
+def _stream(data, **kwargs):
+    return parse_file_stream(io.BytesIO(json.dumps(data).encode("utf-8")), **kwargs)
+
+
+def test_streamed_analysis_matches_full_analysis(data):
+    full = DocumentAnalysis(data['document'])
+    _, streamed = _stream(data)
+
+    # Each hex keeps the first raw shade seen, and streaming sees children
+    # before their parents, so only the hex values have to match
+    assert streamed.colors.keys() == full.colors.keys()
+    assert streamed.color_usage == full.color_usage
+    assert sorted(map(json.dumps, streamed.text_styles)) == sorted(map(json.dumps, full.text_styles))
+    assert streamed.images == full.images
+    assert [f['id'] for f in streamed.frames] == [f['id'] for f in full.frames]
+    assert streamed.frame_images == full.frame_images
+
+
+def test_streamed_index_is_in_document_order(data):
+    full = DocumentAnalysis(data['document'])
+    _, streamed = _stream(data)
+
+    assert list(streamed.index.by_id) == list(full.index.by_id)
+    assert streamed.index.parent_of == full.index.parent_of
+    assert streamed.index.by_name == full.index.by_name
+
+
+def test_stream_without_tree_keeps_analysis_only(data):
+    full = DocumentAnalysis(data['document'])
+    result, streamed = _stream(data, keep_tree=False)
+
+    assert streamed.colors.keys() == full.colors.keys()
+    assert streamed.images == full.images
+    assert len(streamed.index) == 0
+    assert all('children' not in frame for frame in streamed.frames)
+    assert result['name'] == data['name']
+
+
+def test_incomplete_stream_raises(data):
+    raw = json.dumps(data).encode("utf-8")
+    with pytest.raises(Exception):
+        parse_file_stream(io.BytesIO(raw[:len(raw) // 2]))